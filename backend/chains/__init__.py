@@ -1,13 +1,18 @@
 # Chains package initialization 
 
+import threading
+
 from backend.chains.rag_chain import RagChain
 
 # Initialize the RAG chain as a singleton
 rag_chain = None
+_rag_chain_lock = threading.Lock()
 
 def get_rag_chain():
     """Get the RAG chain instance (singleton)."""
     global rag_chain
     if rag_chain is None:
-        rag_chain = RagChain()
+        with _rag_chain_lock:
+            if rag_chain is None:
+                rag_chain = RagChain()
     return rag_chain 
\ No newline at end of file
@@ -0,0 +1,259 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from collections.abc import Mapping
+from typing import Dict, List, Iterator, Optional, Tuple, Union
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from backend.chains.filters import filter_keys
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Chunk text, metadata and FAISS position of every indexed chunk, written next to index.faiss
+DOCSTORE_FILE = "docstore.sqlite"
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+# Let SQLite map the file so workers share its pages through the page cache
+_MMAP_SIZE = 1 << 30
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only docstore that fetches chunks from an indexed SQLite file on demand.
+
+    Replaces the pickled InMemoryDocstore: nothing is deserialized at startup
+    and only the top-k rows of each search are read, so startup time and
+    resident memory no longer grow with the corpus. The FAISS position to
+    chunk id mapping lives in the same file (see `index_to_docstore_id`),
+    and so do the FAISS positions of every category, domain and URL prefix
+    (see `filter_positions`). The file is written by `write_docstore` at
+    build time.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open the docstore.
+
+        Args:
+            path: Path of the SQLite file written by write_docstore
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+        self._filter_cache: Dict[Tuple[str, str], np.ndarray] = {}
+        self.has_filters = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'filters'"
+        ).fetchone() is not None
+
+    def search(self, search: str) -> Union[str, Document]:
+        """Return the chunk with the given id, or a message if it does not exist (like InMemoryDocstore)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM documents WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def mget(self, ids: List[str]) -> List[Optional[Document]]:
+        """Fetch many chunks with batched queries; missing ids give None."""
+        found: Dict[str, Document] = {}
+        unique = list(dict.fromkeys(ids))
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, page_content, metadata FROM documents WHERE id IN ({placeholders})", batch
+                ).fetchall()
+                for doc_id, page_content, metadata in rows:
+                    found[doc_id] = Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+        return [found.get(doc_id) for doc_id in ids]
+
+    def positions(self, ids: List[str]) -> List[Optional[int]]:
+        """Return the FAISS position of each chunk id (None for missing ids)."""
+        found: Dict[str, int] = {}
+        unique = list(dict.fromkeys(ids))
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._conn.execute(
+                    f"SELECT id, position FROM documents WHERE id IN ({placeholders})", batch
+                ).fetchall())
+        return [found.get(doc_id) for doc_id in ids]
+
+    def ids_at(self, positions: List[int]) -> List[Optional[str]]:
+        """Return the chunk id at each FAISS position (None for unknown positions)."""
+        found: Dict[int, str] = {}
+        unique = list(dict.fromkeys(int(position) for position in positions))
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._conn.execute(
+                    f"SELECT position, id FROM documents WHERE position IN ({placeholders})", batch
+                ).fetchall())
+        return [found.get(int(position)) for position in positions]
+
+    def filter_positions(self, field: str, values: List[str]) -> np.ndarray:
+        """
+        Return the sorted FAISS positions of the chunks matching any of `values`.
+
+        URL prefixes match the stored directory prefixes that start with the
+        value, so "https://docs.python.org/3/" also covers its subdirectories.
+        Sets are cached: a docstore file never changes once written.
+        """
+        sets = []
+        for value in values:
+            key = (field, value)
+            if key not in self._filter_cache:
+                with self._lock:
+                    if field == "url_prefix":
+                        escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                        rows = self._conn.execute(
+                            "SELECT positions FROM filters WHERE field = ? AND value LIKE ? ESCAPE '\\'",
+                            (field, escaped + "%")
+                        ).fetchall()
+                    else:
+                        rows = self._conn.execute(
+                            "SELECT positions FROM filters WHERE field = ? AND value = ?", (field, value)
+                        ).fetchall()
+                arrays = [np.frombuffer(row[0], dtype=np.int64) for row in rows]
+                self._filter_cache[key] = np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+            sets.append(self._filter_cache[key])
+        return np.unique(np.concatenate(sets)) if len(sets) > 1 else sets[0]
+
+    def index_to_docstore_id(self) -> "SQLiteIndexMapping":
+        """Return the FAISS position to chunk id mapping stored in the same file."""
+        return SQLiteIndexMapping(self)
+
+    def close(self) -> None:
+        """Close the underlying connection."""
+        with self._lock:
+            self._conn.close()
+
+class SQLiteIndexMapping(Mapping):
+    """
+    Read-only FAISS position -> chunk id mapping backed by a SQLiteDocstore.
+
+    Item access costs one query per position; search paths resolve all
+    their result positions at once with `mget`.
+    """
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self._docstore = docstore
+        self._length: Optional[int] = None
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._docstore._lock:
+            return self._docstore._conn.execute(sql, params).fetchall()
+
+    def __getitem__(self, position: int) -> str:
+        rows = self._query("SELECT id FROM documents WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def mget(self, positions: List[int]) -> List[Optional[str]]:
+        """Return the chunk id at each position with batched queries (None for unknown positions)."""
+        return self._docstore.ids_at(positions)
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self._length = self._query("SELECT COUNT(*) FROM documents")[0][0]
+        return self._length
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(row[0] for row in self._query("SELECT position FROM documents ORDER BY position"))
+
+def write_docstore(path: str, docstore: Docstore, index_to_docstore_id: Dict[int, str]) -> None:
+    """
+    Write every indexed chunk to a new SQLite docstore file.
+
+    The file is written next to `path` and renamed into place, so API
+    workers that have the previous file open keep reading a consistent copy.
+    The FAISS positions of each category, domain and URL prefix are stored
+    with the chunks, for pre-filtered searches.
+
+    Args:
+        path: Destination path
+        docstore: Docstore holding the chunks (e.g. the build's InMemoryDocstore)
+        index_to_docstore_id: FAISS position -> chunk id mapping
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("""
+            CREATE TABLE documents (
+                id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL UNIQUE,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+
+        conn.execute("""
+            CREATE TABLE filters (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                positions BLOB NOT NULL,
+                PRIMARY KEY (field, value)
+            )
+        """)
+        id_sets: Dict[Tuple[str, str], List[int]] = {}
+
+        def rows():
+            for position, doc_id in index_to_docstore_id.items():
+                document = docstore.search(doc_id)
+                if not isinstance(document, Document):
+                    raise ValueError(f"Could not find document for id {doc_id}")
+                for key in filter_keys(document.metadata):
+                    id_sets.setdefault(key, []).append(int(position))
+                yield doc_id, int(position), document.page_content, json.dumps(document.metadata, ensure_ascii=False)
+
+        conn.executemany(
+            "INSERT INTO documents (id, position, page_content, metadata) VALUES (?, ?, ?, ?)", rows()
+        )
+        conn.executemany(
+            "INSERT INTO filters (field, value, positions) VALUES (?, ?, ?)",
+            [(field, value, np.sort(np.array(positions, dtype=np.int64)).tobytes())
+             for (field, value), positions in id_sets.items()]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote {len(index_to_docstore_id)} chunks and {len(id_sets)} filter id sets to {path}")
+
+def read_docstore(path: str) -> Tuple[InMemoryDocstore, Dict[int, str]]:
+    """
+    Load a whole SQLite docstore into memory, for builds that modify the index.
+    Returns the docstore and the FAISS position -> chunk id mapping.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT id, position, page_content, metadata FROM documents ORDER BY position").fetchall()
+    finally:
+        conn.close()
+
+    documents = {}
+    index_to_docstore_id = {}
+    for doc_id, position, page_content, metadata in rows:
+        documents[doc_id] = Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+        index_to_docstore_id[position] = doc_id
+    return InMemoryDocstore(documents), index_to_docstore_id
@@ -0,0 +1,438 @@
+import os
+import time
+import array
+import asyncio
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, List, Dict, Optional, Tuple
+
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Get project root path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+
+# Embedding cache settings
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(project_root, "data/cache/embeddings.sqlite"))
+CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+# In-memory cache of query embeddings in front of the persistent cache (0 entries disables it)
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+# Last-use times of cache hits are written in batches: after this many hits,
+# or this many seconds since the last write, whichever comes first
+_TOUCH_BATCH = 1000
+_TOUCH_INTERVAL = 60.0
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """Return the (cached) tiktoken encoding for an embedding model, cl100k_base if unknown."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens_batch(texts: List[str], model: str) -> List[int]:
+    """Count tokens of many texts with one batched encoder call."""
+    return [len(tokens) for tokens in get_encoding(model).encode_ordinary_batch(texts)]
+
+def text_hash(text: str) -> str:
+    """Return the sha256 hex digest of a text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def normalize_query(text: str) -> str:
+    """Normalize a query for cache lookups: NFKC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper backed by a persistent, content-addressed SQLite cache.
+
+    Vectors are keyed by (model, sha256 of text), so the same text embedded by
+    the index build and at query time is only paid for once. The cache is
+    bounded to `max_entries` rows; when it grows past that the least recently
+    used rows are evicted. The row count is tracked in memory and the last
+    use of cache hits is recorded in batches, so lookups on the query path
+    do not write to SQLite.
+
+    Queries and documents share the same key space, which is correct for the
+    OpenAI embedding models where `embed_query(t) == embed_documents([t])[0]`.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        cache_path: str = CACHE_PATH,
+        max_entries: int = CACHE_MAX_ENTRIES
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            underlying: The embeddings model used on cache misses
+            model: Model name, part of the cache key
+            cache_path: Path of the SQLite cache file
+            max_entries: Maximum number of cached vectors before eviction
+        """
+        self.underlying = underlying
+        self.model = model
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Calls to the underlying model, and the tokens sent in them when the
+        # caller passed token counts (the build's batcher; queries are not tokenized)
+        self.requests = 0
+        self.miss_tokens = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # Upper bound of the rows in the file: other processes may write to it
+        # too, so it is only recounted when it passes max_entries
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._touched: Dict[str, float] = {}
+        self._touched_at = time.time()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached vectors for the given hashes and refresh their last use time."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model, *batch]
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = array.array('f', blob).tolist()
+
+            self._touched.update(dict.fromkeys(found, now))
+            if len(self._touched) >= _TOUCH_BATCH or now - self._touched_at >= _TOUCH_INTERVAL:
+                self._flush_touched()
+                self._conn.commit()
+
+        return found
+
+    def _flush_touched(self) -> None:
+        """Write the pending last-use times of cache hits (caller holds the lock and commits)."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(used, self.model, digest) for digest, used in self._touched.items()]
+            )
+            self._touched = {}
+        self._touched_at = time.time()
+
+    def flush(self) -> None:
+        """Write the pending last-use times of cache hits (at the end of a build)."""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _store(self, vectors: Dict[str, List[float]]) -> None:
+        """Write vectors to the cache and evict old rows if it is over capacity."""
+        if not vectors:
+            return
+        now = time.time()
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model, digest, array.array('f', vector).tobytes(), now) for digest, vector in vectors.items()]
+            )
+            self._count += len(vectors)
+            self._flush_touched()
+
+            if self._count > self.max_entries:
+                # Recount: other processes may have written to the file
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._count > self.max_entries:
+                # Evict down to 90% so we don't evict on every write
+                to_evict = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (to_evict,)
+                )
+                self._count -= to_evict
+                logger.info(f"Evicted {to_evict} entries from the embedding cache")
+
+            self._conn.commit()
+
+    def _partition(self, texts: List[str]):
+        """Split texts into cached vectors and the unique texts that still need embedding."""
+        hashes = [text_hash(text) for text in texts]
+        cached = self._lookup(hashes)
+
+        missing: Dict[str, str] = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+
+        self.hits += len(texts) - sum(1 for digest in hashes if digest not in cached)
+        self.misses += len(missing)
+        return hashes, cached, missing
+
+    def counters(self) -> Dict[str, int]:
+        """Running totals of cache hits and misses, and of the calls and tokens sent to the model."""
+        return {"hits": self.hits, "misses": self.misses, "requests": self.requests, "miss_tokens": self.miss_tokens}
+
+    def _count_request(
+        self,
+        hashes: List[str],
+        missing: Dict[str, str],
+        token_counts: Optional[List[int]] = None
+    ) -> None:
+        """Record a successful call of the underlying model, with the tokens of the missing texts if known."""
+        self.requests += 1
+        if token_counts is not None:
+            tokens = dict(zip(hashes, token_counts))
+            self.miss_tokens += sum(tokens[digest] for digest in missing)
+
+    def embed_documents(self, texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[float]]:
+        """
+        Embed documents, calling the underlying model only for uncached texts.
+        `token_counts` (one per text) are only used to count the tokens sent.
+        """
+        hashes, cached, missing = self._partition(texts)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            self._count_request(hashes, missing, token_counts)
+            cached.update(computed)
+
+        return [cached[digest] for digest in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, using the cache when possible."""
+        hashes, cached, missing = self._partition([text])
+
+        if missing:
+            vector = self.underlying.embed_query(text)
+            self._store({hashes[0]: vector})
+            self._count_request(hashes, missing)
+            return vector
+
+        return cached[hashes[0]]
+
+    async def aembed_documents(self, texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[float]]:
+        """Async version of embed_documents; the SQLite reads and writes run on a worker thread."""
+        hashes, cached, missing = await asyncio.to_thread(self._partition, texts)
+
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self._store, computed)
+            self._count_request(hashes, missing, token_counts)
+            cached.update(computed)
+
+        return [cached[digest] for digest in hashes]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async version of embed_query; the SQLite reads and writes run on a worker thread."""
+        hashes, cached, missing = await asyncio.to_thread(self._partition, [text])
+
+        if missing:
+            vector = await self.underlying.aembed_query(text)
+            await asyncio.to_thread(self._store, {hashes[0]: vector})
+            self._count_request(hashes, missing)
+            return vector
+
+        return cached[hashes[0]]
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    In-memory LRU cache of query embeddings with a time to live.
+
+    Sits in front of the (persistent) embedder on the query path, so a query
+    repeated within `ttl` seconds, by another student or by a second agent
+    tool, is answered without an embeddings API round trip or a SQLite read.
+    Queries are keyed by (model, normalize_query(text)), so queries that only
+    differ in case or spacing share an entry. Document embeddings are passed
+    through uncached.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        ttl: float = QUERY_CACHE_TTL
+    ):
+        """
+        Args:
+            underlying: Embedder used on cache misses
+            model: Model name, part of the cache key
+            max_entries: Queries kept before the least recently used is evicted
+            ttl: Seconds an entry is served before it is embedded again
+        """
+        self.underlying = underlying
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        """Return a fresh cached vector (a copy) and count the hit or miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def _put(self, key: Tuple[str, str], vector: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), list(vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters of this cache, and of the persistent cache behind it if there is one."""
+        with self._lock:
+            stats: Dict[str, Any] = {"entries": len(self._entries), "hits": self.hits,
+                                     "misses": self.misses, "evictions": self.evictions}
+        if isinstance(self.underlying, CachedEmbeddings):
+            stats["persistent"] = {"hits": self.underlying.hits, "misses": self.underlying.misses}
+        return stats
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, reusing a cached vector when the query was seen recently."""
+        key = (self.model, normalize_query(text))
+        vector = self._get(key)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    def _get_many(self, texts: List[str]):
+        """Cached vectors of several queries (None when missing) and the texts to embed, by key."""
+        keys = [(self.model, normalize_query(text)) for text in texts]
+        vectors = [self._get(key) for key in keys]
+        missing: Dict[Tuple[str, str], str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        return keys, vectors, missing
+
+    def _fill(self, keys, vectors, missing, computed: List[List[float]]) -> List[List[float]]:
+        """Cache the vectors computed for `missing` and complete `vectors` with them."""
+        computed_by_key = dict(zip(missing, computed))
+        for key, vector in computed_by_key.items():
+            self._put(key, vector)
+        return [vector if vector is not None else list(computed_by_key[key]) for key, vector in zip(keys, vectors)]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries; the uncached ones are embedded with one batched request."""
+        keys, vectors, missing = self._get_many(texts)
+        if not missing:
+            return vectors
+        return self._fill(keys, vectors, missing, self.underlying.embed_documents(list(missing.values())))
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Async version of embed_queries."""
+        keys, vectors, missing = self._get_many(texts)
+        if not missing:
+            return vectors
+        return self._fill(keys, vectors, missing, await self.underlying.aembed_documents(list(missing.values())))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async version of embed_query."""
+        key = (self.model, normalize_query(text))
+        vector = self._get(key)
+        if vector is None:
+            vector = await self.underlying.aembed_query(text)
+            self._put(key, vector)
+        return vector
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed several queries with one request. Uses the embedder's own
+    `embed_queries` when it has one (to go through the query cache), else
+    `embed_documents`, which gives the same vectors for the OpenAI models.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(texts)
+
+async def aembed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Async version of embed_queries."""
+    if hasattr(embeddings, "aembed_queries"):
+        return await embeddings.aembed_queries(texts)
+    return await embeddings.aembed_documents(texts)
+
+def create_embeddings(model: Optional[str] = None) -> Embeddings:
+    """
+    Create the embeddings model used by the index build and the query path.
+
+    Args:
+        model: Embedding model name (defaults to EMBEDDINGS_MODEL)
+
+    Returns:
+        OpenAIEmbeddings wrapped in the persistent cache, unless
+        EMBEDDING_CACHE_DISABLED is set
+    """
+    model = model or os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
+    embeddings = OpenAIEmbeddings(model=model)
+
+    if not CACHE_ENABLED:
+        return embeddings
+
+    try:
+        return CachedEmbeddings(embeddings, model)
+    except Exception as e:
+        logger.warning(f"Could not open embedding cache at {CACHE_PATH}, continuing without it: {e}")
+        return embeddings
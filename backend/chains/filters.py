@@ -0,0 +1,77 @@
+import os
+from urllib.parse import urlparse
+from typing import Any, Dict, List, Optional, Tuple
+
+# Categories used by the FAQ and quiz services, and the corpus domain of each
+CATEGORY_DOMAINS = {
+    "Python": "docs.python.org",
+    "FastAPI": "fastapi.tiangolo.com",
+    "Streamlit": "docs.streamlit.io",
+}
+
+# Metadata filters answered from the id sets stored in the docstore
+FILTER_FIELDS = ("category", "domain", "url_prefix")
+
+def chunk_domain(metadata: Dict[str, Any]) -> Optional[str]:
+    """Return the corpus domain of a chunk: the host of its URL, or a known domain in its source path."""
+    host = urlparse(metadata.get("url") or "").netloc
+    if host:
+        return host
+    parts = (metadata.get("source") or "").replace(os.sep, "/").split("/")
+    return next((domain for domain in CATEGORY_DOMAINS.values() if domain in parts), None)
+
+def url_prefixes(url: str) -> List[str]:
+    """Return every directory prefix of a URL, e.g. https://h/, https://h/3/, https://h/3/library/."""
+    parsed = urlparse(url)
+    if not parsed.netloc:
+        return []
+    prefix = f"{parsed.scheme}://{parsed.netloc}/"
+    prefixes = [prefix]
+    for segment in parsed.path.strip("/").split("/")[:-1]:
+        prefix += segment + "/"
+        prefixes.append(prefix)
+    if parsed.path.endswith("/") and parsed.path.strip("/"):
+        prefixes.append(f"{parsed.scheme}://{parsed.netloc}/{parsed.path.strip('/')}/")
+    return prefixes
+
+def filter_keys(metadata: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Return the (field, value) id sets a chunk belongs to."""
+    keys = []
+    domain = chunk_domain(metadata)
+    if domain:
+        keys.append(("domain", domain))
+        keys.extend(("category", category) for category, value in CATEGORY_DOMAINS.items() if value == domain)
+    keys.extend(("url_prefix", prefix) for prefix in url_prefixes(metadata.get("url") or ""))
+    return keys
+
+def is_prefilter(filter: Any) -> bool:
+    """True for metadata filters (dicts) that only use FILTER_FIELDS."""
+    return isinstance(filter, dict) and bool(filter) and all(field in FILTER_FIELDS for field in filter)
+
+def normalize_filter(filter: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Turn a filter like {"category": "fastapi", "url_prefix": [...]} into
+    lists of values per field, with categories spelled as in CATEGORY_DOMAINS.
+    Values of one field are alternatives (OR); fields are combined with AND.
+    """
+    categories = {category.lower(): category for category in CATEGORY_DOMAINS}
+    normalized = {}
+    for field, values in filter.items():
+        values = [values] if isinstance(values, str) else list(values)
+        if field == "category":
+            values = [categories.get(value.lower(), value) for value in values]
+        normalized[field] = values
+    return normalized
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, List[str]]) -> bool:
+    """Check a chunk against a normalized filter (used where no id sets exist)."""
+    keys = filter_keys(metadata)
+    for field, values in filter.items():
+        present = [value for key, value in keys if key == field]
+        if field == "url_prefix":
+            url = metadata.get("url") or ""
+            if not any(url.startswith(value) for value in values):
+                return False
+        elif not set(present) & set(values):
+            return False
+    return True
@@ -0,0 +1,405 @@
+import os
+import re
+import json
+import shutil
+import asyncio
+import logging
+from collections import Counter
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from backend.chains.embeddings import embed_queries, aembed_queries
+from backend.chains.mmr import MMR_LAMBDA, diversify
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# BM25 index written next to index.faiss by build_rag.py
+LEXICAL_DIR = "lexical"
+LEXICAL_FILES = ("offsets.npy", "postings.npy", "frequencies.npy", "lengths.npy")
+
+# "dense": vector search only, the same results as similarity_search (default),
+# "hybrid": BM25 and vector search fused with reciprocal rank fusion (opt in),
+# "lexical": BM25 only (no embeddings API call)
+RETRIEVAL_MODES = ("hybrid", "dense", "lexical")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+
+# Seconds a hybrid search waits for the query embedding and vector search
+# before answering from BM25 alone (0 waits indefinitely)
+HYBRID_DENSE_TIMEOUT = float(os.getenv("HYBRID_DENSE_TIMEOUT", "0"))
+
+# Candidates taken from each ranking per requested result before fusing
+HYBRID_FETCH_FACTOR = 4
+
+# Usual BM25 and reciprocal rank fusion constants
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# Threads running BM25 and, on the async path, FAISS searches. Bounded so a
+# burst of queries queues here instead of taking every thread of the process
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HYBRID_SEARCH_WORKERS", "8")),
+                               thread_name_prefix="hybrid-search")
+
+# Identifiers keep their dots (os.access, st.cache_data) so API names match verbatim
+_TOKEN_RE = re.compile(r"[^\W\d]\w*(?:\.[^\W\d]\w*)*|\d+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lower-cased BM25 terms. A dotted name yields itself and
+    its parts: "st.cache_data" -> ["st.cache_data", "st", "cache_data"].
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        terms.append(token)
+        if "." in token:
+            terms.extend(token.split("."))
+    return terms
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunks of a FAISS index.
+
+    Documents are identified by their FAISS position, so id sets from the
+    docstore filter BM25 results the same way they filter vector search.
+    Postings are stored per term in CSR form (offsets, positions, term
+    frequencies) as .npy files that are memory-mapped when loaded.
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray
+    ):
+        """
+        Args:
+            terms: Vocabulary; term i has postings offsets[i]:offsets[i + 1]
+            offsets: (terms + 1,) int64 start of each term's postings
+            postings: int32 positions of the chunks containing each term
+            frequencies: uint16 occurrences of the term in each of those chunks
+            lengths: (chunks,) int32 number of terms of each chunk
+        """
+        self.terms = terms
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.num_documents = len(lengths)
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "LexicalIndex":
+        """Index texts given in FAISS position order."""
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_postings.setdefault(term, []).append((position, min(count, np.iinfo(np.uint16).max)))
+
+        terms = sorted(term_postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term_postings[term]) for term in terms])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        frequencies = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            entries = np.array(term_postings[term], dtype=np.int64).reshape(-1, 2)
+            postings[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            frequencies[offsets[i]:offsets[i + 1]] = entries[:, 1]
+        return cls(terms, offsets, postings, frequencies, np.array(lengths, dtype=np.int32))
+
+    def size_mb(self) -> float:
+        """Size of the postings and lengths arrays in MB."""
+        arrays = (self.offsets, self.postings, self.frequencies, self.lengths)
+        return round(sum(array.nbytes for array in arrays) / 1e6, 2)
+
+    def save(self, index_dir: str) -> None:
+        """Write the index to <index_dir>/lexical/, replacing any previous one."""
+        path = os.path.join(index_dir, LEXICAL_DIR)
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f, ensure_ascii=False)
+        for name, array in zip(LEXICAL_FILES, (self.offsets, self.postings, self.frequencies, self.lengths)):
+            np.save(os.path.join(tmp_path, name), array)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["LexicalIndex"]:
+        """Read the BM25 index of an index directory, or None if it was built without one."""
+        path = os.path.join(index_dir, LEXICAL_DIR)
+        if not os.path.exists(os.path.join(path, "terms.json")):
+            return None
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            terms = json.load(f)
+        arrays = [np.load(os.path.join(path, name), mmap_mode="r") for name in LEXICAL_FILES]
+        return cls(terms, *arrays)
+
+    def search(self, query: str, k: int, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the k best BM25 matches of a query.
+
+        Args:
+            query: Query text
+            k: Number of results
+            positions: Only consider these FAISS positions (a filter's id set)
+
+        Returns:
+            (scores, positions) of the matches, best first; chunks sharing no
+            term with the query are not returned
+        """
+        scores = np.zeros(self.num_documents, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            documents = np.asarray(self.postings[start:end])
+            frequencies = np.asarray(self.frequencies[start:end], dtype=np.float32)
+            idf = np.log(1 + (self.num_documents - (end - start) + 0.5) / ((end - start) + 0.5))
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[documents] / self.average_length)
+            # A term has one posting per chunk, so the indices are unique
+            scores[documents] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norms)
+
+        if positions is not None:
+            allowed = np.zeros(self.num_documents, dtype=bool)
+            allowed[positions] = True
+            scores[~allowed] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        best = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return scores[best], best
+
+def document_key(document: Document) -> Any:
+    """Identity of a chunk across rankings: its docstore id, or its URL and content."""
+    return document.id or (document.metadata.get("url"), document.page_content)
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """
+    Fuse ranked lists: each chunk scores the sum of 1 / (k + rank) over the
+    lists it appears in (rank starting at 1). Returns chunks best first.
+    """
+    scores: Dict[Any, float] = {}
+    documents: Dict[Any, Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, 1):
+            key = document_key(document)
+            documents.setdefault(key, document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return [(documents[key], score) for key, score in sorted(scores.items(), key=lambda item: -item[1])]
+
+def batch_search_with_score(
+    vectorstore: Any,
+    queries: List[str],
+    k: int = 4,
+    filter: Optional[Any] = None,
+    mode: Optional[str] = None,
+    fetch_k: Optional[int] = None,
+    dedup: bool = True,
+    candidates: Optional[int] = None,
+    lambda_mult: float = MMR_LAMBDA,
+    **kwargs: Any
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Retrieve chunks for several queries with BM25, vector search or both,
+    fused by rank.
+
+    All queries are embedded with one batched request and searched with one
+    FAISS search over the query matrix. In hybrid mode the BM25 searches run
+    on a worker thread meanwhile, and each query's two rankings are fused with
+    reciprocal rank fusion. If the embedding fails, or takes longer than
+    HYBRID_DENSE_TIMEOUT, the BM25 rankings are used alone. With `dedup`, a
+    chunk is only returned for the first query that finds it, and the later
+    queries get their next best chunks instead. With `candidates`, each
+    query's k results are picked by maximal marginal relevance out of its
+    `candidates` best fused chunks, so they cover the topic instead of
+    repeating its best match (see mmr.diversify).
+
+    Args:
+        vectorstore: Store with `embeddings`, `similarity_search_with_score_by_vectors`
+            and `lexical_search_with_score` (PrefilteredFAISS, ShardedVectorStore)
+        queries: Query texts
+        k: Number of results per query
+        filter: Metadata filter applied to both searches
+        mode: One of RETRIEVAL_MODES (default: RETRIEVAL_MODE)
+        fetch_k: Candidates taken from each search per query (default: enough
+            for k results per query after fusion and dedup)
+        dedup: Drop chunks already returned for an earlier query
+        candidates: Fused chunks per query to pick k diverse results from
+            (default: no diversification)
+        lambda_mult: MMR weight of relevance against novelty
+        **kwargs: Passed to both searches (e.g. `shards`)
+
+    Returns:
+        Per query, up to k (document, fused score) pairs, best first
+    """
+    if not queries:
+        return []
+    mode, fetch_k = _plan(vectorstore, len(queries), k, mode, fetch_k, dedup, candidates)
+
+    def dense() -> Tuple[List[List[float]], List[List[Document]]]:
+        embeddings = embed_queries(vectorstore.embeddings, queries)
+        return embeddings, _dense_rankings(vectorstore, embeddings, fetch_k, filter, **kwargs)
+
+    def lexical() -> List[List[Document]]:
+        return _lexical_rankings(vectorstore, queries, fetch_k, filter, **kwargs)
+
+    query_vectors = None
+    if mode == "dense":
+        query_vectors, ranking = dense()
+        rankings = [ranking]
+    elif mode == "lexical":
+        rankings = [lexical()]
+    else:
+        lexical_future = _executor.submit(lexical)
+        rankings = []
+        try:
+            if HYBRID_DENSE_TIMEOUT > 0:
+                query_vectors, ranking = _executor.submit(dense).result(timeout=HYBRID_DENSE_TIMEOUT)
+            else:
+                query_vectors, ranking = dense()
+            rankings.append(ranking)
+        except FutureTimeoutError:
+            logger.warning(f"Vector search took over {HYBRID_DENSE_TIMEOUT}s, answering from BM25 only")
+        except Exception as e:
+            logger.warning(f"Vector search failed ({e}), answering from BM25 only")
+        rankings.append(lexical_future.result())
+    return _fuse(vectorstore, rankings, len(queries), k, dedup, candidates, lambda_mult, query_vectors)
+
+async def abatch_search_with_score(
+    vectorstore: Any,
+    queries: List[str],
+    k: int = 4,
+    filter: Optional[Any] = None,
+    mode: Optional[str] = None,
+    fetch_k: Optional[int] = None,
+    dedup: bool = True,
+    candidates: Optional[int] = None,
+    lambda_mult: float = MMR_LAMBDA,
+    **kwargs: Any
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Async version of batch_search_with_score that never blocks the event loop.
+
+    The queries are embedded with the embedder's async API, and the FAISS
+    search, docstore reads and BM25 searches run on the bounded thread pool
+    of this module, so other requests keep being served meanwhile.
+    """
+    if not queries:
+        return []
+    mode, fetch_k = _plan(vectorstore, len(queries), k, mode, fetch_k, dedup, candidates)
+    loop = asyncio.get_running_loop()
+
+    async def dense() -> Tuple[List[List[float]], List[List[Document]]]:
+        embeddings = await aembed_queries(vectorstore.embeddings, queries)
+        return embeddings, await loop.run_in_executor(
+            _executor, partial(_dense_rankings, vectorstore, embeddings, fetch_k, filter, **kwargs))
+
+    def lexical() -> "asyncio.Future[List[List[Document]]]":
+        return loop.run_in_executor(_executor, partial(_lexical_rankings, vectorstore, queries, fetch_k, filter, **kwargs))
+
+    query_vectors = None
+    if mode == "dense":
+        query_vectors, ranking = await dense()
+        rankings = [ranking]
+    elif mode == "lexical":
+        rankings = [await lexical()]
+    else:
+        lexical_future = lexical()
+        rankings = []
+        try:
+            if HYBRID_DENSE_TIMEOUT > 0:
+                query_vectors, ranking = await asyncio.wait_for(dense(), HYBRID_DENSE_TIMEOUT)
+            else:
+                query_vectors, ranking = await dense()
+            rankings.append(ranking)
+        except asyncio.TimeoutError:
+            logger.warning(f"Vector search took over {HYBRID_DENSE_TIMEOUT}s, answering from BM25 only")
+        except Exception as e:
+            logger.warning(f"Vector search failed ({e}), answering from BM25 only")
+        rankings.append(await lexical_future)
+    fuse = partial(_fuse, vectorstore, rankings, len(queries), k, dedup, candidates, lambda_mult, query_vectors)
+    # Diversifying reads the candidates' vectors, which is blocking I/O
+    return await loop.run_in_executor(_executor, fuse) if candidates else fuse()
+
+def _plan(vectorstore: Any, num_queries: int, k: int, mode: Optional[str], fetch_k: Optional[int], dedup: bool,
+          candidates: Optional[int] = None) -> Tuple[str, int]:
+    """Resolve the retrieval mode and the candidates to take from each search."""
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+    if mode != "dense" and not vectorstore.has_lexical_index():
+        # Index built before BM25 was added
+        mode = "dense"
+    # Earlier queries can take up to k results each from a later one
+    depth = max(k, candidates or 0) + (k * (num_queries - 1) if dedup else 0)
+    return mode, fetch_k or (depth * HYBRID_FETCH_FACTOR if mode == "hybrid" else depth)
+
+def _dense_rankings(vectorstore: Any, embeddings: List[List[float]], fetch_k: int, filter: Any, **kwargs: Any) -> List[List[Document]]:
+    results = vectorstore.similarity_search_with_score_by_vectors(embeddings, k=fetch_k, filter=filter, **kwargs)
+    return [[document for document, _ in pairs] for pairs in results]
+
+def _lexical_rankings(vectorstore: Any, queries: List[str], fetch_k: int, filter: Any, **kwargs: Any) -> List[List[Document]]:
+    return [[document for document, _ in vectorstore.lexical_search_with_score(query, fetch_k, filter, **kwargs)]
+            for query in queries]
+
+def _fuse(vectorstore: Any, rankings: List[List[List[Document]]], num_queries: int, k: int, dedup: bool,
+          candidates: Optional[int], lambda_mult: float,
+          query_vectors: Optional[List[List[float]]] = None) -> List[List[Tuple[Document, float]]]:
+    """
+    Fuse each query's rankings, drop chunks an earlier query already returned
+    and diversify (by similarity to the query vectors, when the queries were embedded).
+    """
+    results = []
+    seen = set()
+    for row in range(num_queries):
+        fused = reciprocal_rank_fusion([ranking[row] for ranking in rankings])
+        if dedup:
+            fused = [(document, score) for document, score in fused if document_key(document) not in seen]
+        if candidates:
+            query_vector = query_vectors[row] if query_vectors is not None else None
+            fused = diversify(vectorstore, fused[:candidates], k, lambda_mult, query_vector)
+        else:
+            fused = fused[:k]
+        results.append(fused)
+        seen.update(document_key(document) for document, _ in fused)
+    return results
+
+def hybrid_search_with_score(vectorstore: Any, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+    """Retrieve chunks for one query; see batch_search_with_score."""
+    return batch_search_with_score(vectorstore, [query], k, dedup=False, **kwargs)[0]
+
+async def ahybrid_search_with_score(vectorstore: Any, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+    """Async version of hybrid_search_with_score; see abatch_search_with_score."""
+    return (await abatch_search_with_score(vectorstore, [query], k, dedup=False, **kwargs))[0]
+
+class HybridRetriever(BaseRetriever):
+    """LangChain retriever over `hybrid_search_with_score` of a vector store."""
+
+    vectorstore: Any
+    k: int = 4
+    filter: Optional[Dict[str, Any]] = None
+    mode: Optional[str] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [document for document, _ in hybrid_search_with_score(
+            self.vectorstore, query, k=self.k, filter=self.filter, mode=self.mode)]
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return [document for document, _ in await ahybrid_search_with_score(
+            self.vectorstore, query, k=self.k, filter=self.filter, mode=self.mode)]
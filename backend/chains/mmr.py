@@ -0,0 +1,107 @@
+import os
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Weight of relevance against novelty: 1 ranks by relevance only, 0 by novelty only
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+
+# Candidates diversified per requested result, for callers asking for diverse context
+MMR_CANDIDATE_FACTOR = int(os.getenv("MMR_CANDIDATE_FACTOR", "5"))
+
+def unit_vectors(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a matrix, so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def maximal_marginal_relevance(
+    relevance: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = MMR_LAMBDA
+) -> List[int]:
+    """
+    Pick k candidates by maximal marginal relevance.
+
+    Each step takes the candidate maximizing
+    `lambda_mult * relevance - (1 - lambda_mult) * max similarity to the picked ones`.
+    The running maximum is updated with one matrix-vector product per pick,
+    so selecting k of n candidates of dimension d costs O(k * n * d) in
+    NumPy and no pairwise Python loop.
+
+    Args:
+        relevance: (n,) relevance of each candidate to the query, higher is better
+        vectors: (n, d) candidate vectors, compared by cosine similarity
+        k: Number of candidates to pick
+        lambda_mult: Weight of relevance against novelty, between 0 and 1
+
+    Returns:
+        Positions of the picked candidates, in the order they were picked
+    """
+    count = min(k, len(relevance))
+    if count <= 0:
+        return []
+    unit = unit_vectors(vectors)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    gain = lambda_mult * relevance
+    # The first pick is the most relevant candidate, whatever the weight
+    best = int(np.argmax(relevance))
+    selected = [best]
+    redundancy = unit @ unit[best]
+    available = np.ones(len(unit), dtype=bool)
+    available[best] = False
+    for _ in range(count - 1):
+        scores = np.where(available, gain - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, unit @ unit[best], out=redundancy)
+    return selected
+
+def query_relevance(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each candidate vector to the query vector."""
+    return unit_vectors(vectors) @ unit_vectors(query)
+
+def diversify(
+    vectorstore: Any,
+    results: List[Tuple[Document, float]],
+    k: int,
+    lambda_mult: float = MMR_LAMBDA,
+    query_vector: Optional[List[float]] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Pick k diverse results out of a ranked candidate list.
+
+    Relevance is the cosine similarity of each candidate's indexed vector
+    to `query_vector`, and redundancy the cosine similarity between the
+    candidates' vectors, all read from the store with `document_vectors`.
+    Candidates come best first (e.g. by fused hybrid score), so that order
+    only breaks ties. Without a query vector (lexical-only searches, which
+    do not embed the query) the scores, rescaled to [0, 1], are the
+    relevance instead. If the store cannot provide the vectors, the k best
+    candidates are returned as they are.
+
+    Args:
+        vectorstore: Store with `document_vectors` (PrefilteredFAISS, ShardedVectorStore)
+        results: (document, score) candidates, best first
+        k: Number of results to keep
+        lambda_mult: Weight of relevance against novelty
+        query_vector: Embedding of the query, as searched in the store
+
+    Returns:
+        Up to k (document, score) pairs, in the order MMR picked them
+    """
+    if len(results) <= k:
+        return results
+    vectors: Optional[np.ndarray] = vectorstore.document_vectors([document for document, _ in results])
+    if vectors is None:
+        return results[:k]
+    if query_vector is not None:
+        relevance = query_relevance(np.asarray(query_vector, dtype=np.float32), vectors)
+    else:
+        scores = np.array([score for _, score in results], dtype=np.float32)
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+    return [results[i] for i in maximal_marginal_relevance(relevance, vectors, k, lambda_mult)]
@@ -0,0 +1,173 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Projection fitted at build time, written next to index.faiss
+PROJECTION_FILE = "projection.npz"
+
+# "truncate" keeps the first dimensions, which for the text-embedding-3 models
+# is what the API's `dimensions` parameter does; "pca" fits a projection
+REDUCTIONS = ("none", "truncate", "pca")
+
+# Vectors used to fit the PCA projection
+PCA_SAMPLE_SIZE = 50000
+
+class Projection:
+    """
+    Linear map from full-size embeddings to the reduced vectors an index holds.
+
+    Projected vectors are L2-normalized again, like the embeddings they come
+    from, so distances keep the same scale as at full size.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        dimensions: int,
+        mean: Optional[np.ndarray] = None,
+        components: Optional[np.ndarray] = None,
+        explained_variance: Optional[float] = None
+    ):
+        """
+        Args:
+            method: "truncate" or "pca"
+            dimensions: Size of the projected vectors
+            mean: PCA centre (pca only)
+            components: (source dimensions, dimensions) PCA basis (pca only)
+            explained_variance: Share of the corpus variance the PCA basis keeps
+        """
+        if method not in REDUCTIONS[1:]:
+            raise ValueError(f"Unknown reduction '{method}', expected one of {REDUCTIONS[1:]}")
+        self.method = method
+        self.dimensions = dimensions
+        self.mean = mean
+        self.components = components
+        self.explained_variance = explained_variance
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, method: str, dimensions: int) -> "Projection":
+        """
+        Create the projection for a corpus.
+
+        Args:
+            vectors: (n, d) full-size corpus vectors
+            method: "truncate" or "pca"
+            dimensions: Target size, smaller than d
+
+        Returns:
+            The fitted projection
+        """
+        source_dimensions = vectors.shape[1]
+        if not 0 < dimensions < source_dimensions:
+            raise ValueError(f"Reduced dimension must be between 1 and {source_dimensions - 1}, got {dimensions}")
+        if method != "pca":
+            return cls(method, dimensions)
+
+        rng = np.random.default_rng(0)
+        sample = vectors
+        if len(vectors) > PCA_SAMPLE_SIZE:
+            sample = vectors[rng.choice(len(vectors), size=PCA_SAMPLE_SIZE, replace=False)]
+        sample = np.asarray(sample, dtype=np.float64)
+        mean = sample.mean(axis=0)
+        centered = sample - mean
+        # Eigenvectors of the (d, d) covariance: cheaper than an SVD of the sample
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered / max(1, len(sample) - 1))
+        order = np.argsort(eigenvalues)[::-1][:dimensions]
+        total = eigenvalues.sum()
+        return cls(
+            method,
+            dimensions,
+            mean.astype(np.float32),
+            np.ascontiguousarray(eigenvectors[:, order], dtype=np.float32),
+            float(eigenvalues[order].sum() / total) if total > 0 else 1.0
+        )
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        """Project (n, d) vectors to (n, dimensions) unit vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == "truncate":
+            reduced = vectors[:, :self.dimensions]
+        else:
+            reduced = (vectors - self.mean) @ self.components
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        return np.ascontiguousarray(reduced / np.maximum(norms, 1e-12), dtype=np.float32)
+
+    def describe(self) -> Dict[str, Any]:
+        """Parameters saved with the index (see index_params.json)."""
+        description: Dict[str, Any] = {"reduction": self.method, "dimensions": self.dimensions}
+        if self.explained_variance is not None:
+            description["explained_variance"] = round(self.explained_variance, 4)
+        return description
+
+    def save(self, index_dir: str) -> None:
+        """Write the projection to projection.npz in an index directory."""
+        arrays = {"method": np.array(self.method), "dimensions": np.array(self.dimensions)}
+        if self.method == "pca":
+            arrays.update(mean=self.mean, components=self.components)
+        path = os.path.join(index_dir, PROJECTION_FILE)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["Projection"]:
+        """Read the projection of an index directory, or None if it stores full-size vectors."""
+        path = os.path.join(index_dir, PROJECTION_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(
+                str(data["method"]),
+                int(data["dimensions"]),
+                data["mean"] if "mean" in data else None,
+                data["components"] if "components" in data else None
+            )
+
+class ProjectedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that projects every vector to the dimension of an index.
+
+    Attached to a vector store when it is loaded, so queries are reduced the
+    same way the indexed chunks were. The underlying (cached) embedder still
+    produces full-size vectors, so the embedding cache is shared by indexes
+    of any dimension.
+    """
+
+    def __init__(self, underlying: Embeddings, projection: Projection):
+        self.underlying = underlying
+        self.projection = projection
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed and project documents."""
+        return self.projection.apply(self.underlying.embed_documents(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed and project a query."""
+        return self.projection.apply([self.underlying.embed_query(text)])[0].tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries with one request (see embeddings.embed_queries) and project them."""
+        if hasattr(self.underlying, "embed_queries"):
+            return self.projection.apply(self.underlying.embed_queries(texts)).tolist()
+        return self.embed_documents(texts)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Async version of embed_queries."""
+        if hasattr(self.underlying, "aembed_queries"):
+            return self.projection.apply(await self.underlying.aembed_queries(texts)).tolist()
+        return await self.aembed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Async version of embed_documents."""
+        return self.projection.apply(await self.underlying.aembed_documents(texts)).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async version of embed_query."""
+        return self.projection.apply([await self.underlying.aembed_query(text)])[0].tolist()
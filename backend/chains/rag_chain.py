@@ -3,13 +3,16 @@ import sys
 import logging
 from typing import Dict, Any, List, Optional
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from langchain.chains import RetrievalQA
 from langchain.prompts import ChatPromptTemplate
 from langchain.callbacks.base import BaseCallbackHandler
 
+from backend.chains.registry import get_vectorstore
+from backend.chains.lexical import HybridRetriever
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -58,17 +61,8 @@ class RagChain:
         logger.info(f"Using embedding model: {embeddings_model}")
         
         try:
-            # Initialize embeddings model
-            embeddings = OpenAIEmbeddings(
-                model=embeddings_model
-            )
-            
-            # Load the vector store
-            vectorstore = FAISS.load_local(
-                INDEX_DIR,
-                embeddings,
-                allow_dangerous_deserialization=True  # Allow deserialization as this is a local file we created
-            )
+            # Shared with RagAgentTools through the registry: loaded once per process
+            vectorstore = get_vectorstore(INDEX_DIR, embeddings_model)
             
             logger.info("Index loaded successfully!")
             return vectorstore
@@ -107,10 +101,7 @@ Resposta:"""
             qa_chain = RetrievalQA.from_chain_type(
                 llm=llm,
                 chain_type="stuff",
-                retriever=self.vectorstore.as_retriever(
-                    search_type="similarity",
-                    search_kwargs={"k": 5}
-                ),
+                retriever=HybridRetriever(vectorstore=self.vectorstore, k=5),
                 return_source_documents=True,
                 chain_type_kwargs={"prompt": prompt}
             )
@@ -159,12 +150,16 @@ Resposta:"""
             logger.error(f"Error answering question: {e}")
             raise
     
-    def get_relevant_context(self, question: str, max_docs: int = 3) -> List[Dict[str, str]]:
+    def get_relevant_context(self, question: str, max_docs: int = 3, category: Optional[str] = None,
+                             candidates: Optional[int] = None) -> List[Dict[str, str]]:
         """Recupera o contexto relevante para uma pergunta.
         
         Args:
             question: Pergunta ou tema
             max_docs: Número máximo de documentos a retornar
+            category: Restringe a busca a uma categoria (Python, FastAPI, Streamlit)
+            candidates: Escolhe os max_docs documentos mais diversos (MMR) entre
+                esse número de candidatos, em vez dos max_docs mais próximos
             
         Returns:
             Lista de documentos relevantes com conteúdo e fonte
@@ -172,7 +167,9 @@ Resposta:"""
         logger.info(f"Getting context for: {question}")
         
         try:
-            docs = self.vectorstore.similarity_search(question, k=max_docs)
+            # The category filter is applied inside the BM25 and FAISS searches
+            search_filter = {"category": category} if category else None
+            docs = self.vectorstore.hybrid_search(question, k=max_docs, filter=search_filter, candidates=candidates)
             
             context = []
             for doc in docs:
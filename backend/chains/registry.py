@@ -0,0 +1,405 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from backend.chains.embeddings import create_embeddings, QueryEmbeddingCache, QUERY_CACHE_MAX_ENTRIES
+from backend.chains.sharding import ShardedVectorStore
+from backend.chains.vector_index import (
+    load_vectorstore, resolve_index_dir, current_version, warm_up, list_shards, shard_root,
+    prefault_index, run_canaries
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the CURRENT pointer for a new index version (0 disables).
+# On by default: an admin reload only reaches one worker, and the others would
+# keep serving a version that prune_versions deletes after a few builds
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "30"))
+
+# Queries run through embedding and search before an index version takes
+# traffic ("|"-separated); their embeddings are cached after the first run
+CANARY_QUERIES = [query.strip() for query in os.getenv(
+    "INDEX_CANARY_QUERIES",
+    "Como criar uma rota GET no FastAPI?|How do list comprehensions work in Python?|Como usar st.cache_data no Streamlit?"
+).split("|") if query.strip()]
+
+class SwappableVectorStore(VectorStore):
+    """
+    Read-only vector store that forwards every call to the currently loaded
+    index version.
+
+    Callers keep this object (e.g. inside a retriever) while the registry
+    swaps the version underneath. Each call binds to the version that is
+    current when it starts, so in-flight queries finish on the old index
+    and the next ones use the new one.
+    """
+
+    def __init__(self, vectorstore: FAISS, version: Optional[str]):
+        self.current = vectorstore
+        self.version = version
+
+    def swap(self, vectorstore: FAISS, version: Optional[str]) -> None:
+        """Atomically make `vectorstore` the version used by new calls."""
+        self.current = vectorstore
+        self.version = version
+
+    def __getattr__(self, name: str) -> Any:
+        # index, docstore, index_to_docstore_id, ... of the current version
+        if name == "current":
+            raise AttributeError(name)
+        return getattr(self.current, name)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.current.embeddings
+
+    def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+        raise NotImplementedError("Served indexes are read-only; rebuild them with build_rag.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Build indexes with build_rag.py")
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return self.current.similarity_search(query, k=k, **kwargs)
+
+    def similarity_search_with_score(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return self.current.similarity_search_with_score(*args, **kwargs)
+
+    def similarity_search_by_vector(self, *args, **kwargs) -> List[Document]:
+        return self.current.similarity_search_by_vector(*args, **kwargs)
+
+    def similarity_search_with_score_by_vector(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return self.current.similarity_search_with_score_by_vector(*args, **kwargs)
+
+    def similarity_search_with_relevance_scores(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return self.current.similarity_search_with_relevance_scores(*args, **kwargs)
+
+    def max_marginal_relevance_search(self, *args, **kwargs) -> List[Document]:
+        return self.current.max_marginal_relevance_search(*args, **kwargs)
+
+    def max_marginal_relevance_search_by_vector(self, *args, **kwargs) -> List[Document]:
+        return self.current.max_marginal_relevance_search_by_vector(*args, **kwargs)
+
+    def get_by_ids(self, ids) -> List[Document]:
+        return self.current.get_by_ids(ids)
+
+    def document_vectors(self, *args, **kwargs) -> Optional[np.ndarray]:
+        return self.current.document_vectors(*args, **kwargs)
+
+    def has_lexical_index(self) -> bool:
+        return self.current.has_lexical_index()
+
+    def lexical_search_with_score(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return self.current.lexical_search_with_score(*args, **kwargs)
+
+    def hybrid_search_with_score(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return self.current.hybrid_search_with_score(*args, **kwargs)
+
+    def hybrid_search(self, *args, **kwargs) -> List[Document]:
+        return self.current.hybrid_search(*args, **kwargs)
+
+    def similarity_search_with_score_by_vectors(self, *args, **kwargs) -> List[List[Tuple[Document, float]]]:
+        return self.current.similarity_search_with_score_by_vectors(*args, **kwargs)
+
+    def batch_search_with_score(self, *args, **kwargs) -> List[List[Tuple[Document, float]]]:
+        return self.current.batch_search_with_score(*args, **kwargs)
+
+    def batch_search(self, *args, **kwargs) -> List[List[Document]]:
+        return self.current.batch_search(*args, **kwargs)
+
+    async def ahybrid_search_with_score(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return await self.current.ahybrid_search_with_score(*args, **kwargs)
+
+    async def ahybrid_search(self, *args, **kwargs) -> List[Document]:
+        return await self.current.ahybrid_search(*args, **kwargs)
+
+    async def abatch_search_with_score(self, *args, **kwargs) -> List[List[Tuple[Document, float]]]:
+        return await self.current.abatch_search_with_score(*args, **kwargs)
+
+    async def abatch_search(self, *args, **kwargs) -> List[List[Document]]:
+        return await self.current.abatch_search(*args, **kwargs)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return await self.current.asimilarity_search(query, k=k, **kwargs)
+
+    async def asimilarity_search_with_score(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return await self.current.asimilarity_search_with_score(*args, **kwargs)
+
+    async def asimilarity_search_with_relevance_scores(self, *args, **kwargs) -> List[Tuple[Document, float]]:
+        return await self.current.asimilarity_search_with_relevance_scores(*args, **kwargs)
+
+    async def amax_marginal_relevance_search(self, *args, **kwargs) -> List[Document]:
+        return await self.current.amax_marginal_relevance_search(*args, **kwargs)
+
+class IndexRegistry:
+    """
+    Process-wide owner of loaded vector indexes and embedders.
+
+    Indexes are keyed by (index root, embedding model) and embedders by model,
+    so RagChain, RagAgentTools and the services built on them share a single
+    copy of each. Loading is guarded by a lock per key: concurrent first calls
+    wait for one load instead of each loading the index, and loading one index
+    does not block lookups of others.
+
+    Indexes are handed out as SwappableVectorStore handles. `reload` loads the
+    version the index root's CURRENT pointer names, warms it up and swaps it
+    into the handle, without interrupting queries. A sharded index root is
+    handed out as a ShardedVectorStore over one handle per shard.
+
+    `warm_up` pre-faults every loaded index and runs the canary queries
+    against it; `loaded_indexes` reports the version, load time and warm
+    status of each index for the readiness check.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+        self._embeddings: Dict[str, Embeddings] = {}
+        self._vectorstores: Dict[Tuple[str, str], SwappableVectorStore] = {}
+        self._sharded: Dict[Tuple[str, str], ShardedVectorStore] = {}
+        self._load_info: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._reload_thread: Optional[threading.Thread] = None
+        self._watcher: Optional[threading.Thread] = None
+        # Versions that failed to load or warm up, which the watcher does not retry
+        self._rejected: Dict[Tuple[str, str], str] = {}
+        self.reload_status: Dict[str, Any] = {"state": "idle", "error": None, "last_swap": None}
+        self.warm_status: Dict[str, Any] = {"state": "pending", "error": None, "seconds": None}
+
+    def _key_lock(self, key: Tuple[str, ...]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_embeddings(self, model: str) -> Embeddings:
+        """
+        Return the shared (cached) embedder for a model, creating it on first use.
+        Query embeddings also go through an in-memory QueryEmbeddingCache.
+        """
+        embeddings = self._embeddings.get(model)
+        if embeddings is not None:
+            return embeddings
+
+        with self._key_lock(("embeddings", model)):
+            if model not in self._embeddings:
+                embeddings = create_embeddings(model)
+                if QUERY_CACHE_MAX_ENTRIES > 0:
+                    embeddings = QueryEmbeddingCache(embeddings, model)
+                self._embeddings[model] = embeddings
+            return self._embeddings[model]
+
+    def embedding_cache_stats(self) -> Dict[str, Any]:
+        """Return the query embedding cache counters of each model."""
+        return {model: embeddings.stats() for model, embeddings in list(self._embeddings.items())
+                if isinstance(embeddings, QueryEmbeddingCache)}
+
+    def get_vectorstore(self, index_dir: str, model: str) -> VectorStore:
+        """
+        Return the shared vector store for an index, loading it on first use.
+
+        Args:
+            index_dir: Index root written by build_rag.py
+            model: Embedding model used to embed queries for this index
+
+        Returns:
+            A handle that always serves the current version of the index (or
+            of each of its shards)
+        """
+        key = (os.path.abspath(index_dir), model)
+        vectorstore = self._vectorstores.get(key) or self._sharded.get(key)
+        if vectorstore is not None:
+            return vectorstore
+
+        shards = list_shards(index_dir)
+        if shards:
+            return self._get_sharded(index_dir, model, shards)
+
+        with self._key_lock(("index", *key)):
+            if key not in self._vectorstores:
+                if not os.path.exists(index_dir):
+                    raise FileNotFoundError(f"RAG index not found at {index_dir}. Please run build_rag.py first.")
+                version = current_version(index_dir)
+                logger.info(f"Loading index {index_dir} (version {version or 'unversioned'}) for {model} into the registry...")
+                start_time = time.time()
+                loaded = load_vectorstore(resolve_index_dir(index_dir), self.get_embeddings(model))
+                self._load_info[key] = {"load_seconds": round(time.time() - start_time, 3),
+                                        "loaded_at": time.time(), "warm": False}
+                self._vectorstores[key] = SwappableVectorStore(loaded, version)
+            return self._vectorstores[key]
+
+    def _get_sharded(self, index_dir: str, model: str, shards: List[str]) -> ShardedVectorStore:
+        """Load every shard of a sharded index root and combine them."""
+        key = (os.path.abspath(index_dir), model)
+        with self._key_lock(("sharded", *key)):
+            if key not in self._sharded:
+                logger.info(f"Loading {len(shards)} shards of {index_dir}: {shards}")
+                handles = {shard: self.get_vectorstore(shard_root(index_dir, shard), model) for shard in shards}
+                self._sharded[key] = ShardedVectorStore(handles, self.get_embeddings(model))
+            return self._sharded[key]
+
+    def _warm(self, vectorstore: VectorStore, canaries: bool = True) -> Dict[str, Any]:
+        """
+        Pre-fault the directory an index version was loaded from, search it
+        with random vectors and (unless `canaries` is False) run the canary
+        queries on it.
+        """
+        start_time = time.time()
+        info: Dict[str, Any] = {"prefaulted_mb": prefault_index(vectorstore.index_dir)}
+        warm_up(vectorstore)
+        if canaries:
+            info["canaries"] = self._run_canaries(vectorstore, vectorstore.index_dir)
+        info.update(warm=True, warm_seconds=round(time.time() - start_time, 3))
+        return info
+
+    def _run_canaries(self, vectorstore: VectorStore, name: str) -> List[Dict[str, Any]]:
+        """Run and log the canary queries; raise if one of them finds nothing."""
+        canaries = run_canaries(vectorstore, CANARY_QUERIES)
+        for canary in canaries:
+            logger.info(f"Canary '{canary['query']}' on {name}: {canary['results']} results, "
+                        f"embedding {canary['embed_ms']} ms, search {canary['search_ms']} ms")
+        failed = [canary["query"] for canary in canaries if not canary["ok"]]
+        if failed:
+            raise RuntimeError(f"Canary queries returned no results on {name}: {failed}")
+        return canaries
+
+    def warm_up(self) -> Dict[str, Any]:
+        """
+        Warm every loaded index (see `_warm`) and then run the canary queries
+        against each served store, through the shard fan-out for sharded roots.
+
+        Returns:
+            The canary results of each served store, keyed by 'path|model'
+        """
+        self.warm_status.update(state="warming", error=None)
+        start_time = time.time()
+        try:
+            for (path, model), handle in list(self._vectorstores.items()):
+                # The version that is loaded, which CURRENT may no longer name
+                info = self._warm(handle.current, canaries=False)
+                self._load_info.setdefault((path, model), {}).update(info)
+
+            sharded_handles = {id(handle) for store in self._sharded.values() for handle in store.shards.values()}
+            served: Dict[Tuple[str, str], VectorStore] = dict(self._sharded)
+            served.update({key: handle for key, handle in self._vectorstores.items()
+                           if id(handle) not in sharded_handles})
+            results = {}
+            for (path, model), store in served.items():
+                results[f"{path}|{model}"] = self._run_canaries(store, path)
+
+            self.warm_status.update(state="ready", seconds=round(time.time() - start_time, 3), canaries=results)
+            return results
+        except Exception as e:
+            self.warm_status.update(state="failed", error=str(e))
+            raise
+
+    def reload(self) -> Dict[str, str]:
+        """
+        Load, warm up and swap in the current version of every loaded index
+        whose CURRENT pointer moved. Returns the swapped indexes and their new version.
+        """
+        swapped = {}
+        for (path, model), handle in list(self._vectorstores.items()):
+            with self._key_lock(("index", path, model)):
+                version = current_version(path)
+                if version is None or version == handle.version:
+                    continue
+
+                logger.info(f"Loading index version {version} of {path} in the background...")
+                start_time = time.time()
+                index_dir = resolve_index_dir(path)
+                try:
+                    loaded = load_vectorstore(index_dir, self.get_embeddings(model))
+                    load_seconds = time.time() - start_time
+                    # A version whose canaries find nothing is not swapped in
+                    info = self._warm(loaded)
+                except Exception:
+                    self._rejected[(path, model)] = version
+                    raise
+                previous = handle.version
+                handle.swap(loaded, version)
+                self._load_info[(path, model)] = {"load_seconds": round(load_seconds, 3),
+                                                  "loaded_at": time.time(), **info}
+                logger.info(f"Swapped {path} from version {previous} to {version} "
+                            f"in {time.time() - start_time:.2f}s")
+                swapped[f"{path}|{model}"] = version
+        return swapped
+
+    def _run_reload(self) -> None:
+        self.reload_status.update(state="loading", error=None)
+        try:
+            if self.reload():
+                self.reload_status["last_swap"] = time.time()
+            self.reload_status["state"] = "idle"
+        except Exception as e:
+            # Keep serving the version that is loaded
+            logger.error(f"Error reloading index: {e}")
+            self.reload_status.update(state="failed", error=str(e))
+
+    def reload_in_background(self) -> bool:
+        """Start a reload in a background thread. Returns False if one is already running."""
+        with self._lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self._reload_thread = threading.Thread(target=self._run_reload, name="index-reload", daemon=True)
+            self._reload_thread.start()
+            return True
+
+    def start_watcher(self, interval: float = INDEX_RELOAD_INTERVAL) -> None:
+        """
+        Check the CURRENT pointers every `interval` seconds and reload when one
+        moved. Every worker process runs its own watcher, so all of them pick
+        up a new build without a request reaching each one. A version that
+        failed to load is not retried until CURRENT moves again (an admin
+        reload still retries it).
+        """
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                if any(current_version(path) not in (None, handle.version, self._rejected.get((path, model)))
+                       for (path, model), handle in list(self._vectorstores.items())):
+                    self.reload_in_background()
+
+        self._watcher = threading.Thread(target=watch, name="index-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"Watching index versions every {interval}s")
+
+    def loaded_indexes(self) -> Dict[str, Any]:
+        """
+        Return the loaded indexes (as 'path|model') with their version, number
+        of vectors, load time and warm status (without the canary details).
+        """
+        indexes = {}
+        for (path, model), handle in list(self._vectorstores.items()):
+            info = {field: value for field, value in self._load_info.get((path, model), {}).items()
+                    if field != "canaries"}
+            indexes[f"{path}|{model}"] = {"version": handle.version, "vectors": handle.index.ntotal, **info}
+        return indexes
+
+    def is_ready(self) -> bool:
+        """True once `warm_up` succeeded and every loaded index is warm."""
+        indexes = self.loaded_indexes()
+        return (self.warm_status["state"] == "ready" and bool(indexes)
+                and all(index.get("warm") for index in indexes.values()))
+
+# Shared by every component of the process
+registry = IndexRegistry()
+
+def get_embeddings(model: str) -> Embeddings:
+    """Return the process-wide embedder for a model."""
+    return registry.get_embeddings(model)
+
+def get_vectorstore(index_dir: str, model: str) -> SwappableVectorStore:
+    """Return the process-wide vector store for an index."""
+    return registry.get_vectorstore(index_dir, model)
@@ -0,0 +1,221 @@
+import math
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import faiss
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+DEFAULT_INDEX_TYPE = "flat"
+
+# FAISS needs about this many training points per IVF list
+MIN_POINTS_PER_LIST = 39
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+PQ_BITS = 8
+MAX_PQ_SUBQUANTIZERS = 64
+
+# Scalar quantization of the stored vectors (bytes per dimension: 4, 2, 1)
+QUANTIZATIONS = ("none", "fp16", "int8")
+_SQ_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+# Candidates fetched per requested result and re-ranked with exact distances
+DEFAULT_RERANK_FACTOR = 4
+# Queries used to measure the recall of a compressed index at build time
+EVAL_QUERIES = 200
+EVAL_K = 5
+
+def default_index_params(index_type: str, num_vectors: int, dimension: int) -> Dict[str, Any]:
+    """
+    Return build and search parameters for an index type, sized for the corpus.
+
+    IVF indexes use about 4*sqrt(n) lists (capped so every list gets enough
+    training points) and probe 1/16 of them. IVF-PQ splits the vectors into
+    up to 64 sub-quantizers of 8 bits. Vectors are stored unquantized and
+    results are not re-ranked unless options ask for it.
+    """
+    params: Dict[str, Any] = {"index_type": index_type, "quantization": "none", "rerank_factor": 0}
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_LIST))
+        params["nlist"] = nlist
+        params["nprobe"] = min(nlist, max(8, nlist // 16))
+    if index_type == "ivf_pq":
+        params["pq_m"] = max(m for m in range(1, MAX_PQ_SUBQUANTIZERS + 1) if dimension % m == 0)
+        params["pq_bits"] = PQ_BITS
+    if index_type == "hnsw":
+        params["hnsw_m"] = HNSW_M
+        params["ef_construction"] = HNSW_EF_CONSTRUCTION
+        params["ef_search"] = HNSW_EF_SEARCH
+    return params
+
+def build_ann_index(
+    vectors: np.ndarray,
+    index_type: str = DEFAULT_INDEX_TYPE,
+    options: Optional[Dict[str, Any]] = None
+) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Create and train an empty FAISS index of the given type.
+
+    All indexes use L2 distance, like the flat index LangChain creates by
+    default. Vectors are not added; the caller adds them so the docstore
+    mapping stays in sync. When the corpus is too small to train the
+    requested type, a flat index is returned instead.
+
+    With `quantization` fp16 or int8, flat, IVF and HNSW indexes store
+    scalar-quantized vectors; `rerank_factor` (default 4 when quantized)
+    is saved with the index so queries re-rank that many candidates per
+    result against the float32 vectors.
+
+    Args:
+        vectors: (n, d) float32 training vectors (the corpus itself)
+        index_type: One of INDEX_TYPES
+        options: Overrides for the parameters of default_index_params
+
+    Returns:
+        The trained index and the parameters it was built with
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    num_vectors, dimension = vectors.shape
+    params = default_index_params(index_type, num_vectors, dimension)
+    options = {key: value for key, value in (options or {}).items() if value is not None}
+    params.update(options)
+
+    quantization = params["quantization"]
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+    if quantization != "none" and index_type == "ivf_pq":
+        raise ValueError("ivf_pq already compresses its vectors; use quantization 'none' with it")
+    if quantization != "none" and "rerank_factor" not in options:
+        params["rerank_factor"] = DEFAULT_RERANK_FACTOR
+
+    if index_type == "ivf_pq" and num_vectors < 2 ** params["pq_bits"]:
+        logger.warning(f"{num_vectors} vectors are too few to train IVF-PQ, building a flat index instead")
+        return build_ann_index(vectors, "flat", {"rerank_factor": params["rerank_factor"]})
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    sq_type = _SQ_TYPES.get(quantization)
+    if index_type == "flat":
+        if sq_type is None:
+            index = faiss.IndexFlatL2(dimension)
+        else:
+            index = faiss.IndexScalarQuantizer(dimension, sq_type, faiss.METRIC_L2)
+    elif index_type == "hnsw":
+        if sq_type is None:
+            index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"])
+        else:
+            index = faiss.IndexHNSWSQ(dimension, sq_type, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["pq_m"], params["pq_bits"])
+        elif sq_type is None:
+            index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"])
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, params["nlist"], sq_type, faiss.METRIC_L2)
+        index.nprobe = params["nprobe"]
+
+    if not index.is_trained:
+        # IVF centroids and/or the int8 value ranges
+        logger.info(f"Training {index_type} index ({quantization} storage) on {num_vectors} vectors...")
+        index.train(vectors)
+
+    return index, params
+
+def evaluate_compression(
+    index: faiss.Index,
+    vectors: np.ndarray,
+    rerank_factor: int = 0,
+    k: int = EVAL_K,
+    num_queries: int = EVAL_QUERIES
+) -> Dict[str, Any]:
+    """
+    Measure what a compressed index costs in recall and saves in memory.
+
+    Queries are corpus vectors with a little noise; recall@k is measured
+    against exact float32 search, with and without re-ranking.
+
+    Args:
+        index: Trained index holding `vectors`
+        vectors: The float32 vectors that were added to the index
+        rerank_factor: Re-ranking factor to evaluate (0 skips it)
+        k: Number of results per query
+        num_queries: Number of queries
+
+    Returns:
+        Sizes in MB, memory saving and recall@k
+    """
+    # Imported here: only builds evaluate indexes
+    from backend.chains.vector_index import RerankingIndex
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = make_queries(vectors, num_queries)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    def recall(searcher) -> float:
+        _, found = searcher.search(queries, k)
+        return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+    float32_mb = vectors.nbytes / 1e6
+    index_mb = faiss.serialize_index(index).nbytes / 1e6
+    result = {
+        "float32_mb": round(float32_mb, 2),
+        "index_mb": round(index_mb, 2),
+        "memory_saving": round(1 - index_mb / float32_mb, 3) if float32_mb else 0.0,
+        f"recall@{k}": round(recall(index), 4),
+    }
+    if rerank_factor:
+        result[f"recall@{k}_reranked"] = round(recall(RerankingIndex(index, vectors, rerank_factor)), 4)
+    return result
+
+def evaluate_reduction(
+    vectors: np.ndarray,
+    projection: Any,
+    k: int = EVAL_K,
+    num_queries: int = EVAL_QUERIES
+) -> Dict[str, Any]:
+    """
+    Measure how well exact search over reduced vectors finds the neighbours
+    exact search over the full-size vectors finds.
+
+    Args:
+        vectors: (n, d) full-size corpus vectors
+        projection: projection.Projection fitted on them
+        k: Number of results per query
+        num_queries: Number of queries
+
+    Returns:
+        recall@k of the reduced vectors and their size relative to full size
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = make_queries(vectors, num_queries)
+    full = faiss.IndexFlatL2(vectors.shape[1])
+    full.add(vectors)
+    _, truth = full.search(queries, k)
+
+    reduced = faiss.IndexFlatL2(projection.dimensions)
+    reduced.add(projection.apply(vectors))
+    _, found = reduced.search(projection.apply(queries), k)
+    return {
+        f"recall@{k}": round(float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])), 4),
+        "size_ratio": round(projection.dimensions / vectors.shape[1], 3),
+    }
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 7) -> np.ndarray:
+    """Queries near corpus vectors: sampled vectors with some noise, renormalized."""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)].copy()
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from typing import List, Dict, Any
+
+import faiss
+import numpy as np
+
+# Add the project root to the path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+sys.path.insert(0, project_root)
+
+from backend.chains.scripts.build_rag import OUTPUT_DIR
+from backend.chains.scripts.ann_index import build_ann_index, make_queries, INDEX_TYPES, QUANTIZATIONS
+from backend.chains.vector_index import RerankingIndex, apply_search_params, resolve_index_dir
+from backend.chains.projection import Projection, REDUCTIONS
+
+# Search parameter swept for each index type
+SWEEPS = {
+    "flat": None,
+    "ivf_flat": "nprobe",
+    "ivf_pq": "nprobe",
+    "hnsw": "ef_search",
+}
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark recall@k and search latency of FAISS index types")
+    parser.add_argument("--index-dir", type=str, default=OUTPUT_DIR,
+                        help="Directory of a flat index whose vectors are used as the corpus")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Use this many random clustered vectors instead of an index")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimension of synthetic vectors")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES),
+                        help="Index types to benchmark")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=5, help="Number of neighbours retrieved per query")
+    parser.add_argument("--sweep", type=int, nargs="+", default=[8, 16, 32, 64, 128],
+                        help="Values of nprobe (IVF) or efSearch (HNSW) to measure")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default="none",
+                        help="Scalar quantization of the stored vectors (not applied to ivf_pq)")
+    parser.add_argument("--rerank-factor", type=int, default=None,
+                        help="Re-rank k*N candidates with exact distances (default: 4 when quantized)")
+    parser.add_argument("--dimensions", type=int, default=None,
+                        help="Index reduced vectors of this dimension; recall is still measured "
+                             "against exact search over the full-size vectors")
+    parser.add_argument("--reduction", choices=REDUCTIONS[1:], default="truncate",
+                        help="How --dimensions reduces the vectors")
+    return parser.parse_args()
+
+def load_corpus_vectors(index_dir: str) -> np.ndarray:
+    """Read all vectors of a flat index built by build_rag.py."""
+    index = faiss.read_index(os.path.join(resolve_index_dir(index_dir), "index.faiss"))
+    if not isinstance(index, faiss.IndexFlat):
+        raise ValueError(f"{index_dir} does not hold a flat index; build one with --index-type flat "
+                         f"or use --synthetic")
+    return index.reconstruct_n(0, index.ntotal)
+
+def synthetic_vectors(count: int, dim: int, seed: int = 42) -> np.ndarray:
+    """Random unit vectors drawn around a few hundred centres, roughly like text embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, count // 100), dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, len(centres), count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def measure(index, queries: np.ndarray, ground_truth: np.ndarray, k: int) -> Dict[str, float]:
+    """Search one query at a time (as the API does) and return recall@k and latency percentiles in ms."""
+    latencies = []
+    hits = 0
+    for query, truth in zip(queries, ground_truth):
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found[0]) & set(truth))
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def main():
+    """Build each index type over the same vectors and compare it with exact search."""
+    args = parse_arguments()
+
+    # Keep the benchmark output readable
+    logging.disable(logging.INFO)
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = load_corpus_vectors(args.index_dir)
+    queries = make_queries(vectors, args.queries)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+
+    description = f"{args.quantization} storage"
+    if args.dimensions:
+        projection = Projection.fit(vectors, args.reduction, args.dimensions)
+        vectors, queries = projection.apply(vectors), projection.apply(queries)
+        description += f", {args.reduction} to {args.dimensions} dimensions"
+
+    print(f"{len(vectors)} vectors of dimension {exact.d}, {len(queries)} queries, k={args.k}, {description}\n")
+    print(f"{'type':>9} {'param':>14} {'build s':>8} {'size MB':>8} {f'recall@{args.k}':>9} {'p50 ms':>8} {'p99 ms':>8}")
+
+    for index_type in args.types:
+        options = {"rerank_factor": args.rerank_factor}
+        if index_type != "ivf_pq":
+            options["quantization"] = args.quantization
+        start = time.perf_counter()
+        index, params = build_ann_index(vectors, index_type, options)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        searcher = RerankingIndex(index, vectors, params["rerank_factor"]) if params["rerank_factor"] else index
+
+        sweep_param = SWEEPS[params["index_type"]]
+        values: List[Any] = args.sweep if sweep_param else [None]
+        for value in values:
+            label = "-"
+            if sweep_param:
+                if sweep_param == "nprobe" and value > params["nlist"]:
+                    continue
+                apply_search_params(index, {sweep_param: value})
+                label = f"{sweep_param}={value}"
+            result = measure(searcher, queries, ground_truth, args.k)
+            print(f"{params['index_type']:>9} {label:>14} {build_seconds:>8.2f} {size_mb:>8.1f} "
+                  f"{result['recall']:>9.3f} {result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f}")
+
+    print("\nPick the cheapest configuration whose recall is acceptable, then build it with "
+          "build_rag.py --index-type (and --nprobe/--ef-search).")
+
+if __name__ == "__main__":
+    main()
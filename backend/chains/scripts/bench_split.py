@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from typing import List
+
+# Add the project root to the path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+sys.path.insert(0, project_root)
+
+from langchain_core.documents import Document
+from backend.chains.scripts.build_rag import DATA_DIR, load_documents, split_documents
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark split_documents scaling with corpus size")
+    parser.add_argument("--corpus", type=str, default=DATA_DIR, help="Corpus directory")
+    parser.add_argument("--steps", type=int, default=5, help="Number of corpus sizes to measure (each doubles the previous)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the best time is reported")
+    return parser.parse_args()
+
+def time_split(documents: List[Document], repeat: int) -> float:
+    """Return the best wall time in seconds of splitting `documents`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        split_documents(documents)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    """Split growing prefixes of the corpus and report time per MB."""
+    args = parse_arguments()
+
+    # Keep the benchmark output readable
+    logging.disable(logging.INFO)
+
+    documents = load_documents(args.corpus)
+    if not documents:
+        print(f"No documents found in {args.corpus}")
+        return
+
+    sizes = [max(1, len(documents) >> shift) for shift in reversed(range(args.steps))]
+
+    print(f"{'docs':>8} {'MB':>8} {'seconds':>10} {'s/MB':>8}")
+    for size in sizes:
+        subset = documents[:size]
+        megabytes = sum(len(doc.page_content) for doc in subset) / 1e6
+        seconds = time_split(subset, args.repeat)
+        print(f"{size:>8} {megabytes:>8.2f} {seconds:>10.3f} {seconds / megabytes:>8.3f}")
+
+    print("\nSplit time scales linearly when s/MB stays roughly constant across sizes.")
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,21 @@ import glob
 import json
 import logging
 import time
-import re
-from typing import List, Dict, Any, Optional
+import shutil
+import hashlib
+import argparse
+from collections import deque
+
+import faiss
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.document_loaders import TextLoader
 from langchain_community.document_loaders.html import UnstructuredHTMLLoader as HTMLLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
 
 # Configure logging
@@ -22,18 +29,77 @@ logger = logging.getLogger(__name__)
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
 sys.path.insert(0, project_root)
 
+from backend.chains.embeddings import create_embeddings, get_encoding, count_tokens_batch
+from backend.chains.scripts.embedding_batcher import EmbeddingBatcher
+from backend.chains.scripts.dedup import deduplicate_chunks, DEFAULT_THRESHOLD as DEFAULT_DEDUP_THRESHOLD
+from backend.chains.scripts.checkpoint import BuildCheckpoint
+from backend.chains.scripts.build_report import BuildReport, REPORT_FILE
+from backend.chains.embeddings import CachedEmbeddings
+from backend.chains.scripts.ann_index import (
+    build_ann_index, evaluate_compression, evaluate_reduction, INDEX_TYPES, DEFAULT_INDEX_TYPE, QUANTIZATIONS
+)
+from backend.chains.projection import Projection, REDUCTIONS
+from backend.chains.vector_index import (
+    RERANK_VECTORS_FILE, save_index_params, load_index_params, load_vectorstore,
+    resolve_index_dir, new_version_dir, publish_version, prune_versions, current_version,
+    shard_root, publish_shards, unpublish_shards
+)
+from backend.chains.docstore import DOCSTORE_FILE, write_docstore
+from backend.chains.lexical import LexicalIndex
+from backend.chains.scripts.quality import prune_chunks, QUALITY_PROFILES, DEFAULT_PROFILE as DEFAULT_QUALITY_PROFILE
+
 # Load environment variables
 load_dotenv()
 
-# Check if API key is set
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    logger.error("OPENAI_API_KEY environment variable is not set. Make sure it's in your .env file.")
-    sys.exit(1)
-
 # Constants
 DATA_DIR = os.path.join(project_root, "data/corpus")
 OUTPUT_DIR = os.path.join(project_root, "data/index")
+MANIFEST_FILE = "manifest.json"
+CHECKPOINT_DIR = "checkpoint"
+MANIFEST_VERSION = 1
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 100
+# Defaults when chunks are measured in tokens (~1000 characters of English text)
+DEFAULT_TOKEN_CHUNK_SIZE = 256
+DEFAULT_TOKEN_CHUNK_OVERLAP = 32
+CHUNK_UNITS = ("chars", "tokens")
+HEADER_SCAN_LIMIT = 8192  # The Title/URL/Summary header always fits in the file prefix
+HEADER_FIELDS = {"Title": "title", "URL": "url", "Summary": "summary"}
+LOAD_BATCH_SIZE = 64
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", DEFAULT_INDEX_TYPE)
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+
+def parse_header(content: str, limit: int = HEADER_SCAN_LIMIT) -> Optional[Tuple[Dict[str, Optional[str]], int]]:
+    """
+    Parse the `Title:/URL:/Summary:/---` header in one pass over the start of `content`.
+    
+    Only the first `limit` characters are scanned. Returns the header fields and
+    the offset where the body starts, or None if no `---` separator line is
+    found in the prefix.
+    """
+    fields: Dict[str, Optional[str]] = {name: None for name in HEADER_FIELDS.values()}
+    pos = 0
+    end = min(len(content), limit)
+    
+    while pos < end:
+        newline = content.find('\n', pos, end)
+        if newline == -1:
+            return None
+        line = content[pos:newline]
+        
+        if line.rstrip() == '---':
+            return fields, newline + 1
+        
+        key, sep, value = line.partition(':')
+        name = HEADER_FIELDS.get(key.strip())
+        if sep and name and fields[name] is None:
+            fields[name] = value.strip()
+        
+        pos = newline + 1
+    
+    return None
 
 def load_structured_text_file(file_path: str) -> List[Document]:
     """
@@ -44,25 +110,17 @@ def load_structured_text_file(file_path: str) -> List[Document]:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        # Extract metadata using regex
-        title_match = re.search(r'Title:\s*(.*?)(?:\n|$)', content)
-        url_match = re.search(r'URL:\s*(.*?)(?:\n|$)', content)
-        summary_match = re.search(r'Summary:\s*(.*?)(?:\n|$)', content)
-        
-        # Find the separator
-        separator_index = content.find('---\n\n')
+        # Extract metadata from the header at the start of the file
+        header = parse_header(content)
         
-        if separator_index != -1:
+        if header is not None:
+            fields, body_start = header
+            
             # Extract main content after the separator
-            main_content = content[separator_index + 5:].strip()
+            main_content = content[body_start:].strip()
             
             # Create metadata dictionary
-            metadata = {
-                "source": file_path,
-                "title": title_match.group(1).strip() if title_match else None,
-                "url": url_match.group(1).strip() if url_match else None,
-                "summary": summary_match.group(1).strip() if summary_match else None,
-            }
+            metadata = {"source": file_path, **fields}
             
             # Create and return the document
             return [Document(page_content=main_content, metadata=metadata)]
@@ -75,108 +133,517 @@ def load_structured_text_file(file_path: str) -> List[Document]:
         logger.error(f"Error loading structured file {file_path}: {e}")
         return []
 
-def load_documents(directory: str = DATA_DIR) -> List[Document]:
+def list_corpus_files(directory: str = DATA_DIR, domain: Optional[str] = None) -> List[str]:
     """
-    Load all HTML and text documents from the specified directory.
-    Returns a list of Documents.
+    List all HTML and text files under the specified directory (only those
+    of one corpus domain, i.e. top-level subdirectory, if `domain` is given).
+    Returns a sorted list of file paths.
     """
-    logger.info(f"Loading documents from {directory}...")
-    documents = []
-    
+    root = os.path.join(directory, domain) if domain else directory
     # Use recursive glob to find all HTML and text files
-    html_files = glob.glob(f"{directory}/**/*.html", recursive=True)
-    text_files = glob.glob(f"{directory}/**/*.txt", recursive=True)
-    
-    # Load HTML files
-    for file_path in html_files:
-        try:
+    html_files = glob.glob(f"{root}/**/*.html", recursive=True)
+    text_files = glob.glob(f"{root}/**/*.txt", recursive=True)
+    return sorted(html_files + text_files)
+
+def list_domains(directory: str = DATA_DIR) -> List[str]:
+    """Return the corpus domains (top-level subdirectories) that contain documents."""
+    return sorted(
+        name for name in os.listdir(directory)
+        if os.path.isdir(os.path.join(directory, name)) and list_corpus_files(directory, name)
+    )
+
+def load_file(file_path: str) -> List[Document]:
+    """
+    Load a single HTML or text file.
+    Returns a list of Documents (empty if the file could not be loaded).
+    """
+    try:
+        if file_path.endswith(".html"):
             loader = HTMLLoader(file_path)
             docs = loader.load()
             # Add source information to metadata
             for doc in docs:
                 doc.metadata["source"] = file_path
-            documents.extend(docs)
             logger.debug(f"Loaded HTML document: {file_path}")
-        except Exception as e:
-            logger.error(f"Error loading {file_path}: {e}")
-    
-    # Load text files using our custom structured loader
-    for file_path in text_files:
-        try:
+        else:
+            # Load text files using our custom structured loader
             docs = load_structured_text_file(file_path)
-            documents.extend(docs)
             logger.debug(f"Loaded text document: {file_path}")
-        except Exception as e:
-            logger.error(f"Error loading {file_path}: {e}")
+        return docs
+    except Exception as e:
+        logger.error(f"Error loading {file_path}: {e}")
+        return []
+
+def _load_batch(files: List[str]) -> List[Document]:
+    """Load a batch of files (runs in a worker process)."""
+    documents = []
+    for file_path in files:
+        documents.extend(load_file(file_path))
+    return documents
+
+def iter_document_batches(
+    files: List[str],
+    workers: Optional[int] = None,
+    batch_size: int = LOAD_BATCH_SIZE
+) -> Iterator[List[Document]]:
+    """
+    Load files across a process pool, yielding Documents one batch at a time.
+    
+    At most `2 * workers` batches are in flight, so memory stays bounded by
+    the batches being loaded rather than the whole corpus. Batches are
+    yielded in file order. With `workers=1` files are loaded in-process.
+    """
+    batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    workers = workers or os.cpu_count() or 1
+    
+    if workers == 1 or len(batches) <= 1:
+        for batch in batches:
+            yield _load_batch(batch)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(_load_batch, batch))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def load_documents(
+    directory: str = DATA_DIR,
+    files: Optional[List[str]] = None,
+    workers: Optional[int] = None
+) -> List[Document]:
+    """
+    Load all HTML and text documents from the specified directory.
+    If `files` is given, only those files are loaded.
+    Returns a list of Documents.
+    """
+    logger.info(f"Loading documents from {directory}...")
+    documents = []
+    
+    if files is None:
+        files = list_corpus_files(directory)
+    
+    for batch in iter_document_batches(files, workers):
+        documents.extend(batch)
     
     logger.info(f"Loaded {len(documents)} documents.")
     return documents
 
-def split_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 100) -> List[Document]:
+def load_and_split(
+    files: List[str],
+    settings: Dict[str, Any],
+    workers: Optional[int] = None,
+    report: Optional[BuildReport] = None,
+    directory: str = DATA_DIR
+) -> List[Document]:
+    """
+    Stream files through the parallel loader and split each batch as it arrives.
+    Only one batch of full documents is held in memory at a time.
+    Loading and splitting are timed as separate "load" and "split" stages.
+    """
+    logger.info(f"Loading and splitting {len(files)} files...")
+    report = report or BuildReport()
+    document_splits = []
+    num_documents = 0
+    
+    batches = iter_document_batches(files, workers)
+    while True:
+        with report.stage("load"):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        
+        num_documents += len(batch)
+        report.count("documents", batch, directory)
+        with report.stage("split"):
+            splits = split_documents(
+                batch,
+                settings["chunk_size"],
+                settings["chunk_overlap"],
+                settings["chunk_unit"],
+                settings["embedding_model"]
+            )
+        report.count("chunks", splits, directory, tokens_key="chunk_tokens")
+        document_splits.extend(splits)
+    
+    logger.info(f"Loaded {num_documents} documents into {len(document_splits)} splits.")
+    return document_splits
+
+def split_documents(
+    documents: List[Document],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    chunk_unit: str = "chars",
+    embeddings_model: str = "text-embedding-3-small"
+) -> List[Document]:
     """
     Split documents into chunks of specified size with overlap.
+    
+    `chunk_unit` selects how size and overlap are measured: "chars" (len) or
+    "tokens" (tiktoken tokens of `embeddings_model`, with a cached encoder).
+    
+    Each split is created from its parent document directly, so it carries a
+    copy of the parent's metadata plus its provenance:
+    
+    - parent_id: the parent document's source path
+    - chunk_index: ordinal of the chunk within the parent
+    - start_index / end_index: character offsets of the chunk in the parent's content
+    - token_count: tokens in the chunk, counted with one batched encoder call
+      in both modes
+    
     Returns a list of document chunks.
     """
-    logger.info(f"Splitting documents into chunks (size={chunk_size}, overlap={chunk_overlap})...")
+    logger.info(f"Splitting documents into chunks (size={chunk_size} {chunk_unit}, overlap={chunk_overlap})...")
+    
+    if chunk_unit == "tokens":
+        encoding = get_encoding(embeddings_model)
+        length_function = lambda text: len(encoding.encode_ordinary(text))
+    else:
+        length_function = len
     
     # Initialize the text splitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        length_function=len,
+        length_function=length_function,
         separators=["\n\n", "\n", " ", ""]
     )
     
-    # Split the documents
-    splits = text_splitter.split_documents(documents)
-    
-    # Preserve metadata during splitting
-    for split in splits:
-        # If this split came from a document with title/url/summary metadata, 
-        # make sure it's still there
-        if "title" in split.metadata:
-            # Metadata is already preserved
-            pass
-        elif len(documents) > 0 and "title" in documents[0].metadata:
-            # Copy metadata from original document if needed
-            parent_doc = next((doc for doc in documents if doc.page_content in split.page_content), None)
-            if parent_doc and "title" in parent_doc.metadata:
-                split.metadata["title"] = parent_doc.metadata.get("title")
-                split.metadata["url"] = parent_doc.metadata.get("url")
-                split.metadata["summary"] = parent_doc.metadata.get("summary")
+    splits = []
+    for doc in documents:
+        text = doc.page_content
+        parent_id = doc.metadata.get("source")
+        index = -1
+        
+        for chunk_index, chunk in enumerate(text_splitter.split_text(text)):
+            # Chunks appear in order, so search forward from just after the
+            # start of the previous chunk
+            found = text.find(chunk, index + 1)
+            index = found if found != -1 else text.find(chunk)
+            
+            metadata = dict(doc.metadata)
+            metadata.update({
+                "parent_id": parent_id,
+                "chunk_index": chunk_index,
+                "start_index": index,
+                "end_index": index + len(chunk) if index != -1 else -1,
+            })
+            splits.append(Document(page_content=chunk, metadata=metadata))
+    
+    # Record token counts so dedup, pruning, the report, embedding and prompt
+    # assembly don't tokenize again
+    token_counts = count_tokens_batch([split.page_content for split in splits], embeddings_model)
+    for split, token_count in zip(splits, token_counts):
+        split.metadata["token_count"] = token_count
     
     logger.info(f"Created {len(splits)} document splits.")
     return splits
 
-def create_index(document_splits: List[Document], output_dir: str = OUTPUT_DIR) -> None:
+def file_hash(file_path: str) -> str:
+    """Return the sha256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def relative_source(file_path: str, directory: str = DATA_DIR) -> str:
+    """Return the path of a corpus file relative to the corpus directory."""
+    return os.path.relpath(file_path, directory).replace(os.sep, "/")
+
+def assign_chunk_ids(document_splits: List[Document], directory: str = DATA_DIR) -> List[str]:
+    """
+    Give every split a stable content-addressed id and store it in metadata["chunk_id"].
+    
+    The id is the sha256 of the relative source path and the chunk text, so an
+    unchanged chunk keeps its id across rebuilds even if other parts of the
+    same file change. Repeated identical chunks in one file get an occurrence
+    counter mixed into the hash.
+    
+    Returns the list of ids in the same order as the splits.
+    """
+    ids = []
+    seen: Dict[Tuple[str, str], int] = {}
+    for split in document_splits:
+        rel = relative_source(split.metadata.get("source", ""), directory)
+        text_digest = hashlib.sha256(split.page_content.encode('utf-8')).hexdigest()
+        occurrence = seen.get((rel, text_digest), 0)
+        seen[(rel, text_digest)] = occurrence + 1
+        chunk_id = hashlib.sha256(f"{rel}\0{text_digest}\0{occurrence}".encode('utf-8')).hexdigest()
+        split.metadata["chunk_id"] = chunk_id
+        ids.append(chunk_id)
+    return ids
+
+def load_manifest(output_dir: str = OUTPUT_DIR) -> Optional[Dict[str, Any]]:
+    """
+    Load the build manifest stored next to the index.
+    Returns None if there is no manifest or it cannot be read.
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            logger.warning(f"Manifest version mismatch in {manifest_path}, ignoring it")
+            return None
+        return manifest
+    except Exception as e:
+        logger.warning(f"Could not read manifest {manifest_path}: {e}")
+        return None
+
+def save_manifest(manifest: Dict[str, Any], output_dir: str = OUTPUT_DIR) -> None:
+    """Atomically write the build manifest next to the index."""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def build_settings(
+    embeddings_model: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    chunk_unit: str = "chars",
+    dedup_threshold: Optional[float] = DEFAULT_DEDUP_THRESHOLD,
+    quality_profile: str = DEFAULT_QUALITY_PROFILE,
+    index_type: str = DEFAULT_INDEX_TYPE,
+    index_options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Settings that invalidate every chunk id, vector or the index structure when they change.
+    `dedup_threshold=None` disables near-duplicate elimination. `index_options`
+    overrides the sizing of `index_type` (see ann_index.default_index_params).
+    """
+    return {
+        "embedding_model": embeddings_model,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunk_unit": chunk_unit,
+        "dedup_threshold": dedup_threshold,
+        "quality_profile": quality_profile,
+        "index_type": index_type,
+        "index_options": index_options or {},
+    }
+
+def get_embeddings():
+    """Initialize the (cached) embeddings model configured by EMBEDDINGS_MODEL."""
+    embeddings_model = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
+    logger.info(f"Using embedding model: {embeddings_model}")
+    return create_embeddings(embeddings_model)
+
+def get_checkpoint(output_dir: str = OUTPUT_DIR) -> BuildCheckpoint:
+    """Return the embedding checkpoint kept inside the index root (shared by all versions)."""
+    return BuildCheckpoint(
+        os.path.join(output_dir, CHECKPOINT_DIR),
+        os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
+    )
+
+def embed_splits(
+    document_splits: List[Document],
+    embeddings,
+    checkpoint: Optional[BuildCheckpoint] = None,
+    report: Optional[BuildReport] = None
+) -> np.ndarray:
+    """
+    Embed the splits with the concurrent, token-budgeted batcher.
+    Concurrency and batch size come from EMBEDDING_CONCURRENCY and EMBEDDING_BATCH_TOKENS.
+    
+    With a checkpoint, vectors of chunks embedded by an earlier interrupted
+    run are reused and every completed batch is persisted as a shard.
+    
+    Returns a float32 matrix with one row per split.
+    """
+    ids = [split.metadata["chunk_id"] for split in document_splits]
+    completed = checkpoint.load() if checkpoint else {}
+    pending = [i for i, chunk_id in enumerate(ids) if chunk_id not in completed]
+    if completed:
+        logger.info(f"Reusing {len(ids) - len(pending)} embeddings from the checkpoint, {len(pending)} left to embed")
+    
+    new_vectors = []
+    if pending:
+        batcher = EmbeddingBatcher(
+            embeddings,
+            os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small"),
+            max_batch_tokens=EMBEDDING_BATCH_TOKENS,
+            concurrency=EMBEDDING_CONCURRENCY
+        )
+        
+        def save_batch(batch: List[int], vectors: List[List[float]]) -> None:
+            checkpoint.save_batch([ids[pending[i]] for i in batch], vectors)
+        
+        texts = [document_splits[i].page_content for i in pending]
+        token_counts = [document_splits[i].metadata.get("token_count") for i in pending]
+        if None in token_counts:
+            # Chunks from before token counts were recorded; the batcher counts them
+            token_counts = None
+        cache_before = embeddings.counters() if isinstance(embeddings, CachedEmbeddings) else None
+        new_vectors = batcher.embed(texts, token_counts, save_batch if checkpoint else None)
+        
+        if isinstance(embeddings, CachedEmbeddings):
+            embeddings.flush()
+        
+        stats = batcher.stats
+        logger.info(f"Embedded {stats['texts']} chunks ({stats['tokens']} tokens) with {stats['requests']} requests "
+                    f"in {stats['seconds']:.2f}s ({stats['tokens_per_second']:,.0f} tokens/s, "
+                    f"{stats['rate_limited']} rate limited)")
+        
+        if report is not None:
+            cache_stats = None
+            if cache_before is not None:
+                cache_stats = {key: value - cache_before[key] for key, value in embeddings.counters().items()}
+            report.add_embedding_stats(stats, batcher.model, cache_stats)
+    
+    if not ids:
+        return np.empty((0, 0), dtype=np.float32)
+    
+    dim = len(new_vectors[0]) if new_vectors else len(next(iter(completed.values())))
+    vectors = np.empty((len(ids), dim), dtype=np.float32)
+    for row, vector in zip(pending, new_vectors):
+        vectors[row] = vector
+    for row, chunk_id in enumerate(ids):
+        if chunk_id in completed:
+            vectors[row] = completed[chunk_id]
+    return vectors
+
+def prepare_chunks(
+    document_splits: List[Document],
+    settings: Dict[str, Any],
+    directory: str = DATA_DIR,
+    report: Optional[BuildReport] = None
+) -> List[Document]:
+    """
+    Run the stages between splitting and embedding: assign chunk ids, drop
+    low-quality chunks, then collapse near-duplicate chunks.
+    Returns the chunks to index.
+    """
+    report = report or BuildReport()
+    assign_chunk_ids(document_splits, directory)
+    
+    with report.stage("prune"):
+        document_splits, report.extra["quality"] = prune_chunks(
+            document_splits,
+            settings.get("quality_profile", DEFAULT_QUALITY_PROFILE)
+        )
+    
+    if settings.get("dedup_threshold") is not None:
+        with report.stage("dedup"):
+            document_splits, report.extra["dedup"] = deduplicate_chunks(document_splits, settings["dedup_threshold"])
+    
+    report.count("indexed_chunks", document_splits, directory, tokens_key="indexed_tokens")
+    return document_splits
+
+def save_vectorstore(vectorstore: FAISS, output_dir: str = OUTPUT_DIR) -> None:
+    """
+    Save the vector store as index.faiss plus the SQLite docstore, replacing
+    both files by rename. API workers may have the old files memory-mapped
+    (FAISS_MMAP); overwriting them in place would change the pages under them.
+    The BM25 index over the same chunks is rebuilt and saved with them.
+    """
+    index_path = os.path.join(output_dir, "index.faiss")
+    faiss.write_index(vectorstore.index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    write_docstore(os.path.join(output_dir, DOCSTORE_FILE), vectorstore.docstore, vectorstore.index_to_docstore_id)
+    
+    # BM25 documents are FAISS positions, like the filter id sets
+    lexical = LexicalIndex.build(
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[position]).page_content
+        for position in range(vectorstore.index.ntotal)
+    )
+    lexical.save(output_dir)
+    logger.info(f"Wrote BM25 index: {len(lexical.terms)} terms, {len(lexical.postings)} postings, {lexical.size_mb()} MB")
+
+def save_rerank_vectors(vectors: np.ndarray, output_dir: str = OUTPUT_DIR) -> None:
+    """
+    Save the float32 vectors a quantized index re-ranks with, in FAISS
+    position order. Loaded memory-mapped, so they stay on disk except for
+    the candidate rows each query reads.
+    """
+    vectors_path = os.path.join(output_dir, RERANK_VECTORS_FILE)
+    with open(vectors_path + ".tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(vectors_path + ".tmp", vectors_path)
+
+def create_index(
+    document_splits: List[Document],
+    output_dir: str = OUTPUT_DIR,
+    ids: Optional[List[str]] = None,
+    report: Optional[BuildReport] = None,
+    index_type: str = DEFAULT_INDEX_TYPE,
+    index_options: Optional[Dict[str, Any]] = None,
+    checkpoint: Optional[BuildCheckpoint] = None
+) -> None:
     """
     Create a FAISS index from the document splits and save it to the output directory.
+    If `ids` is given, they are used as the docstore ids of the splits.
+    `checkpoint` defaults to one inside the output directory.
+    
+    ANN index types are trained on the corpus vectors here; the parameters
+    they were built with (including search-time nprobe/efSearch) are saved
+    with the index and applied when it is loaded. Scalar-quantized indexes
+    that re-rank also get the float32 vectors, and the report records the
+    memory they save and the recall they keep. With a `reduction` option
+    (truncate or pca to `dimensions`), vectors are projected before the
+    index is built and the projection is saved for the query path.
     """
     logger.info("Creating FAISS index...")
+    report = report or BuildReport()
     
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
     
     try:
         # Initialize embeddings model
-        embeddings_model = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
-        logger.info(f"Using embedding model: {embeddings_model}")
-        
-        embeddings = OpenAIEmbeddings(
-            model=embeddings_model
-        )
+        embeddings = get_embeddings()
         
         # Create and save the FAISS index
         start_time = time.time()
         
-        # Generate embeddings and create the vector store
-        vectorstore = FAISS.from_documents(
-            document_splits, 
-            embeddings
-        )
+        # Generate embeddings (resuming from the checkpoint if a previous
+        # run was interrupted) and create the vector store
+        checkpoint = checkpoint or get_checkpoint(output_dir)
+        with report.stage("embed"):
+            vectors = embed_splits(document_splits, embeddings, checkpoint, report)
         
-        # Save the index locally
-        vectorstore.save_local(output_dir)
+        index_options = dict(index_options or {})
+        reduction = index_options.pop("reduction", "none")
+        dimensions = index_options.pop("dimensions", None)
+        projection = None
+        if reduction != "none":
+            with report.stage("reduce"):
+                projection = Projection.fit(vectors, reduction, dimensions)
+                report.extra["reduction"] = {**projection.describe(), **evaluate_reduction(vectors, projection)}
+                logger.info(f"Reduced {vectors.shape[1]} to {dimensions} dimensions: {report.extra['reduction']}")
+                vectors = projection.apply(vectors)
+        
+        with report.stage("index"):
+            index, index_params = build_ann_index(vectors, index_type, index_options)
+            if projection is not None:
+                index_params.update(projection.describe())
+                projection.save(output_dir)
+            vectorstore = FAISS(embeddings, index, InMemoryDocstore(), {})
+            vectorstore.add_embeddings(
+                list(zip([split.page_content for split in document_splits], vectors)),
+                metadatas=[split.metadata for split in document_splits],
+                ids=ids
+            )
+            
+            # Save the index locally; the checkpoint is no longer needed
+            save_vectorstore(vectorstore, output_dir)
+            save_index_params(output_dir, index_params)
+            if index_params["rerank_factor"]:
+                save_rerank_vectors(vectors, output_dir)
+            checkpoint.clear()
+        report.extra["index"] = index_params
+        
+        if index_params["quantization"] != "none" or index_params["rerank_factor"]:
+            compression = evaluate_compression(index, vectors, index_params["rerank_factor"])
+            report.extra["compression"] = compression
+            logger.info(f"{index_params['quantization']} storage: {compression}")
         
         elapsed_time = time.time() - start_time
         logger.info(f"Index created and saved to {output_dir} in {elapsed_time:.2f} seconds.")
@@ -185,26 +652,390 @@ def create_index(document_splits: List[Document], output_dir: str = OUTPUT_DIR)
         logger.error(f"Error creating index: {e}")
         raise
 
+def update_index(
+    new_splits: List[Document],
+    new_ids: List[str],
+    removed_ids: List[str],
+    output_dir: str = OUTPUT_DIR,
+    report: Optional[BuildReport] = None,
+    source_dir: Optional[str] = None,
+    checkpoint: Optional[BuildCheckpoint] = None
+) -> None:
+    """
+    Apply an incremental change set to a saved FAISS index.
+    Embeds only `new_splits`, deletes the vectors of `removed_ids` and saves
+    the index to `output_dir`. The index is read from `source_dir` (default:
+    `output_dir`), so a new version can be written next to the one in use.
+    Re-ranking vectors, if the index has them, are updated the same way.
+    """
+    logger.info(f"Updating FAISS index: {len(new_ids)} chunks to add, {len(removed_ids)} to remove...")
+    report = report or BuildReport()
+    start_time = time.time()
+    
+    source_dir = source_dir or output_dir
+    embeddings = get_embeddings()
+    checkpoint = checkpoint or get_checkpoint(output_dir)
+    vectors = None
+    if new_splits:
+        with report.stage("embed"):
+            vectors = embed_splits(new_splits, embeddings, checkpoint, report)
+    
+    with report.stage("index"):
+        vectorstore = load_vectorstore(source_dir, embeddings, mmap=False, lazy=False, rerank=False)
+        projection = Projection.load(source_dir)
+        if projection is not None:
+            # New chunks are reduced with the projection the index was built with
+            projection.save(output_dir)
+            if vectors is not None:
+                vectors = projection.apply(vectors)
+        rerank_path = os.path.join(source_dir, RERANK_VECTORS_FILE)
+        rerank_vectors = np.load(rerank_path) if os.path.exists(rerank_path) else None
+        
+        if removed_ids:
+            if rerank_vectors is not None:
+                # delete() removes these positions and shifts the rest down
+                positions = {chunk_id: position for position, chunk_id in vectorstore.index_to_docstore_id.items()}
+                rerank_vectors = np.delete(rerank_vectors, [positions[chunk_id] for chunk_id in removed_ids], axis=0)
+            vectorstore.delete(removed_ids)
+        if new_splits:
+            vectorstore.add_embeddings(
+                list(zip([split.page_content for split in new_splits], vectors)),
+                metadatas=[split.metadata for split in new_splits],
+                ids=new_ids
+            )
+            if rerank_vectors is not None:
+                rerank_vectors = np.vstack([rerank_vectors, vectors])
+        
+        save_vectorstore(vectorstore, output_dir)
+        if rerank_vectors is not None:
+            save_rerank_vectors(rerank_vectors, output_dir)
+        if source_dir != output_dir:
+            save_index_params(output_dir, load_index_params(source_dir))
+        checkpoint.clear()
+    
+    elapsed_time = time.time() - start_time
+    logger.info(f"Index updated and saved to {output_dir} in {elapsed_time:.2f} seconds.")
+
+def build_full(
+    settings: Dict[str, Any],
+    directory: str = DATA_DIR,
+    output_dir: str = OUTPUT_DIR,
+    workers: Optional[int] = None,
+    report: Optional[BuildReport] = None,
+    domain: Optional[str] = None
+) -> bool:
+    """
+    Load, split and embed the whole corpus (or one `domain` of it), write the
+    index and its manifest to a new version directory under `output_dir` and
+    publish it. Returns False if there was nothing to index.
+    """
+    files = list_corpus_files(directory, domain)
+    document_splits = load_and_split(files, settings, workers, report, directory)
+    if not document_splits:
+        logger.error("No documents found. Aborting.")
+        return False
+    
+    document_splits = prepare_chunks(document_splits, settings, directory, report)
+    ids = [split.metadata["chunk_id"] for split in document_splits]
+    
+    version_dir = new_version_dir(output_dir)
+    try:
+        create_index(
+            document_splits,
+            version_dir,
+            ids,
+            report,
+            settings.get("index_type", DEFAULT_INDEX_TYPE),
+            settings.get("index_options"),
+            get_checkpoint(output_dir)
+        )
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    
+    manifest = {"version": MANIFEST_VERSION, "settings": settings, "files": {}}
+    chunks_by_file = _group_chunk_ids(document_splits, directory)
+    for file_path in files:
+        rel = relative_source(file_path, directory)
+        manifest["files"][rel] = {
+            "hash": file_hash(file_path),
+            "chunks": chunks_by_file.get(rel, []),
+        }
+    save_manifest(manifest, version_dir)
+    publish(output_dir, version_dir)
+    return True
+
+def build_incremental(
+    manifest: Dict[str, Any],
+    directory: str = DATA_DIR,
+    output_dir: str = OUTPUT_DIR,
+    workers: Optional[int] = None,
+    report: Optional[BuildReport] = None,
+    domain: Optional[str] = None
+) -> bool:
+    """
+    Re-embed only what changed since the manifest was written (in `domain`,
+    for a shard).
+    
+    Files whose hash is unchanged are skipped entirely. Changed and new files
+    are re-split; only chunks whose ids are not already in the index are
+    embedded, and chunks that disappeared (from changed or deleted files) are
+    removed from the index.
+    """
+    settings = manifest["settings"]
+    old_files = manifest["files"]
+    current_dir = resolve_index_dir(output_dir)
+    
+    current_hashes = {relative_source(path, directory): (path, file_hash(path)) for path in list_corpus_files(directory, domain)}
+    changed = [path for rel, (path, digest) in current_hashes.items()
+               if old_files.get(rel, {}).get("hash") != digest]
+    deleted = [rel for rel in old_files if rel not in current_hashes]
+    
+    logger.info(f"Incremental build: {len(changed)} new or changed files, {len(deleted)} deleted, "
+                f"{len(current_hashes) - len(changed)} unchanged.")
+    if not changed and not deleted:
+        logger.info("Index is up to date.")
+        return True
+    
+    # Near-duplicates are only collapsed within the changed files here;
+    # a --full rebuild deduplicates across the whole corpus
+    document_splits = load_and_split(changed, settings, workers, report, directory)
+    document_splits = prepare_chunks(document_splits, settings, directory, report)
+    chunks_by_file = _group_chunk_ids(document_splits, directory)
+    
+    removed_ids = []
+    for rel in deleted:
+        removed_ids.extend(old_files.pop(rel)["chunks"])
+    
+    existing_ids = set()
+    for path in changed:
+        rel = relative_source(path, directory)
+        old_chunks = old_files.get(rel, {}).get("chunks", [])
+        new_chunks = chunks_by_file.get(rel, [])
+        new_chunk_set = set(new_chunks)
+        removed_ids.extend(chunk_id for chunk_id in old_chunks if chunk_id not in new_chunk_set)
+        existing_ids.update(chunk_id for chunk_id in old_chunks if chunk_id in new_chunk_set)
+        old_files[rel] = {"hash": current_hashes[rel][1], "chunks": new_chunks}
+    
+    # Only a flat index renumbers its vectors on removal the way the
+    # LangChain docstore mapping expects (and HNSW cannot remove at all), so
+    # ANN indexes are rebuilt; unchanged chunks come from the embedding cache
+    index_type = settings.get("index_type", DEFAULT_INDEX_TYPE)
+    if removed_ids and index_type != "flat":
+        logger.info(f"{len(removed_ids)} chunks to remove from the {index_type} index, doing a full rebuild.")
+        if report is not None:
+            report.mode = "full"
+        return build_full(settings, directory, output_dir, workers, report, domain)
+    
+    new_splits = [split for split in document_splits if split.metadata["chunk_id"] not in existing_ids]
+    new_ids = [split.metadata["chunk_id"] for split in new_splits]
+    
+    version_dir = new_version_dir(output_dir)
+    try:
+        update_index(new_splits, new_ids, removed_ids, version_dir, report, current_dir, get_checkpoint(output_dir))
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    save_manifest(manifest, version_dir)
+    publish(output_dir, version_dir)
+    return True
+
+def publish(output_dir: str, version_dir: str) -> None:
+    """
+    Make a fully written version the current index and prune old versions.
+    Running API processes pick it up with a hot swap (see backend.chains.registry).
+    """
+    publish_version(output_dir, version_dir)
+    prune_versions(output_dir, INDEX_KEEP_VERSIONS)
+
+def build_index(
+    settings: Dict[str, Any],
+    directory: str = DATA_DIR,
+    output_dir: str = OUTPUT_DIR,
+    workers: Optional[int] = None,
+    full: bool = False,
+    domain: Optional[str] = None
+) -> Optional[BuildReport]:
+    """
+    Build or incrementally update the index root `output_dir`, fully when
+    `full` is set, there is no manifest or the settings changed.
+    Returns the build report, or None if there was nothing to index.
+    """
+    manifest = None if full else load_manifest(resolve_index_dir(output_dir))
+    if manifest and manifest.get("settings") != settings:
+        logger.info(f"Build settings of {output_dir} changed since the last build, doing a full rebuild.")
+        manifest = None
+    if manifest and not os.path.exists(os.path.join(resolve_index_dir(output_dir), DOCSTORE_FILE)):
+        # Built before the SQLite docstore: its pickled docstore is not loaded
+        logger.info(f"{output_dir} has no {DOCSTORE_FILE}, doing a full rebuild.")
+        manifest = None
+    
+    report = BuildReport("incremental" if manifest else "full", settings)
+    if manifest:
+        built = build_incremental(manifest, directory, output_dir, workers, report, domain)
+    else:
+        built = build_full(settings, directory, output_dir, workers, report, domain)
+    return report if built else None
+
+def _build_shard(args: Tuple) -> Optional[Dict[str, Any]]:
+    """Build one shard in a worker process and return its report."""
+    settings, directory, output_dir, workers, full, domain = args
+    report = build_index(settings, directory, shard_root(output_dir, domain), workers, full, domain)
+    if report is None:
+        return None
+    report.write(os.path.join(shard_root(output_dir, domain), REPORT_FILE))
+    return report.to_dict()
+
+def build_sharded(
+    settings: Dict[str, Any],
+    directory: str = DATA_DIR,
+    output_dir: str = OUTPUT_DIR,
+    workers: Optional[int] = None,
+    full: bool = False,
+    domains: Optional[List[str]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Build one index per corpus domain under `output_dir`/shards, in parallel
+    processes, then make `output_dir` serve them.
+    
+    Each shard is an index root of its own (versions, manifest, checkpoint),
+    so rebuilding one domain (`domains`) leaves the other shards untouched,
+    and the API hot-swaps each shard independently.
+    
+    Returns:
+        The build report of every shard that was built, by domain
+    """
+    all_domains = list_domains(directory)
+    domains = domains or all_domains
+    unknown = sorted(set(domains) - set(all_domains))
+    if unknown:
+        raise ValueError(f"No documents for domains {unknown} in {directory}")
+    
+    # The loaders of all shards share the CPUs
+    shard_workers = max(1, (workers or os.cpu_count() or 1) // len(domains))
+    logger.info(f"Building {len(domains)} shards in parallel: {domains}")
+    jobs = [(settings, directory, output_dir, shard_workers, full, domain) for domain in domains]
+    with ProcessPoolExecutor(max_workers=len(domains)) as executor:
+        results = dict(zip(domains, executor.map(_build_shard, jobs)))
+    
+    published = [domain for domain in all_domains if current_version(shard_root(output_dir, domain))]
+    publish_shards(output_dir, published)
+    return {domain: report for domain, report in results.items() if report is not None}
+
+def _group_chunk_ids(document_splits: List[Document], directory: str = DATA_DIR) -> Dict[str, List[str]]:
+    """Group chunk ids by relative source path, preserving split order."""
+    chunks_by_file: Dict[str, List[str]] = {}
+    for split in document_splits:
+        rel = relative_source(split.metadata.get("source", ""), directory)
+        chunks_by_file.setdefault(rel, []).append(split.metadata["chunk_id"])
+    return chunks_by_file
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Build the RAG index")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifest and rebuild the whole index from scratch")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes used to load the corpus (default: CPU count)")
+    parser.add_argument("--chunk-unit", choices=CHUNK_UNITS, default="chars",
+                        help="Measure chunk size and overlap in characters or in embedding model tokens")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help=f"Chunk size (default: {DEFAULT_CHUNK_SIZE} chars or {DEFAULT_TOKEN_CHUNK_SIZE} tokens)")
+    parser.add_argument("--chunk-overlap", type=int, default=None,
+                        help=f"Chunk overlap (default: {DEFAULT_CHUNK_OVERLAP} chars or {DEFAULT_TOKEN_CHUNK_OVERLAP} tokens)")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_DEDUP_THRESHOLD,
+                        help=f"Estimated Jaccard similarity above which chunks are merged (default: {DEFAULT_DEDUP_THRESHOLD})")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Disable near-duplicate chunk elimination")
+    parser.add_argument("--quality-profile", choices=sorted(QUALITY_PROFILES), default=DEFAULT_QUALITY_PROFILE,
+                        help=f"Chunk pruning profile (default: {DEFAULT_QUALITY_PROFILE})")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE,
+                        help=f"FAISS index structure (default: {INDEX_TYPE}, set with FAISS_INDEX_TYPE)")
+    parser.add_argument("--nlist", type=int, default=None,
+                        help="Number of IVF lists for ivf_flat/ivf_pq (default: about 4*sqrt(chunks))")
+    parser.add_argument("--nprobe", type=int, default=None,
+                        help="IVF lists probed per query, saved with the index")
+    parser.add_argument("--hnsw-m", type=int, default=None,
+                        help="Neighbours per HNSW node")
+    parser.add_argument("--ef-search", type=int, default=None,
+                        help="HNSW candidate list size per query, saved with the index")
+    parser.add_argument("--pq-m", type=int, default=None,
+                        help="Number of IVF-PQ sub-quantizers (must divide the embedding dimension)")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None,
+                        help="Store vectors as fp16 or int8 in flat/ivf_flat/hnsw indexes (default: none)")
+    parser.add_argument("--rerank-factor", type=int, default=None,
+                        help="Re-rank k*N candidates with the float32 vectors (default: 4 when quantized, 0 disables)")
+    parser.add_argument("--dimensions", type=int, default=None,
+                        help="Index vectors at this reduced dimension (queries are projected the same way)")
+    parser.add_argument("--reduction", choices=REDUCTIONS[1:], default="truncate",
+                        help="How --dimensions reduces the vectors: keep the leading dimensions, like the "
+                             "API's dimensions parameter of text-embedding-3 models, or a PCA fitted on the corpus")
+    parser.add_argument("--shard-by-domain", action="store_true",
+                        help="Build one index per corpus domain, in parallel, searched together by the API")
+    parser.add_argument("--shards", nargs="+", default=None,
+                        help="With --shard-by-domain, rebuild only these domains (default: all)")
+    parser.add_argument("--report", type=str, default=None,
+                        help=f"Path of the JSON build report (default: {REPORT_FILE} in the index directory)")
+    return parser.parse_args()
+
 def main():
     """Main function to build the RAG index."""
+    args = parse_arguments()
+    
+    # Check if API key is set
+    if not os.getenv('OPENAI_API_KEY'):
+        logger.error("OPENAI_API_KEY environment variable is not set. Make sure it's in your .env file.")
+        sys.exit(1)
+    
     try:
-        # Load documents
-        documents = load_documents()
-        if not documents:
-            logger.error("No documents found. Aborting.")
-            return
+        if args.chunk_unit == "tokens":
+            default_size, default_overlap = DEFAULT_TOKEN_CHUNK_SIZE, DEFAULT_TOKEN_CHUNK_OVERLAP
+        else:
+            default_size, default_overlap = DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
         
-        # Split documents
-        document_splits = split_documents(documents)
+        settings = build_settings(
+            os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small"),
+            args.chunk_size or default_size,
+            args.chunk_overlap if args.chunk_overlap is not None else default_overlap,
+            args.chunk_unit,
+            None if args.no_dedup else args.dedup_threshold,
+            args.quality_profile,
+            args.index_type,
+            {
+                key: value for key, value in {
+                    "nlist": args.nlist,
+                    "nprobe": args.nprobe,
+                    "hnsw_m": args.hnsw_m,
+                    "ef_search": args.ef_search,
+                    "pq_m": args.pq_m,
+                    "quantization": args.quantization,
+                    "rerank_factor": args.rerank_factor,
+                    "reduction": args.reduction if args.dimensions else None,
+                    "dimensions": args.dimensions,
+                }.items() if value is not None
+            }
+        )
         
-        # Create and save the index
-        create_index(document_splits)
+        report_path = args.report or os.path.join(OUTPUT_DIR, REPORT_FILE)
+        if args.shard_by_domain:
+            reports = build_sharded(settings, workers=args.workers, full=args.full, domains=args.shards)
+            os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump({"mode": "sharded", "shards": reports}, f, indent=2)
+        else:
+            report = build_index(settings, workers=args.workers, full=args.full)
+            if report is None:
+                return
+            unpublish_shards(OUTPUT_DIR)
+            report.write(report_path)
         
         logger.info("RAG index built successfully!")
         
     except Exception as e:
         logger.error(f"Error building RAG index: {e}")
+        if os.path.exists(os.path.join(OUTPUT_DIR, CHECKPOINT_DIR)):
+            logger.info("Completed embedding batches were checkpointed; run the build again to resume.")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+from langchain_core.documents import Document
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import psutil
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REPORT_FILE = "build_report.json"
+
+# USD per 1M tokens, overridable with EMBEDDING_PRICE_PER_1M
+EMBEDDING_PRICES_PER_1M = {
+    "text-embedding-3-small": 0.02,
+    "text-embedding-3-large": 0.13,
+    "text-embedding-ada-002": 0.10,
+}
+
+# Seconds between memory samples while a stage runs
+RSS_SAMPLE_INTERVAL = 0.05
+
+def _cpu_seconds() -> float:
+    """CPU time of this process plus its reaped children (e.g. loader workers)."""
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (not of the current stage), in MB."""
+    if resource is None:
+        return psutil.Process().memory_info().rss / 1e6
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+def _rss_bytes(process: psutil.Process) -> int:
+    """Resident set size of a process plus its children (e.g. loader workers)."""
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            # The child exited between listing and reading it
+            pass
+    return rss
+
+class _RssSampler:
+    """Thread sampling the RSS of this process tree, to find the peak of one stage."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = _rss_bytes(self.process)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes(self.process))
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> float:
+        """Stop sampling and return the peak in MB."""
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes(self.process))
+        return self.peak / 1e6
+
+def domain_of(document: Document, directory: str) -> str:
+    """Return the corpus domain of a document (its top-level directory under the corpus)."""
+    source = document.metadata.get("source", "")
+    rel = os.path.relpath(source, directory).replace(os.sep, "/")
+    return rel.split("/", 1)[0] if "/" in rel else "unknown"
+
+class BuildReport:
+    """
+    Machine-readable report of one index build.
+
+    Collects per-stage wall time, CPU time and peak RSS (sampled while the
+    stage runs, including worker processes), document/chunk/token counts
+    per corpus domain and embedding usage, and writes them as JSON.
+    A stage can be entered several times (e.g. once per loaded batch); its
+    times are accumulated.
+    """
+
+    def __init__(self, mode: str = "full", settings: Optional[Dict[str, Any]] = None):
+        self.started_at = datetime.now(timezone.utc)
+        self.start_time = time.perf_counter()
+        self.mode = mode
+        self.settings = settings or {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.domains: Dict[str, Dict[str, int]] = {}
+        self.embedding: Dict[str, Any] = {}
+        self.extra: Dict[str, Any] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure a block of work as part of stage `name`."""
+        wall = time.perf_counter()
+        cpu = _cpu_seconds()
+        sampler = _RssSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            peak_rss_mb = sampler.stop()
+            stage = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_mb": 0.0})
+            stage["wall_seconds"] += time.perf_counter() - wall
+            stage["cpu_seconds"] += _cpu_seconds() - cpu
+            stage["peak_rss_mb"] = max(stage["peak_rss_mb"], peak_rss_mb)
+
+    def count(self, key: str, documents: List[Document], directory: str, tokens_key: Optional[str] = None) -> None:
+        """
+        Add `documents` to the per-domain counter `key`.
+        With `tokens_key`, their `token_count` metadata is summed as well.
+        """
+        for document in documents:
+            domain = self.domains.setdefault(domain_of(document, directory), {})
+            domain[key] = domain.get(key, 0) + 1
+            if tokens_key:
+                domain[tokens_key] = domain.get(tokens_key, 0) + document.metadata.get("token_count", 0)
+
+    def add_embedding_stats(self, stats: Dict[str, Any], model: str, cache_stats: Optional[Dict[str, int]] = None) -> None:
+        """
+        Accumulate batcher stats and estimate the cost of the embedding API usage.
+
+        The batcher counts every text submitted to it. With `cache_stats`
+        (the embedding cache's counters during the batcher run), only the
+        cache misses reached the API, so `api` and the cost are based on them.
+        """
+        for key in ("texts", "tokens", "batches", "requests", "rate_limited"):
+            self.embedding[key] = self.embedding.get(key, 0) + stats.get(key, 0)
+
+        if cache_stats:
+            cache = self.embedding.setdefault("cache", {"hits": 0, "misses": 0})
+            cache["hits"] += cache_stats["hits"]
+            cache["misses"] += cache_stats["misses"]
+            usage = {"texts": cache_stats["misses"], "tokens": cache_stats["miss_tokens"], "requests": cache_stats["requests"]}
+        else:
+            usage = {key: stats.get(key, 0) for key in ("texts", "tokens", "requests")}
+        api = self.embedding.setdefault("api", {"texts": 0, "tokens": 0, "requests": 0})
+        for key, value in usage.items():
+            api[key] += value
+
+        price = float(os.getenv("EMBEDDING_PRICE_PER_1M", EMBEDDING_PRICES_PER_1M.get(model, 0.0)))
+        self.embedding["model"] = model
+        self.embedding["price_per_1m_tokens"] = price
+        self.embedding["estimated_cost_usd"] = round(api["tokens"] / 1e6 * price, 6)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the report as a JSON-serializable dict."""
+        return {
+            "started_at": self.started_at.isoformat(),
+            "mode": self.mode,
+            "settings": self.settings,
+            "total_wall_seconds": time.perf_counter() - self.start_time,
+            "process_peak_rss_mb": _peak_rss_mb(),
+            "stages": self.stages,
+            "domains": self.domains,
+            "embedding": self.embedding,
+            **self.extra,
+        }
+
+    def write(self, path: str) -> None:
+        """Write the report as JSON."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info(f"Build report written to {path}")
@@ -0,0 +1,101 @@
+import os
+import json
+import shutil
+import logging
+from typing import List, Dict
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = "journal.jsonl"
+
+class BuildCheckpoint:
+    """
+    On-disk shards of completed embedding batches plus a progress journal.
+
+    Every completed batch is written as a `.npy` shard and then recorded in
+    an append-only journal with the chunk ids it contains. A restarted build
+    reads the journal, reuses the vectors of every recorded shard and only
+    embeds the remaining chunks. Chunk ids are content-addressed, so vectors
+    are reused even if the corpus changed between runs. The checkpoint is
+    discarded when the embedding model differs, and cleared once the index
+    has been saved.
+    """
+
+    def __init__(self, checkpoint_dir: str, embedding_model: str):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            checkpoint_dir: Directory for shards and journal
+            embedding_model: Model the vectors were computed with
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.embedding_model = embedding_model
+        self.journal_path = os.path.join(checkpoint_dir, JOURNAL_FILE)
+        self.next_shard = 0
+
+    def load(self) -> Dict[str, np.ndarray]:
+        """
+        Load the vectors of every shard recorded in the journal.
+        Returns a mapping of chunk id to vector (empty if there is no usable checkpoint).
+        """
+        if not os.path.exists(self.journal_path):
+            return {}
+
+        vectors: Dict[str, np.ndarray] = {}
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, json.JSONDecodeError):
+            header = {}
+        if header.get("embedding_model") != self.embedding_model:
+            logger.warning(f"Discarding checkpoint in {self.checkpoint_dir}: it was built with a different embedding model")
+            self.clear()
+            return {}
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+                shard = np.load(os.path.join(self.checkpoint_dir, entry["file"]))
+            except Exception as e:
+                # A torn last line or missing shard: everything before it is still good
+                logger.warning(f"Ignoring unreadable checkpoint entry: {e}")
+                continue
+            vectors.update(zip(entry["ids"], shard))
+            self.next_shard = max(self.next_shard, entry["shard"] + 1)
+
+        logger.info(f"Resuming from checkpoint: {len(vectors)} embeddings in {self.next_shard} shards")
+        return vectors
+
+    def save_batch(self, ids: List[str], vectors: List[List[float]]) -> None:
+        """Persist one completed batch as a shard and record it in the journal."""
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        if not os.path.exists(self.journal_path):
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"embedding_model": self.embedding_model}) + "\n")
+
+        shard = self.next_shard
+        self.next_shard += 1
+        file_name = f"shard_{shard:06d}.npy"
+        tmp_path = os.path.join(self.checkpoint_dir, file_name + ".tmp")
+
+        # Write the shard completely before the journal mentions it
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(vectors, dtype=np.float32))
+        os.replace(tmp_path, os.path.join(self.checkpoint_dir, file_name))
+
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"shard": shard, "file": file_name, "ids": ids}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self) -> None:
+        """Remove the checkpoint directory."""
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        self.next_shard = 0
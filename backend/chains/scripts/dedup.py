@@ -0,0 +1,135 @@
+import zlib
+import logging
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.9
+NUM_PERM = 64
+NUM_BANDS = 16
+SHINGLE_SIZE = 5
+SEED = 42
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Return the set of crc32 hashes of the word `size`-grams of a text."""
+    words = text.lower().split()
+    if len(words) <= size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+class MinHasher:
+    """MinHash signatures using a multiply-shift hash family over 64-bit integers."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = SEED):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """Return the (num_perm,) MinHash signature of a set of shingle hashes."""
+        # uint64 arithmetic wraps, which is exactly the multiply-shift scheme
+        with np.errstate(over='ignore'):
+            values = (np.outer(self.a, hashes) + self.b[:, None]) >> np.uint64(32)
+        return values.min(axis=1)
+
+class _UnionFind:
+    """Minimal union-find keeping the smallest index as the root."""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+def deduplicate_chunks(
+    document_splits: List[Document],
+    threshold: float = DEFAULT_THRESHOLD,
+    num_perm: int = NUM_PERM,
+    num_bands: int = NUM_BANDS
+) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Collapse near-identical chunks to a single representative.
+
+    Chunks are MinHashed over word 5-grams and bucketed with LSH banding.
+    Candidate pairs whose estimated Jaccard similarity is at least `threshold`
+    are merged; the first chunk of each cluster (in input order) is kept and
+    the sources and URLs of the others are stored in its metadata as
+    `merged_sources` and `merged_urls`.
+
+    Args:
+        document_splits: Chunks to deduplicate
+        threshold: Minimum estimated Jaccard similarity to merge two chunks
+        num_perm: MinHash signature length
+        num_bands: Number of LSH bands (must divide num_perm)
+
+    Returns:
+        The kept chunks and a stats dict (chunks_in, chunks_out, chunks_removed,
+        tokens_saved, clusters)
+    """
+    logger.info(f"Deduplicating {len(document_splits)} chunks (threshold={threshold})...")
+    rows = num_perm // num_bands
+    hasher = MinHasher(num_perm)
+    signatures = np.vstack([hasher.signature(shingle_hashes(split.page_content)) for split in document_splits]) \
+        if document_splits else np.empty((0, num_perm), dtype=np.uint64)
+
+    # LSH: chunks sharing any band bucket become candidate pairs
+    union_find = _UnionFind(len(document_splits))
+    for band in range(num_bands):
+        buckets: Dict[bytes, int] = {}
+        band_values = signatures[:, band * rows:(band + 1) * rows]
+        for i, key in enumerate(band_values):
+            key = key.tobytes()
+            first = buckets.setdefault(key, i)
+            if first != i and union_find.find(first) != union_find.find(i):
+                if np.mean(signatures[first] == signatures[i]) >= threshold:
+                    union_find.union(first, i)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(document_splits)):
+        clusters.setdefault(union_find.find(i), []).append(i)
+
+    kept = []
+    tokens_saved = 0
+    merged_clusters = 0
+    for root, members in clusters.items():
+        representative = document_splits[root]
+        duplicates = [document_splits[i] for i in members if i != root]
+        if duplicates:
+            merged_clusters += 1
+            merged_sources = {split.metadata.get("source") for split in duplicates}
+            merged_sources.discard(representative.metadata.get("source"))
+            merged_urls = {split.metadata.get("url") for split in duplicates if split.metadata.get("url")}
+            merged_urls.discard(representative.metadata.get("url"))
+            representative.metadata["merged_sources"] = sorted(s for s in merged_sources if s)
+            representative.metadata["merged_urls"] = sorted(merged_urls)
+            tokens_saved += sum(split.metadata.get("token_count", 0) for split in duplicates)
+        kept.append((root, representative))
+
+    kept.sort(key=lambda item: item[0])
+    kept_splits = [split for _, split in kept]
+
+    stats = {
+        "chunks_in": len(document_splits),
+        "chunks_out": len(kept_splits),
+        "chunks_removed": len(document_splits) - len(kept_splits),
+        "tokens_saved": tokens_saved,
+        "clusters": merged_clusters,
+    }
+    logger.info(f"Dedup removed {stats['chunks_removed']} of {stats['chunks_in']} chunks "
+                f"({stats['tokens_saved']} tokens saved) across {merged_clusters} clusters of near-duplicates.")
+    return kept_splits, stats
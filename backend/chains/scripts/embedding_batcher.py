@@ -0,0 +1,177 @@
+import time
+import random
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Callable
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+from backend.chains.embeddings import CachedEmbeddings, count_tokens_batch
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Defaults sized for the OpenAI embeddings endpoint (max 2048 inputs and
+# ~300k tokens per request)
+DEFAULT_BATCH_TOKENS = 100_000
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+MAX_RETRIES = 6
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+def pack_batches(token_counts: List[int], max_tokens: int, max_size: int) -> List[List[int]]:
+    """
+    Pack item indices into consecutive batches bounded by total tokens and item count.
+    An item larger than `max_tokens` gets a batch of its own.
+    """
+    batches = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After header of a rate limit error, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class EmbeddingBatcher:
+    """
+    Concurrent, token-budgeted embedding of many texts.
+
+    Texts are packed into batches bounded by token count, up to `concurrency`
+    batches are sent at once, and rate limit (429) errors are retried with
+    exponential backoff, honouring Retry-After when the API sends it.
+    Throughput is logged as batches complete.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+        max_batch_size: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            embeddings: Embeddings model (its async API is used)
+            model: Embedding model name, used to pick the tokenizer
+            max_batch_tokens: Maximum tokens per request
+            max_batch_size: Maximum texts per request
+            concurrency: Maximum number of requests in flight
+        """
+        self.embeddings = embeddings
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.stats: Dict[str, Any] = {}
+
+    async def _embed_batch(self, texts: List[str], token_counts: List[int], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        """Embed one batch, retrying on rate limit errors."""
+        async with semaphore:
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    self.stats["requests"] += 1
+                    if isinstance(self.embeddings, CachedEmbeddings):
+                        # Lets the cache count the tokens of its misses without tokenizing
+                        return await self.embeddings.aembed_documents(texts, token_counts)
+                    return await self.embeddings.aembed_documents(texts)
+                except openai.RateLimitError as e:
+                    self.stats["rate_limited"] += 1
+                    if attempt == MAX_RETRIES:
+                        raise
+                    delay = _retry_after(e) or min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)
+                    delay += random.uniform(0, delay * 0.1)
+                    logger.warning(f"Rate limited, retrying batch of {len(texts)} in {delay:.1f}s "
+                                   f"(attempt {attempt + 1}/{MAX_RETRIES})")
+                    await asyncio.sleep(delay)
+
+    async def aembed(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None,
+        on_batch: Optional[Callable[[List[int], List[List[float]]], None]] = None
+    ) -> List[List[float]]:
+        """
+        Embed all texts, returning vectors in input order.
+
+        `token_counts` can be passed when the caller already knows them (e.g.
+        from chunk metadata) to skip tokenizing again. `on_batch` is called
+        with the text indices and vectors of every completed batch, e.g. to
+        checkpoint progress.
+
+        After the call `self.stats` holds the totals: texts, tokens, batches,
+        requests, rate_limited, seconds, tokens_per_second.
+        """
+        if token_counts is None:
+            token_counts = count_tokens_batch(texts, self.model)
+        batches = pack_batches(token_counts, self.max_batch_tokens, self.max_batch_size)
+        total_tokens = sum(token_counts)
+
+        self.stats = {
+            "texts": len(texts),
+            "tokens": total_tokens,
+            "batches": len(batches),
+            "requests": 0,
+            "rate_limited": 0,
+        }
+        logger.info(f"Embedding {len(texts)} texts ({total_tokens} tokens) in {len(batches)} batches, "
+                    f"{self.concurrency} in flight")
+
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start_time = time.time()
+        done_texts = 0
+        done_tokens = 0
+
+        async def run(batch: List[int]):
+            result = await self._embed_batch([texts[i] for i in batch], [token_counts[i] for i in batch], semaphore)
+            return batch, result
+
+        for finished in asyncio.as_completed([run(batch) for batch in batches]):
+            batch, result = await finished
+            for i, vector in zip(batch, result):
+                vectors[i] = vector
+            if on_batch is not None:
+                on_batch(batch, result)
+
+            done_texts += len(batch)
+            done_tokens += sum(token_counts[i] for i in batch)
+            elapsed = max(time.time() - start_time, 1e-9)
+            logger.info(f"Embedded {done_texts}/{len(texts)} texts "
+                        f"({done_tokens / elapsed:,.0f} tokens/s, {done_texts / elapsed:,.1f} texts/s)")
+
+        elapsed = time.time() - start_time
+        self.stats["seconds"] = elapsed
+        self.stats["tokens_per_second"] = total_tokens / elapsed if elapsed > 0 else 0.0
+        return vectors
+
+    def embed(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None,
+        on_batch: Optional[Callable[[List[int], List[List[float]]], None]] = None
+    ) -> List[List[float]]:
+        """Synchronous entry point for scripts."""
+        return asyncio.run(self.aembed(texts, token_counts, on_batch))
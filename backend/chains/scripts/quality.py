@@ -0,0 +1,100 @@
+import re
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Words that show up together on navigation/footer boilerplate
+BOILERPLATE_PATTERNS = ["cookie policy", "contact us", "home", "search", "documentation"]
+
+# Pruning profiles. URL patterns are regexes matched against the chunk's URL
+# (or its source path when it has no URL).
+QUALITY_PROFILES: Dict[str, Dict[str, Any]] = {
+    "none": {
+        "exclude_url_patterns": [],
+        "drop_not_found": False,
+        "min_words": 0,
+        "max_boilerplate_hits": None,
+    },
+    "default": {
+        "exclude_url_patterns": [r"/genindex"],
+        "drop_not_found": True,
+        "min_words": 20,
+        "max_boilerplate_hits": 3,
+    },
+    "strict": {
+        "exclude_url_patterns": [r"/genindex", r"/py-modindex", r"/whatsnew/changelog", r"/search\.html"],
+        "drop_not_found": True,
+        "min_words": 40,
+        "max_boilerplate_hits": 3,
+    },
+}
+DEFAULT_PROFILE = "default"
+
+def score_chunk(chunk: Document, profile: Dict[str, Any], url_regex: Optional[re.Pattern] = None) -> Optional[str]:
+    """
+    Check one chunk against a pruning profile.
+
+    Returns the reason the chunk should be dropped, or None to keep it.
+    """
+    if url_regex is not None:
+        location = chunk.metadata.get("url") or chunk.metadata.get("source") or ""
+        if url_regex.search(location):
+            return "excluded_url"
+
+    content = chunk.page_content.lower()
+
+    # Crawled 404 pages (same check as the query-time filter this replaces)
+    if profile["drop_not_found"] and ("page not found" in content or "404" in content):
+        return "not_found"
+
+    if len(content.split()) < profile["min_words"]:
+        return "too_short"
+
+    max_hits = profile["max_boilerplate_hits"]
+    if max_hits is not None and sum(1 for pattern in BOILERPLATE_PATTERNS if pattern in content) >= max_hits:
+        return "boilerplate"
+
+    return None
+
+def prune_chunks(document_splits: List[Document], profile_name: str = DEFAULT_PROFILE) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Drop low-quality chunks (404 pages, very short chunks, navigation
+    boilerplate and URLs excluded by the profile) before they are indexed.
+
+    Args:
+        document_splits: Chunks to check
+        profile_name: Name of a profile in QUALITY_PROFILES
+
+    Returns:
+        The kept chunks and a stats dict with the number dropped per reason
+    """
+    profile = QUALITY_PROFILES[profile_name]
+    patterns = profile["exclude_url_patterns"]
+    url_regex = re.compile("|".join(f"(?:{pattern})" for pattern in patterns)) if patterns else None
+
+    kept = []
+    dropped: Dict[str, int] = {}
+    tokens_dropped = 0
+    for chunk in document_splits:
+        reason = score_chunk(chunk, profile, url_regex)
+        if reason is None:
+            kept.append(chunk)
+        else:
+            dropped[reason] = dropped.get(reason, 0) + 1
+            tokens_dropped += chunk.metadata.get("token_count", 0)
+
+    stats = {
+        "profile": profile_name,
+        "chunks_in": len(document_splits),
+        "chunks_out": len(kept),
+        "dropped": dropped,
+        "tokens_dropped": tokens_dropped,
+    }
+    logger.info(f"Quality profile '{profile_name}' dropped {len(document_splits) - len(kept)} of "
+                f"{len(document_splits)} chunks: {dropped}")
+    return kept, stats
@@ -0,0 +1,348 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from backend.chains.projection import ProjectedEmbeddings
+from backend.chains.lexical import (
+    batch_search_with_score, hybrid_search_with_score, abatch_search_with_score, ahybrid_search_with_score
+)
+from backend.chains.filters import CATEGORY_DOMAINS, chunk_domain, is_prefilter, normalize_filter
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# "keywords": search only the shards a query names (see SHARD_KEYWORDS),
+# "all": always fan out across every shard
+SHARD_ROUTING = os.getenv("INDEX_SHARD_ROUTING", "keywords")
+
+# Threads searching shards concurrently (FAISS releases the GIL while searching)
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "8"))
+
+# Words that send a query to a single domain's shard. Python questions name
+# no such word and fan out, since FastAPI and Streamlit answers may need them too.
+SHARD_KEYWORDS = {
+    "fastapi.tiangolo.com": ("fastapi", "starlette", "pydantic", "uvicorn"),
+    "docs.streamlit.io": ("streamlit",),
+}
+
+_executor = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="shard-search")
+
+def route_query(query: str, shards: List[str]) -> List[str]:
+    """
+    Pick the shards a query should search.
+
+    Args:
+        query: The user query
+        shards: Available shard names
+
+    Returns:
+        The shards whose keywords the query mentions, or all shards if it
+        mentions none (or routing is disabled)
+    """
+    if SHARD_ROUTING != "keywords":
+        return list(shards)
+    text = query.lower()
+    matched = [shard for shard in shards if any(word in text for word in SHARD_KEYWORDS.get(shard, ()))]
+    return matched or list(shards)
+
+def shards_for_filter(filter: Any, shards: List[str]) -> List[str]:
+    """Return the shards that can hold chunks matching a domain or category filter."""
+    if not is_prefilter(filter):
+        return list(shards)
+    normalized = normalize_filter(filter)
+    selected = list(shards)
+    if "domain" in normalized:
+        selected = [shard for shard in selected if shard in normalized["domain"]]
+    if "category" in normalized:
+        domains = {CATEGORY_DOMAINS.get(category) for category in normalized["category"]}
+        selected = [shard for shard in selected if shard in domains]
+    return selected
+
+class ShardedVectorStore(VectorStore):
+    """
+    Read-only vector store over one index per corpus domain.
+
+    A query is embedded once, routed to the relevant shards (`route_query`,
+    or the `shards` argument), searched on them concurrently and the results
+    are merged by distance. Domain and category filters skip the shards that
+    cannot match. All shards are built with the same settings, so
+    their L2 distances are comparable. Every shard is a registry handle, so
+    each one is hot-swapped independently when it is rebuilt.
+    """
+
+    def __init__(self, shards: Dict[str, VectorStore], embeddings: Embeddings):
+        """
+        Args:
+            shards: Shard name (corpus domain) -> vector store
+            embeddings: Full-size query embedder shared by the shards
+        """
+        self.shards = shards
+        self._embeddings = embeddings
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embeddings
+
+    def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+        raise NotImplementedError("Served indexes are read-only; rebuild them with build_rag.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Build indexes with build_rag.py")
+
+    def _select_relevance_score_fn(self):
+        # Shards are L2 indexes
+        return self._euclidean_relevance_score_fn
+
+    def _route(self, query: str, filter: Any) -> List[str]:
+        # An explicit filter decides the shards instead of the query's keywords
+        if is_prefilter(filter):
+            return list(self.shards)
+        return route_query(query, list(self.shards))
+
+    def _fan_out(self, method: str, embedding: List[float], shards: Optional[List[str]], **kwargs) -> List[Tuple[Document, float]]:
+        """Call a *_by_vector method on the selected shards concurrently and merge by distance."""
+        names = [name for name in (shards or self.shards) if name in self.shards]
+        names = shards_for_filter(kwargs.get("filter"), names)
+        if not names:
+            return []
+
+        def search(name: str) -> List[Tuple[Document, float]]:
+            shard = self.shards[name]
+            vector = embedding
+            # Shards built at a reduced dimension project the query themselves
+            if isinstance(shard.embeddings, ProjectedEmbeddings):
+                vector = shard.embeddings.projection.apply([embedding])[0].tolist()
+            return getattr(shard, method)(vector, **kwargs)
+
+        if len(names) == 1:
+            results = search(names[0])
+        else:
+            results = [pair for pairs in _executor.map(search, names) for pair in pairs]
+        results.sort(key=lambda pair: pair[1])
+        return results
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Return the k nearest chunks (and their L2 distance) across the shards."""
+        return self._fan_out("similarity_search_with_score_by_vector", embedding, shards, k=k, **kwargs)[:k]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Embed the query, route it and return the k nearest chunks with their distance."""
+        shards = shards or self._route(query, kwargs.get("filter"))
+        embedding = self._embeddings.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, shards, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search several query vectors with one batched search per shard and merge per query."""
+        names = [name for name in (shards or self.shards) if name in self.shards]
+        names = shards_for_filter(kwargs.get("filter"), names)
+
+        def search(name: str) -> List[List[Tuple[Document, float]]]:
+            shard = self.shards[name]
+            vectors = embeddings
+            if isinstance(shard.embeddings, ProjectedEmbeddings):
+                vectors = shard.embeddings.projection.apply(embeddings).tolist()
+            return shard.similarity_search_with_score_by_vectors(vectors, k=k, **kwargs)
+
+        per_shard = list(_executor.map(search, names))
+        return [sorted((pair for results in per_shard for pair in results[row]), key=lambda pair: pair[1])[:k]
+                for row in range(len(embeddings))]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        """
+        Diversify within each shard, then keep the k closest of the merged
+        results. Chunks of different domains rarely repeat each other.
+        """
+        results = self._fan_out(
+            "max_marginal_relevance_search_with_score_by_vector", embedding, shards,
+            k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, **kwargs
+        )
+        return [document for document, _ in results[:k]]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        shards = shards or self._route(query, kwargs.get("filter"))
+        embedding = self._embeddings.embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(embedding, k, fetch_k, lambda_mult, shards, **kwargs)
+
+    def document_vectors(self, documents: List[Document]) -> Optional[np.ndarray]:
+        """
+        Return the indexed vectors of chunks from any shard, as one matrix.
+
+        Shards storing full-size or truncated vectors share a vector space
+        and a block of columns. A PCA shard has its own basis, so its vectors
+        get their own block and have zero cosine similarity to other shards'
+        chunks, which are of another domain anyway. None if a chunk cannot
+        be located.
+        """
+        groups: Dict[str, List[int]] = {}
+        for row, document in enumerate(documents):
+            name = self._shard_of(document)
+            if name is None:
+                return None
+            groups.setdefault(name, []).append(row)
+
+        blocks: Dict[Any, int] = {}
+        parts = []
+        width = 0
+        for name, rows in groups.items():
+            shard = self.shards[name]
+            vectors = shard.document_vectors([documents[row] for row in rows])
+            if vectors is None:
+                return None
+            space: Any = "full"
+            if isinstance(shard.embeddings, ProjectedEmbeddings):
+                projection = shard.embeddings.projection
+                space = name if projection.method == "pca" else (projection.method, projection.dimensions)
+            if space not in blocks:
+                blocks[space] = width
+                width += vectors.shape[1]
+            parts.append((rows, blocks[space], vectors))
+
+        matrix = np.zeros((len(documents), width), dtype=np.float32)
+        for rows, start, vectors in parts:
+            matrix[rows, start:start + vectors.shape[1]] = vectors
+        return matrix
+
+    def _shard_of(self, document: Document) -> Optional[str]:
+        """The shard holding a chunk: its domain, or the corpus directory in its source path."""
+        domain = chunk_domain(document.metadata)
+        if domain in self.shards:
+            return domain
+        parts = (document.metadata.get("source") or "").replace(os.sep, "/").split("/")
+        return next((name for name in parts if name in self.shards), None)
+
+    def has_lexical_index(self) -> bool:
+        return all(shard.has_lexical_index() for shard in self.shards.values())
+
+    def lexical_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Any] = None,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the k best BM25 matches across the shards. Each shard scores
+        with its own term statistics, so scores are only roughly comparable;
+        hybrid search only uses their order.
+        """
+        names = [name for name in (shards or self._route(query, filter)) if name in self.shards]
+        names = shards_for_filter(filter, names)
+
+        def search(name: str) -> List[Tuple[Document, float]]:
+            return self.shards[name].lexical_search_with_score(query, k, filter, **kwargs)
+
+        results = [pair for pairs in _executor.map(search, names) for pair in pairs]
+        results.sort(key=lambda pair: -pair[1])
+        return results[:k]
+
+    def hybrid_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """BM25 and vector search over the routed shards, fused by rank."""
+        shards = shards or self._route(query, kwargs.get("filter"))
+        return hybrid_search_with_score(self, query, k, shards=shards, **kwargs)
+
+    def hybrid_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.hybrid_search_with_score(query, k, **kwargs)]
+
+    def batch_search_with_score(
+        self,
+        queries: List[str],
+        k: int = 4,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """Several queries in one round trip, over the shards any of them is routed to."""
+        shards = shards or self._route_all(queries, kwargs.get("filter"))
+        return batch_search_with_score(self, queries, k, shards=shards, **kwargs)
+
+    def batch_search(self, queries: List[str], k: int = 4, **kwargs: Any) -> List[List[Document]]:
+        return [[document for document, _ in pairs] for pairs in self.batch_search_with_score(queries, k, **kwargs)]
+
+    def _route_all(self, queries: List[str], filter: Any) -> List[str]:
+        """Union of the shards each query is routed to."""
+        return list(dict.fromkeys(name for query in queries for name in self._route(query, filter)))
+
+    async def ahybrid_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Async version of hybrid_search_with_score."""
+        shards = shards or self._route(query, kwargs.get("filter"))
+        return await ahybrid_search_with_score(self, query, k, shards=shards, **kwargs)
+
+    async def ahybrid_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in await self.ahybrid_search_with_score(query, k, **kwargs)]
+
+    async def abatch_search_with_score(
+        self,
+        queries: List[str],
+        k: int = 4,
+        shards: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """Async version of batch_search_with_score."""
+        shards = shards or self._route_all(queries, kwargs.get("filter"))
+        return await abatch_search_with_score(self, queries, k, shards=shards, **kwargs)
+
+    async def abatch_search(self, queries: List[str], k: int = 4, **kwargs: Any) -> List[List[Document]]:
+        return [[document for document, _ in pairs] for pairs in await self.abatch_search_with_score(queries, k, **kwargs)]
+
+    def get_by_ids(self, ids) -> List[Document]:
+        return [document for shard in self.shards.values() for document in shard.get_by_ids(ids)]
@@ -0,0 +1,692 @@
+import os
+import json
+import math
+import time
+import shutil
+import pickle
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+import faiss
+import psutil
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from backend.chains.docstore import DOCSTORE_FILE, SQLiteDocstore, SQLiteIndexMapping, read_docstore
+from backend.chains.projection import Projection, ProjectedEmbeddings
+from backend.chains.filters import is_prefilter, normalize_filter, matches_filter
+from backend.chains.mmr import maximal_marginal_relevance, query_relevance
+from backend.chains.lexical import (
+    LEXICAL_DIR, LEXICAL_FILES, LexicalIndex, batch_search_with_score, hybrid_search_with_score,
+    abatch_search_with_score, ahybrid_search_with_score
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Index type and search parameters written next to index.faiss by build_rag.py
+INDEX_PARAMS_FILE = "index_params.json"
+
+# Exact float32 vectors kept next to a quantized index for re-ranking
+RERANK_VECTORS_FILE = "vectors.npy"
+
+# Versioned layout: every build writes <index root>/versions/<version>/ and
+# then points the CURRENT file at it
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+
+# Sharded layout: one index root per corpus domain under <index root>/shards/,
+# served together while <index root>/shards.json lists them
+SHARDS_DIR = "shards"
+SHARDS_FILE = "shards.json"
+
+# Memory-map the index file instead of reading it into the heap, so that
+# several workers on one machine share the vectors through the page cache
+INDEX_MMAP = os.getenv("FAISS_MMAP", "").lower() in ("1", "true", "yes")
+
+# Indexes built before the SQLite docstore only have a pickled docstore
+# (index.pkl). Unpickling runs arbitrary code, so it is refused unless this
+# is set for a trusted index that cannot be rebuilt yet
+ALLOW_PICKLED_DOCSTORE = os.getenv("ALLOW_PICKLED_DOCSTORE", "").lower() in ("1", "true", "yes")
+
+# Search parameters that can be overridden at load time, by env var
+SEARCH_PARAM_ENV = {
+    "nprobe": "FAISS_NPROBE",
+    "ef_search": "FAISS_EF_SEARCH",
+}
+
+# Upper bound of the HNSW candidate list when a filter widens it
+MAX_FILTERED_EF_SEARCH = 1024
+
+# Filters matching at most this many vectors scan them instead of walking
+# the HNSW graph, which would mostly visit filtered-out nodes
+FILTER_SCAN_MAX = 4096
+
+# Files read through the page cache before an index takes traffic, and the read size
+PREFAULT_FILES = ("index.faiss", RERANK_VECTORS_FILE, DOCSTORE_FILE,
+                  *(os.path.join(LEXICAL_DIR, name) for name in LEXICAL_FILES))
+PREFAULT_BLOCK = 4 * 1024 * 1024
+
+# Names used by faiss.ParameterSpace for our search parameters
+_FAISS_PARAM_NAMES = {
+    "nprobe": "nprobe",
+    "ef_search": "efSearch",
+}
+
+def current_version(index_root: str) -> Optional[str]:
+    """Return the version the CURRENT pointer of an index root names, or None."""
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def resolve_index_dir(index_root: str) -> str:
+    """
+    Return the directory holding the current index files of an index root.
+    Roots built before versioning hold the files directly and are returned as is.
+    """
+    version = current_version(index_root)
+    if version is None:
+        return index_root
+    return os.path.join(index_root, VERSIONS_DIR, version)
+
+def new_version_dir(index_root: str) -> str:
+    """Create and return an empty, not yet published, version directory."""
+    version = time.strftime("%Y%m%dT%H%M%S") + f"-{int(time.time() * 1e6) % 1000000:06d}"
+    path = os.path.join(index_root, VERSIONS_DIR, version)
+    os.makedirs(path)
+    return path
+
+def publish_version(index_root: str, version_dir: str) -> None:
+    """Atomically point CURRENT at a fully written version directory."""
+    pointer = os.path.join(index_root, CURRENT_FILE)
+    with open(pointer + ".tmp", 'w', encoding='utf-8') as f:
+        f.write(os.path.basename(version_dir) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    logger.info(f"Published index version {os.path.basename(version_dir)}")
+
+def prune_versions(index_root: str, keep: int) -> List[str]:
+    """
+    Delete all but the `keep` newest versions, never the current one.
+    Workers still using a deleted version keep their open files until they swap.
+    Returns the deleted versions.
+    """
+    versions_path = os.path.join(index_root, VERSIONS_DIR)
+    if not os.path.isdir(versions_path):
+        return []
+    current = current_version(index_root)
+    versions = sorted(os.listdir(versions_path), reverse=True)
+    kept = {current} | set(versions[:max(keep, 1)])
+    deleted = [version for version in versions if version not in kept]
+    for version in deleted:
+        shutil.rmtree(os.path.join(versions_path, version), ignore_errors=True)
+    if deleted:
+        logger.info(f"Pruned old index versions: {deleted}")
+    return deleted
+
+def shard_root(index_root: str, shard: str) -> str:
+    """Return the index root of one shard (itself versioned like any index root)."""
+    return os.path.join(index_root, SHARDS_DIR, shard)
+
+def list_shards(index_root: str) -> Optional[List[str]]:
+    """Return the shards an index root serves, or None if it is not sharded."""
+    try:
+        with open(os.path.join(index_root, SHARDS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)["shards"]
+    except FileNotFoundError:
+        return None
+
+def publish_shards(index_root: str, shards: List[str]) -> None:
+    """Atomically make an index root serve the given (already published) shards."""
+    path = os.path.join(index_root, SHARDS_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"shards": sorted(shards)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    logger.info(f"Published shards {sorted(shards)}")
+
+def unpublish_shards(index_root: str) -> None:
+    """Serve the unsharded index of an index root again (after a monolithic build)."""
+    path = os.path.join(index_root, SHARDS_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+        logger.info(f"{index_root} now serves its unsharded index; the shards are kept")
+
+def load_index_params(index_dir: str) -> Dict[str, Any]:
+    """
+    Read the index parameters saved with an index.
+    Indexes built before index types were configurable have no file and are flat.
+    """
+    path = os.path.join(index_dir, INDEX_PARAMS_FILE)
+    if not os.path.exists(path):
+        return {"index_type": "flat"}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_index_params(index_dir: str, params: Dict[str, Any]) -> None:
+    """Write the index parameters next to the index."""
+    with open(os.path.join(index_dir, INDEX_PARAMS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(params, f, indent=2)
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Set the search-time parameters (nprobe for IVF, efSearch for HNSW) on a
+    loaded FAISS index. Env vars in SEARCH_PARAM_ENV override the saved values.
+    Returns the parameters that were applied.
+    """
+    applied = {}
+    parameter_space = faiss.ParameterSpace()
+    for name, env_var in SEARCH_PARAM_ENV.items():
+        value = os.getenv(env_var) or params.get(name)
+        if value is None:
+            continue
+        parameter_space.set_index_parameter(index, _FAISS_PARAM_NAMES[name], int(value))
+        applied[name] = int(value)
+    return applied
+
+def mmap_flags(index_type: str) -> int:
+    """
+    FAISS read flags that memory-map an index of the given type read-only.
+    IVF indexes map their inverted lists; flat and HNSW indexes map their
+    vector storage in place.
+    """
+    if index_type.startswith("ivf"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+def memory_usage() -> Dict[str, Any]:
+    """
+    Memory of this process in MB: RSS, plus PSS (shared pages split between
+    the processes mapping them) and USS (pages only this process holds) when
+    the platform reports them.
+    """
+    process = psutil.Process()
+    usage: Dict[str, Any] = {"pid": process.pid}
+    try:
+        info = process.memory_full_info()
+    except (psutil.AccessDenied, AttributeError):
+        info = process.memory_info()
+    for field in ("rss", "pss", "uss"):
+        if hasattr(info, field):
+            usage[f"{field}_mb"] = round(getattr(info, field) / 1e6, 1)
+    return usage
+
+class RerankingIndex:
+    """
+    Wrap a quantized FAISS index and re-rank its results with exact distances.
+
+    Each search fetches `rerank_factor` times more candidates from the
+    compressed index, recomputes their L2 distance against the float32
+    vectors and keeps the k closest. The float32 vectors are usually a
+    read-only memory map of vectors.npy, so only the candidate rows are
+    paged in. Everything else (ntotal, d, ...) is forwarded to the index.
+    """
+
+    def __init__(self, index: faiss.Index, vectors: np.ndarray, rerank_factor: int):
+        self.index = index
+        self.vectors = vectors
+        self.rerank_factor = rerank_factor
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "index":
+            raise AttributeError(name)
+        return getattr(self.index, name)
+
+    def search(self, queries: np.ndarray, k: int, **kwargs):
+        """Same contract as faiss.Index.search: (distances, positions), padded with inf/-1."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        _, candidates = self.index.search(queries, k * self.rerank_factor, **kwargs)
+
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, found) in enumerate(zip(queries, candidates)):
+            found = found[found != -1]
+            if len(found) == 0:
+                continue
+            # Sorted positions read the memory map sequentially
+            found = np.sort(found)
+            exact = ((np.asarray(self.vectors[found], dtype=np.float32) - query) ** 2).sum(axis=1)
+            best = np.argsort(exact)[:k]
+            distances[row, :len(best)] = exact[best]
+            positions[row, :len(best)] = found[best]
+        return distances, positions
+
+    def reconstruct(self, position: int) -> np.ndarray:
+        """Return the exact vector (used by MMR)."""
+        return np.array(self.vectors[position], dtype=np.float32)
+
+    def reconstruct_batch(self, positions: np.ndarray) -> np.ndarray:
+        """Return the exact vectors at several positions."""
+        return np.array(self.vectors[np.asarray(positions, dtype=np.int64)], dtype=np.float32)
+
+def filtered_search(index: Any, vectors: np.ndarray, k: int, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search only the vectors at `positions`, with a FAISS ID selector.
+
+    ANN indexes only look at part of the corpus, so when a filter keeps a
+    fraction of the vectors, IVF probes (and HNSW explores) proportionally
+    more to still find k matching neighbours. Small id sets on HNSW are
+    scanned in its vector storage instead.
+
+    Args:
+        index: FAISS index, possibly wrapped in a RerankingIndex
+        vectors: (n, d) float32 queries
+        k: Number of results per query
+        positions: Sorted FAISS positions the results must come from
+
+    Returns:
+        Distances and positions, like faiss.Index.search
+    """
+    selector = faiss.IDSelectorBatch(positions)
+    base = index.index if isinstance(index, RerankingIndex) else index
+    selectivity = len(positions) / base.ntotal
+    searcher = index
+    if isinstance(base, faiss.IndexIVF):
+        nprobe = min(base.nlist, math.ceil(base.nprobe / selectivity))
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    elif isinstance(base, faiss.IndexHNSW) and len(positions) <= FILTER_SCAN_MAX:
+        params = faiss.SearchParameters(sel=selector)
+        searcher = faiss.downcast_index(base.storage)
+        if isinstance(index, RerankingIndex):
+            searcher = RerankingIndex(searcher, index.vectors, index.rerank_factor)
+    elif isinstance(base, faiss.IndexHNSW):
+        ef_search = min(MAX_FILTERED_EF_SEARCH, math.ceil(base.hnsw.efSearch / selectivity))
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return searcher.search(vectors, k, params=params)
+
+class PrefilteredFAISS(FAISS):
+    """
+    FAISS vector store that applies category, domain and URL prefix filters
+    inside the FAISS search.
+
+    `filter={"category": "FastAPI"}` (or "domain", "url_prefix", each a value
+    or a list of alternatives) is resolved to the id sets stored in the
+    SQLite docstore and passed to FAISS as an ID selector, so the k results
+    all match and no over-fetching is needed. Other filters, and docstores
+    without id sets, fall back to LangChain's filtering of fetched results.
+
+    Indexes built with a BM25 index (`lexical`) also answer lexical and
+    hybrid searches (see lexical.hybrid_search_with_score), with the same filters.
+
+    MMR searches reconstruct all candidate vectors with one batched call and
+    select with mmr.maximal_marginal_relevance, instead of LangChain's
+    per-candidate lookups and pairwise loop.
+
+    Every search resolves its result positions to chunk ids with one batched
+    lookup (`_docstore_ids`) and fetches the chunks with another, so a
+    SQLite docstore costs two queries per search rather than one per result.
+    """
+
+    lexical: Optional[LexicalIndex] = None
+    # Version directory the store was loaded from (set by load_vectorstore)
+    index_dir: Optional[str] = None
+    _docstore_positions: Optional[Dict[str, int]] = None
+
+    def _create_filter_func(self, filter):
+        # Used by LangChain's post-filtering paths (MMR, old docstores)
+        if is_prefilter(filter):
+            normalized = normalize_filter(filter)
+            return lambda metadata: matches_filter(metadata, normalized)
+        return super()._create_filter_func(filter)
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Any] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        results = self.similarity_search_with_score_by_vectors([embedding], k, filter, fetch_k, **kwargs)[0]
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            results = [(document, score) for document, score in results if score <= score_threshold]
+        return results
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Any] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Search several query vectors with one FAISS search over the query
+        matrix, and fetch the chunks of all results with one docstore lookup.
+
+        Returns:
+            Per query, up to k (document, L2 distance) pairs, closest first
+        """
+        positions = self._filter_positions(filter)
+        if (positions is not None and len(positions) == 0) or self.index.ntotal == 0:
+            return [[] for _ in embeddings]
+        post_filter = self._create_filter_func(filter) if filter is not None and positions is None else None
+
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        search_k = max(k, fetch_k) if post_filter else k
+        if positions is None or len(positions) == self.index.ntotal:
+            # No filter, or e.g. a category filter on that category's shard
+            scores, indices = self.index.search(vectors, search_k)
+        else:
+            scores, indices = filtered_search(self.index, vectors, search_k, positions)
+
+        found = [int(i) for i in np.unique(indices) if i != -1]
+        documents = dict(zip(found, self._get_documents(self._docstore_ids(found))))
+        results = []
+        for row_scores, row_indices in zip(scores, indices):
+            pairs = [(documents[int(i)], float(score)) for i, score in zip(row_indices, row_scores)
+                     if i != -1 and documents[int(i)] is not None]
+            if post_filter:
+                pairs = [(document, score) for document, score in pairs if post_filter(document.metadata)]
+            results.append(pairs[:k])
+        return results
+
+    def max_marginal_relevance_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        *,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Any] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Pick k diverse chunks out of the fetch_k nearest ones.
+
+        Returns:
+            (document, L2 distance) pairs, in the order MMR picked them
+        """
+        positions = self._filter_positions(filter)
+        if (positions is not None and len(positions) == 0) or self.index.ntotal == 0:
+            return []
+        # Filters without id sets are applied to fetched chunks, like LangChain does
+        post_filter = self._create_filter_func(filter) if filter is not None and positions is None else None
+
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        search_k = fetch_k * 2 if post_filter else fetch_k
+        if positions is None or len(positions) == self.index.ntotal:
+            scores, indices = self.index.search(vector, search_k)
+        else:
+            scores, indices = filtered_search(self.index, vector, search_k, positions)
+        found = indices[0] != -1
+        candidates, distances = indices[0][found], scores[0][found]
+
+        documents = self._get_documents(self._docstore_ids(candidates))
+        keep = [i for i, document in enumerate(documents)
+                if document is not None and (post_filter is None or post_filter(document.metadata))]
+        if not keep:
+            return []
+        candidates, distances = candidates[keep], distances[keep]
+        documents = [documents[i] for i in keep]
+
+        vectors = self.index.reconstruct_batch(candidates)
+        selected = maximal_marginal_relevance(query_relevance(vector[0], vectors), vectors, k, lambda_mult)
+        return [(documents[i], float(distances[i])) for i in selected]
+
+    def document_vectors(self, documents: List[Document]) -> Optional[np.ndarray]:
+        """
+        Return the indexed vectors of chunks returned by this store, as a
+        (len(documents), d) matrix, or None if a chunk cannot be located.
+        """
+        ids = [document.id for document in documents]
+        if isinstance(self.docstore, SQLiteDocstore):
+            positions = self.docstore.positions(ids)
+        else:
+            if self._docstore_positions is None:
+                self._docstore_positions = {doc_id: position for position, doc_id in self.index_to_docstore_id.items()}
+            positions = [self._docstore_positions.get(doc_id) for doc_id in ids]
+        if any(position is None for position in positions):
+            return None
+        return self.index.reconstruct_batch(np.array(positions, dtype=np.int64))
+
+    def _docstore_ids(self, positions: Any) -> List[Optional[str]]:
+        """Chunk ids at FAISS positions, with batched queries for SQLite docstores."""
+        if isinstance(self.index_to_docstore_id, SQLiteIndexMapping):
+            return self.index_to_docstore_id.mget(positions)
+        return [self.index_to_docstore_id.get(int(position)) for position in positions]
+
+    def _get_documents(self, ids: List[Optional[str]]) -> List[Optional[Document]]:
+        if isinstance(self.docstore, SQLiteDocstore):
+            return self.docstore.mget(ids)
+        documents = [self.docstore.search(doc_id) if doc_id is not None else None for doc_id in ids]
+        return [document if isinstance(document, Document) else None for document in documents]
+
+    def _filter_positions(self, filter: Optional[Any]) -> Optional[np.ndarray]:
+        """Positions matching a prefilter, from the docstore's id sets; None if it cannot be resolved."""
+        if not is_prefilter(filter) or not getattr(self.docstore, "has_filters", False):
+            return None
+        # Fields are combined with AND, values of one field with OR
+        positions = None
+        for field, values in normalize_filter(filter).items():
+            matched = self.docstore.filter_positions(field, values)
+            positions = matched if positions is None else np.intersect1d(positions, matched, assume_unique=True)
+        return positions
+
+    def has_lexical_index(self) -> bool:
+        return self.lexical is not None
+
+    def lexical_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Any] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the k best BM25 matches (and their BM25 score) of a query,
+        without embedding it. Filters without id sets are applied to the
+        `fetch_k` best matches.
+        """
+        if self.lexical is None:
+            raise ValueError("This index was built without a BM25 index; rebuild it with build_rag.py")
+        positions = self._filter_positions(filter)
+        post_filter = self._create_filter_func(filter) if filter is not None and positions is None else None
+        scores, found = self.lexical.search(query, max(k, fetch_k) if post_filter else k, positions)
+
+        documents = self._get_documents(self._docstore_ids(found))
+        results = [(document, float(score)) for document, score in zip(documents, scores) if document is not None]
+        if post_filter:
+            results = [(document, score) for document, score in results if post_filter(document.metadata)]
+        return results[:k]
+
+    def hybrid_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """BM25 and vector search fused by rank; see lexical.hybrid_search_with_score."""
+        return hybrid_search_with_score(self, query, k, **kwargs)
+
+    def hybrid_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.hybrid_search_with_score(query, k, **kwargs)]
+
+    def batch_search_with_score(self, queries: List[str], k: int = 4, **kwargs: Any) -> List[List[Tuple[Document, float]]]:
+        """Retrieve chunks for several queries in one round trip; see lexical.batch_search_with_score."""
+        return batch_search_with_score(self, queries, k, **kwargs)
+
+    def batch_search(self, queries: List[str], k: int = 4, **kwargs: Any) -> List[List[Document]]:
+        return [[document for document, _ in pairs] for pairs in self.batch_search_with_score(queries, k, **kwargs)]
+
+    async def ahybrid_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Async hybrid search that does not block the event loop; see lexical.abatch_search_with_score."""
+        return await ahybrid_search_with_score(self, query, k, **kwargs)
+
+    async def ahybrid_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in await self.ahybrid_search_with_score(query, k, **kwargs)]
+
+    async def abatch_search_with_score(self, queries: List[str], k: int = 4, **kwargs: Any) -> List[List[Tuple[Document, float]]]:
+        """Async version of batch_search_with_score."""
+        return await abatch_search_with_score(self, queries, k, **kwargs)
+
+    async def abatch_search(self, queries: List[str], k: int = 4, **kwargs: Any) -> List[List[Document]]:
+        return [[document for document, _ in pairs] for pairs in await self.abatch_search_with_score(queries, k, **kwargs)]
+
+def load_vectorstore(
+    index_dir: str,
+    embeddings: Embeddings,
+    mmap: Optional[bool] = None,
+    lazy: bool = True,
+    rerank: bool = True
+) -> FAISS:
+    """
+    Load a FAISS vector store built by build_rag.py and apply its saved
+    search parameters.
+
+    Chunks are read from the SQLite docstore on demand (`lazy`), so only the
+    results of each search are materialized and no pickle is loaded. With
+    `lazy=False` the whole docstore is read into memory, for builds that
+    modify the index. With `mmap` (default: FAISS_MMAP) the vectors are
+    memory-mapped read-only instead of copied into the process. Quantized
+    indexes saved with a `rerank_factor` are wrapped in a RerankingIndex
+    over their memory-mapped vectors.npy, unless `rerank` is False. For
+    indexes built at a reduced dimension, queries are embedded at full size
+    and projected with the index's saved projection. Category, domain and
+    URL prefix filters are applied inside the search (see PrefilteredFAISS).
+    The BM25 index saved with the index, if any, is memory-mapped for
+    lexical and hybrid searches.
+
+    Indexes built before the SQLite docstore existed only have index.pkl.
+    Loading them raises an error asking for a rebuild, unless
+    ALLOW_PICKLED_DOCSTORE is set.
+
+    Args:
+        index_dir: Directory containing index.faiss and docstore.sqlite
+        embeddings: Embeddings model used for queries
+        mmap: Memory-map the index file
+        lazy: Fetch chunks from SQLite on demand
+        rerank: Re-rank results with the exact vectors when the index has them
+
+    Returns:
+        The loaded vector store
+    """
+    if mmap is None:
+        mmap = INDEX_MMAP
+    params = load_index_params(index_dir)
+    index_type = params.get("index_type", "flat")
+    index_path = os.path.join(index_dir, "index.faiss")
+    docstore_path = os.path.join(index_dir, DOCSTORE_FILE)
+    projection = Projection.load(index_dir)
+    if projection is not None:
+        embeddings = ProjectedEmbeddings(embeddings, projection)
+
+    if os.path.exists(docstore_path):
+        index = faiss.read_index(index_path, mmap_flags(index_type) if mmap else 0)
+        if lazy:
+            docstore = SQLiteDocstore(docstore_path)
+            index_to_docstore_id = docstore.index_to_docstore_id()
+        else:
+            docstore, index_to_docstore_id = read_docstore(docstore_path)
+        vectorstore = PrefilteredFAISS(embeddings, index, docstore, index_to_docstore_id)
+    else:
+        if not ALLOW_PICKLED_DOCSTORE:
+            raise ValueError(
+                f"{index_dir} has no {DOCSTORE_FILE}, only a pickled docstore, which is not loaded "
+                f"because unpickling can run arbitrary code. Rebuild the index with "
+                f"`python -m backend.chains.scripts.build_rag --full`, or set ALLOW_PICKLED_DOCSTORE=1 "
+                f"to load a trusted index until then."
+            )
+        logger.warning(f"{index_dir} has no {DOCSTORE_FILE}; loading the pickled docstore (ALLOW_PICKLED_DOCSTORE). "
+                       f"Rebuild the index to switch to the SQLite docstore.")
+        index = faiss.read_index(index_path, mmap_flags(index_type) if mmap else 0)
+        # Same layout FAISS.save_local writes; local file we created
+        with open(os.path.join(index_dir, "index.pkl"), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vectorstore = PrefilteredFAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    vectorstore.index_dir = index_dir
+    applied = apply_search_params(vectorstore.index, params)
+    if isinstance(vectorstore.index, faiss.IndexIVF):
+        # MMR reconstructs candidate vectors by position
+        vectorstore.index.make_direct_map()
+    storage = params.get("quantization", "none")
+    if projection is not None:
+        storage += f", {projection.method} to {projection.dimensions} dimensions"
+    vectorstore.lexical = LexicalIndex.load(index_dir)
+    if vectorstore.lexical is not None:
+        storage += f", BM25 over {len(vectorstore.lexical.terms)} terms"
+    vectors_path = os.path.join(index_dir, RERANK_VECTORS_FILE)
+    if rerank and params.get("rerank_factor") and os.path.exists(vectors_path):
+        vectors = np.load(vectors_path, mmap_mode="r")
+        vectorstore.index = RerankingIndex(vectorstore.index, vectors, int(params["rerank_factor"]))
+        storage += f", re-ranking x{params['rerank_factor']}"
+
+    usage = memory_usage()
+    logger.info(f"Loaded {index_type} index with {vectorstore.index.ntotal} vectors "
+                f"({'memory-mapped' if mmap else 'in memory'}, storage: {storage}, "
+                f"search parameters: {applied or 'none'}); "
+                f"worker {usage['pid']} RSS {usage.get('rss_mb')} MB, PSS {usage.get('pss_mb', 'n/a')} MB")
+    return vectorstore
+
+def prefault_index(index_dir: str) -> float:
+    """
+    Read the files of an index version once so the memory-mapped index, the
+    re-ranking vectors and the docstore are in the page cache before the
+    first query needs them. Returns the MB read.
+    """
+    total = 0
+    for name in PREFAULT_FILES:
+        path = os.path.join(index_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                read = len(f.read(PREFAULT_BLOCK))
+                if not read:
+                    break
+                total += read
+    return round(total / 1e6, 1)
+
+def run_canaries(vectorstore: Any, queries: List[str], k: int = 4) -> List[Dict[str, Any]]:
+    """
+    Run known queries through query embedding and search, timing each step.
+
+    Args:
+        vectorstore: Store to query (a FAISS store or a ShardedVectorStore)
+        queries: Canary queries
+        k: Results per query
+
+    Returns:
+        One entry per query with its embedding and search latency in ms and
+        the number of results; a canary with no results is not "ok"
+    """
+    results = []
+    for query in queries:
+        start_time = time.perf_counter()
+        embedding = vectorstore.embeddings.embed_query(query)
+        embedded = time.perf_counter()
+        found = vectorstore.similarity_search_with_score_by_vector(embedding, k=k)
+        searched = time.perf_counter()
+        results.append({
+            "query": query,
+            "embed_ms": round((embedded - start_time) * 1000, 1),
+            "search_ms": round((searched - embedded) * 1000, 1),
+            "results": len(found),
+            "ok": bool(found),
+        })
+    return results
+
+def warm_up(vectorstore: PrefilteredFAISS, num_queries: int = 8) -> None:
+    """
+    Run a few searches so the index pages (and docstore rows) a query needs
+    are resident before the store takes traffic.
+    """
+    index = vectorstore.index
+    if index.ntotal == 0:
+        return
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((num_queries, index.d)).astype(np.float32)
+    _, positions = index.search(queries, 4)
+    vectorstore._get_documents(vectorstore._docstore_ids(positions[positions != -1]))
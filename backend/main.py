@@ -2,12 +2,18 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import os
+import time
 import logging
+import threading
 import traceback
 
 from backend.models.base import Base, engine
-from backend.routes import chat, faq, quiz
+from backend.routes import chat, faq, quiz, admin
 from backend.chains import get_rag_chain
+from backend.chains.vector_index import memory_usage, INDEX_MMAP
+from backend.chains.registry import registry, INDEX_RELOAD_INTERVAL
+from backend.chains.embeddings import get_encoding
+from backend.scripts.agents.chat_rag_agent import get_rag_agent, API_MODEL, EMBEDDING_MODEL
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,14 +23,42 @@ logger = logging.getLogger(__name__)
 Base.metadata.create_all(bind=engine)
 
 # Initialize RAG chain
+rag_chain_error = None
 try:
     logger.info("Initializing RAG chain...")
     rag_chain = get_rag_chain()
     logger.info("RAG chain initialized successfully")
 except Exception as e:
+    rag_chain_error = str(e)
     logger.error(f"Error initializing RAG chain: {e}")
     logger.warning("API will start, but RAG functionality may not work properly")
 
+def warm_up_worker():
+    """
+    Prepara o worker antes do primeiro usuário: carrega os tokenizers, cria o
+    agente RAG, lê o índice para o page cache e executa as consultas canário.
+    Enquanto isso /health/ready responde 503.
+    """
+    start_time = time.time()
+    try:
+        # Os mesmos modelos que o agente usa
+        get_encoding(EMBEDDING_MODEL)
+        get_encoding(API_MODEL)
+        get_rag_agent()
+        registry.warm_up()
+        logger.info(f"Worker warmed up in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        registry.warm_status.update(state="failed", error=str(e))
+        logger.error(f"Error warming up the worker: {e}")
+
+if rag_chain_error is None:
+    threading.Thread(target=warm_up_worker, name="warm-up", daemon=True).start()
+else:
+    registry.warm_status.update(state="failed", error=rag_chain_error)
+
+# Pick up new index versions published by build_rag.py without a restart
+registry.start_watcher(INDEX_RELOAD_INTERVAL)
+
 app = FastAPI(
     title="EdTech Futura API",
     description="API para o portal educacional da EdTech Futura",
@@ -57,12 +91,39 @@ app.add_middleware(
 app.include_router(chat.router)
 app.include_router(faq.router)
 app.include_router(quiz.router)
+app.include_router(admin.router)
 
 @app.get("/health", tags=["Utils"])
 def health_check():
-    """Verifica a saúde da API."""
+    """Verifica a saúde da API; 'degraded' quando o chain de RAG não pôde ser inicializado."""
+    if rag_chain_error is not None:
+        return {"status": "degraded", "rag_chain": rag_chain_error}
     return {"status": "ok"}
 
+@app.get("/health/ready", tags=["Utils"])
+def readiness_check():
+    """
+    Prontidão do worker para o balanceador de carga: 200 quando o chain de RAG
+    foi inicializado e os índices estão carregados e aquecidos, 503 caso
+    contrário. Inclui versão, tempo de carga e estado de aquecimento de cada
+    índice e a latência das consultas canário.
+    """
+    ready = rag_chain_error is None and registry.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "rag_chain": rag_chain_error or "ok",
+            "warm_up": registry.warm_status,
+            "indexes": registry.loaded_indexes(),
+        }
+    )
+
+@app.get("/health/memory", tags=["Utils"])
+def memory_check():
+    """Memória do worker que atendeu a requisição (RSS/PSS/USS em MB), modo de carga e índices carregados."""
+    return {**memory_usage(), "index_mmap": INDEX_MMAP, "indexes": registry.loaded_indexes()}
+
 @app.get("/", tags=["Utils"])
 def root():
     """Rota raiz da API."""
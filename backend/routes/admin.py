@@ -0,0 +1,39 @@
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from backend.chains.registry import registry
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    responses={403: {"description": "Forbidden"}},
+)
+
+def require_admin_token(x_admin_token: Optional[str] = Header(default=None)):
+    """Exige o header X-Admin-Token igual a ADMIN_TOKEN; sem ADMIN_TOKEN as rotas ficam desativadas."""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Rotas de administração desativadas")
+    if x_admin_token != expected:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token de administração inválido")
+
+@router.get("/index", dependencies=[Depends(require_admin_token)])
+def index_status():
+    """Versões dos índices carregados neste worker, estado da última recarga e contadores do cache de embeddings de consultas."""
+    return {
+        "indexes": registry.loaded_indexes(),
+        "reload": registry.reload_status,
+        "query_embedding_cache": registry.embedding_cache_stats(),
+    }
+
+@router.post("/index/reload", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_admin_token)])
+def reload_index():
+    """
+    Carrega em segundo plano a versão atual do índice (ponteiro CURRENT) e a
+    troca atomicamente quando estiver pronta; as consultas em andamento
+    terminam na versão anterior.
+    """
+    started = registry.reload_in_background()
+    return {"started": started, "reload": registry.reload_status}
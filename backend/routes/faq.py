@@ -39,6 +39,7 @@ class EmailsRequest(BaseModel):
     """Modelo para requisição de emails para gerar FAQ."""
     emails: List[str]
     num_entries: Optional[int] = 5
+    category: Optional[str] = None  # Restringe o contexto: Python, FastAPI ou Streamlit
 
 class EmailImportRequest(BaseModel):
     """Modelo para requisição de importação de emails."""
@@ -137,7 +138,7 @@ def generate_faq(request: EmailsRequest, db: Session = Depends(get_db)):
     service = FAQService(db)
     
     try:
-        entries = service.generate_faq_from_emails(request.emails, request.num_entries)
+        entries = service.generate_faq_from_emails(request.emails, request.num_entries, request.category)
         return {"entries": entries}
     except Exception as e:
         raise HTTPException(
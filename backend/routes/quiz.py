@@ -62,6 +62,7 @@ class QuizGenerateRequest(BaseModel):
     topic: str
     num_questions: Optional[int] = 5
     num_alternatives: Optional[int] = 4
+    category: Optional[str] = None  # Python, FastAPI ou Streamlit
     
 class AlternativeResponse(BaseModel):
     """Modelo para resposta de alternativa."""
@@ -139,7 +140,8 @@ async def generate_quiz(request: QuizGenerateRequest, db: Session = Depends(get_
         quiz = await service.generate_quiz(
             topic=request.topic,
             num_questions=request.num_questions,
-            num_alternatives=request.num_alternatives
+            num_alternatives=request.num_alternatives,
+            category=request.category
         )
         if not quiz:
             raise HTTPException(
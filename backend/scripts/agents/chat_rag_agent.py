@@ -2,6 +2,7 @@ import os
 import sys
 import logging
 import asyncio
+import threading
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
@@ -9,7 +10,7 @@ from dotenv import load_dotenv
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
 sys.path.insert(0, project_root)
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_community.vectorstores import FAISS
 from langchain.agents import AgentExecutor, Tool
 from langchain.agents.openai_functions_agent.base import OpenAIFunctionsAgent
@@ -20,6 +21,8 @@ from langchain.schema import Document
 from langchain.memory import ConversationBufferMemory
 from langchain.schema.runnable import RunnablePassthrough
 
+from backend.chains.registry import get_embeddings, get_vectorstore
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -32,13 +35,14 @@ INDEX_DIR = os.path.join(project_root, "data/index")
 API_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 EMBEDDING_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
 TEMPERATURE = 0.0  # Low temperature for factual responses
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "6000"))  # Token budget for retrieved chunks in a prompt
 
 class RagAgentTools:
     """Tools for the RAG Agent."""
     
     def __init__(self):
         """Initialize the RAG agent tools."""
-        self.embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+        self.embeddings = get_embeddings(EMBEDDING_MODEL)
         self.vector_store = self._load_vector_store()
         self.last_retrieved_docs = []  # Store the last retrieved documents
         
@@ -50,52 +54,23 @@ class RagAgentTools:
             raise FileNotFoundError(f"RAG index not found at {INDEX_DIR}. Please run build_rag.py first.")
         
         try:
-            vector_store = FAISS.load_local(
-                INDEX_DIR,
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+            # Shared with RagChain through the registry: loaded once per process
+            vector_store = get_vectorstore(INDEX_DIR, EMBEDDING_MODEL)
             logger.info("FAISS index loaded successfully")
             return vector_store
         except Exception as e:
             logger.error(f"Error loading FAISS index: {e}")
             raise
     
-    def _filter_low_quality_documents(self, docs: List[Document]) -> List[Document]:
-        """Filter out low-quality documents like 404 pages or very short content."""
-        filtered_docs = []
-        
-        for doc in docs:
-            content = doc.page_content.lower()
-            
-            # Skip documents that appear to be 404 pages
-            if "page not found" in content or "404" in content:
-                continue
-                
-            # Skip very short documents
-            if len(content.split()) < 20:  # At least 20 words
-                continue
-                
-            # Skip documents with suspicious patterns of being non-content
-            suspicious_patterns = ["cookie policy", "contact us", "home", "search", "documentation"]
-            if sum(1 for pattern in suspicious_patterns if pattern in content) >= 3:
-                continue
-                
-            filtered_docs.append(doc)
-        
-        # If we've filtered everything, return the original set rather than nothing
-        if not filtered_docs and docs:
-            logger.warning("All documents were filtered out. Using original documents as fallback.")
-            return docs
-            
-        return filtered_docs
-    
     def get_retrieval_tool(self) -> Tool:
         """Get a tool for retrieving relevant documentation."""
+        # The coroutine is used when the agent runs with ainvoke, so the
+        # retrieval does not block the event loop
         return Tool(
             name="retrieve_relevant_documents",
             description="Retrieve relevant documentation chunks based on the query. Use this to find information about Python, FastAPI, and Streamlit.",
-            func=self.retrieve_relevant_documents
+            func=self.retrieve_relevant_documents,
+            coroutine=self.aretrieve_relevant_documents
         )
     
     def get_search_tool(self) -> Tool:
@@ -103,7 +78,8 @@ class RagAgentTools:
         return Tool(
             name="semantic_search",
             description="Search for information in the documentation using a semantic query.",
-            func=self.semantic_search
+            func=self.semantic_search,
+            coroutine=self.asemantic_search
         )
     
     def retrieve_relevant_documents(self, query: str, k: int = 5) -> str:
@@ -118,43 +94,49 @@ class RagAgentTools:
             A formatted string containing the retrieved documents with metadata
         """
         try:
-            # Retrieve more documents than needed to then filter
-            initial_k = max(10, k * 2)
-            
             if not self.vector_store:
                 logger.error("Vector store initialization failed.")
                 return "Error: Vector store not available"
             
-            documents = self.vector_store.similarity_search(query, k=initial_k)
-            
-            # Filter low-quality documents
-            filtered_docs = self._filter_low_quality_documents(documents)
-            
-            # If all documents were filtered out, use the original documents as fallback
-            if not filtered_docs and documents:
-                logger.warning("All documents were filtered out. Using original documents as fallback.")
-                filtered_docs = documents[:k]  # Use only the top k original documents
-            else:
-                # Limit to the requested k documents
-                filtered_docs = filtered_docs[:k]
-            
-            # Log source information with metadata
-            for doc in filtered_docs:
-                source = doc.metadata.get("source", "Unknown")
-                title = doc.metadata.get("title", "No title")
-                url = doc.metadata.get("url", "No URL")
-                summary = doc.metadata.get("summary", "No summary")
-                logger.info(f"Retrieved document: {title} | {url}")
-            
-            # Store the documents for later use in process_query
-            self.last_retrieved_docs = filtered_docs
+            # Low-quality chunks are pruned when the index is built, so the
+            # top k results can be used as they are. With RETRIEVAL_MODE=hybrid
+            # the search also matches API names typed verbatim
+            documents = self.vector_store.hybrid_search(query, k=k)
+            return self._format_retrieved_documents(documents)
+        except Exception as e:
+            logger.error(f"Error retrieving documents: {e}")
+            return f"Error retrieving relevant documents: {str(e)}"
+    
+    async def aretrieve_relevant_documents(self, query: str, k: int = 5) -> str:
+        """
+        Async version of retrieve_relevant_documents: the query is embedded with
+        the async API and the search runs on a bounded thread pool.
+        """
+        try:
+            if not self.vector_store:
+                logger.error("Vector store initialization failed.")
+                return "Error: Vector store not available"
             
-            # Format the documents into a prompt
-            return self._create_prompt_with_sources(filtered_docs)
+            documents = await self.vector_store.ahybrid_search(query, k=k)
+            return self._format_retrieved_documents(documents)
         except Exception as e:
             logger.error(f"Error retrieving documents: {e}")
             return f"Error retrieving relevant documents: {str(e)}"
     
+    def _format_retrieved_documents(self, documents: List[Document]) -> str:
+        """Log and remember the retrieved documents and format them for the agent."""
+        # Log source information with metadata
+        for doc in documents:
+            title = doc.metadata.get("title", "No title")
+            url = doc.metadata.get("url", "No URL")
+            logger.info(f"Retrieved document: {title} | {url}")
+        
+        # Store the documents for later use in process_query
+        self.last_retrieved_docs = documents
+        
+        # Format the documents into a prompt
+        return self._create_prompt_with_sources(documents)
+    
     def semantic_search(self, query: str) -> str:
         """
         Search for information in the vector store using a semantic query.
@@ -166,33 +148,42 @@ class RagAgentTools:
             A string containing the search results
         """
         try:
-            # Get more documents initially since we'll filter some out
-            docs = self.vector_store.similarity_search(query, k=8)
-            
-            # Filter out low-quality documents
-            filtered_docs = self._filter_low_quality_documents(docs)
-            
-            # Store the documents for later use in process_query
-            self.last_retrieved_docs = filtered_docs[:3]
-            
-            # Take the top 3 remaining docs
-            filtered_docs = filtered_docs[:3]
-            
-            if not filtered_docs:
-                return "No relevant information found in our knowledge base. I'll answer based on my general knowledge."
-                
-            return self._create_prompt_with_sources(filtered_docs)
-            
+            # Low-quality chunks are pruned at index time
+            documents = self.vector_store.hybrid_search(query, k=3)
+            return self._format_search_results(documents)
+        except Exception as e:
+            logger.error(f"Error in semantic search: {e}")
+            return f"Error searching documentation: {str(e)}"
+    
+    async def asemantic_search(self, query: str) -> str:
+        """Async version of semantic_search."""
+        try:
+            documents = await self.vector_store.ahybrid_search(query, k=3)
+            return self._format_search_results(documents)
         except Exception as e:
             logger.error(f"Error in semantic search: {e}")
             return f"Error searching documentation: {str(e)}"
+    
+    def _format_search_results(self, documents: List[Document]) -> str:
+        # Store the documents for later use in process_query
+        self.last_retrieved_docs = documents
+        
+        if not documents:
+            return "No relevant information found in our knowledge base. I'll answer based on my general knowledge."
+            
+        return self._create_prompt_with_sources(documents)
 
-    def _create_prompt_with_sources(self, documents: List[Document]) -> str:
+    def _create_prompt_with_sources(self, documents: List[Document], max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
         """
         Create a prompt with sources for the LLM.
         
+        Documents are added in order until their `token_count` metadata (recorded
+        at index time) would exceed `max_tokens`. The first document is always
+        included, and documents without a token count are not budgeted.
+        
         Args:
             documents: List of retrieved documents
+            max_tokens: Token budget for the documents' content
             
         Returns:
             A prompt with sources
@@ -201,8 +192,16 @@ class RagAgentTools:
             return "No relevant documentation was found for this query."
             
         prompt_parts = ["I found the following relevant information:"]
+        used_tokens = 0
         
         for i, doc in enumerate(documents, 1):
+            token_count = doc.metadata.get("token_count")
+            if token_count is not None:
+                if i > 1 and used_tokens + token_count > max_tokens:
+                    logger.info(f"Context budget of {max_tokens} tokens reached, using {i - 1} of {len(documents)} documents")
+                    break
+                used_tokens += token_count
+            
             # Extract metadata
             title = doc.metadata.get("title", f"Document {i}")
             url = doc.metadata.get("url", "No URL provided")
@@ -384,10 +383,13 @@ Remember that your primary goal is to provide accurate, helpful answers based on
 
 # Singleton instance
 _agent_instance = None
+_agent_lock = threading.Lock()
 
 def get_rag_agent():
     """Get a singleton instance of the ChatRagAgent."""
     global _agent_instance
     if _agent_instance is None:
-        _agent_instance = ChatRagAgent()
+        with _agent_lock:
+            if _agent_instance is None:
+                _agent_instance = ChatRagAgent()
     return _agent_instance 
\ No newline at end of file
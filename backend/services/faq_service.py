@@ -120,12 +120,14 @@ class FAQService:
         self.db.commit()
         return True
     
-    def generate_faq_from_emails(self, emails: List[str], num_entries: int = 5) -> List[FAQEntry]:
+    def generate_faq_from_emails(self, emails: List[str], num_entries: int = 5,
+                                 category: Optional[str] = None) -> List[FAQEntry]:
         """Gera entradas de FAQ a partir de emails de suporte.
         
         Args:
             emails: Lista de emails com dúvidas
             num_entries: Número de entradas a serem geradas
+            category: Restringe o contexto a uma categoria (Python, FastAPI, Streamlit)
             
         Returns:
             Lista de entradas de FAQ geradas
@@ -138,14 +140,14 @@ class FAQService:
         
         for topic in topics:
             # Obter contexto relevante da documentação
-            context = self.rag_agent.get_context_for_faq(topic)
+            context = self.rag_agent.get_context_for_faq(topic, category=category)
             
             # Gerar resposta com RAG
-            question, answer, category, source = self._generate_faq_entry(topic, context)
+            question, answer, entry_category, source = self._generate_faq_entry(topic, context)
             
             # Criar entrada
             if question and answer:
-                entry = self.create_entry(question, answer, source, category)
+                entry = self.create_entry(question, answer, source, entry_category)
                 created_entries.append(entry)
         
         return created_entries
@@ -110,12 +110,16 @@ class NewRagService:
                 "duration_ms": (time.time() - start_time) * 1000
             }
     
-    async def get_relevant_context(self, topic: str, max_docs: int = 5) -> List[Dict[str, str]]:
+    async def get_relevant_context(self, topic: str, max_docs: int = 5, category: Optional[str] = None,
+                                   candidates: Optional[int] = None) -> List[Dict[str, str]]:
         """Gets relevant context for a topic.
         
         Args:
             topic: The topic to search for
             max_docs: Maximum number of documents to return
+            category: Restrict the search to a category (Python, FastAPI, Streamlit)
+            candidates: Pick the max_docs most diverse documents (maximal marginal
+                relevance) out of this many candidates, instead of the max_docs closest
             
         Returns:
             List of documents with content and source
@@ -126,8 +130,12 @@ class NewRagService:
             # Get the RAG agent tools
             tools = self.rag_agent.tools
             
-            # Use the semantic search to get context
-            docs = tools.vector_store.similarity_search(topic, k=max_docs)
+            # Vector search, or BM25 + vector with RETRIEVAL_MODE=hybrid
+            # The category filter is applied inside both searches, so
+            # scoped queries still return max_docs chunks
+            search_filter = {"category": category} if category else None
+            # Async embedding and a bounded search pool: the event loop keeps serving
+            docs = await tools.vector_store.ahybrid_search(topic, k=max_docs, filter=search_filter, candidates=candidates)
             
             # Format into the expected response structure
             context = []
@@ -141,4 +149,38 @@ class NewRagService:
         
         except Exception as e:
             logger.error(f"Error getting relevant context: {e}")
-            return [] 
\ No newline at end of file
+            return []
+    
+    async def get_relevant_contexts(self, topics: List[str], max_docs: int = 5, category: Optional[str] = None,
+                                    candidates: Optional[int] = None) -> List[List[Dict[str, str]]]:
+        """Gets relevant context for several topics in one retrieval round trip.
+        
+        The topics are embedded with one batched request and searched with one
+        FAISS search over all of them. A chunk found for an earlier topic is not
+        repeated for a later one, which gets its next best chunks instead.
+        
+        Args:
+            topics: The topics to search for
+            max_docs: Maximum number of documents to return per topic
+            category: Restrict the search to a category (Python, FastAPI, Streamlit)
+            candidates: Pick each topic's max_docs most diverse documents (maximal
+                marginal relevance) out of this many candidates, instead of the max_docs closest
+            
+        Returns:
+            Per topic, a list of documents with content and source
+        """
+        logger.info(f"Getting context for {len(topics)} topics with new RAG service: {topics}")
+        
+        try:
+            tools = self.rag_agent.tools
+            search_filter = {"category": category} if category else None
+            results = await tools.vector_store.abatch_search(topics, k=max_docs, filter=search_filter, candidates=candidates)
+            
+            return [
+                [{"content": doc.page_content, "source": doc.metadata.get("source", "Unknown")} for doc in docs]
+                for docs in results
+            ]
+        
+        except Exception as e:
+            logger.error(f"Error getting relevant contexts: {e}")
+            return [[] for _ in topics]
@@ -1,9 +1,11 @@
+import re
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 
 from backend.models.quiz import Quiz, QuizQuestion, QuizAlternative
 from backend.utils.openai_client import OpenAIClient
 from backend.services.new_rag_service import NewRagService
+from backend.chains.mmr import MMR_CANDIDATE_FACTOR
 
 class QuizService:
     """Serviço para gerenciar quizzes."""
@@ -143,79 +145,54 @@ class QuizService:
             "explanation": alternative.explanation
         }
     
-    async def generate_quiz(self, topic: str, num_questions: int = 5, num_alternatives: int = 4) -> Optional[Quiz]:
+    async def generate_quiz(self, topic: str, num_questions: int = 5, num_alternatives: int = 4,
+                            category: Optional[str] = None) -> Optional[Quiz]:
         """Gera um quiz sobre um tópico específico.
         
         Args:
             topic: Tópico do quiz
             num_questions: Número de perguntas
             num_alternatives: Número de alternativas por pergunta
+            category: Restringe o contexto a uma categoria (Python, FastAPI, Streamlit)
             
         Returns:
             Quiz gerado ou None em caso de erro
         """
         try:
         # Obter contexto relevante da documentação
-            # Fazemos múltiplas consultas com diferentes aspectos do tópico para diversificar as fontes
-            context = []
-            
-            # Primeiro, obtemos o contexto com o tópico original
-            main_context = await self.rag_agent.get_relevant_context(topic)
-            if main_context:
-                context.extend(main_context)
-            
-            # Depois, tentamos obter mais contexto com variações do tópico
-            # Isso ajuda a diversificar as fontes
-            related_topics = [
+            # O tópico original e variações dele, que ajudam a diversificar as fontes.
+            # Todas as consultas são feitas de uma vez (um único pedido de embeddings
+            # e uma única busca no índice), um trecho já encontrado por uma consulta
+            # não se repete nas seguintes, e os documentos de cada consulta são os
+            # mais diversos (MMR) entre os seus candidatos mais relevantes
+            queries = [
+                topic,
                 f"{topic} exemplos",
                 f"{topic} conceitos",
                 f"{topic} avançado",
                 f"{topic} tutorial"
             ]
+            docs_per_query = 2  # até 10 documentos, para não sobrecarregar o prompt
+            contexts = await self.rag_agent.get_relevant_contexts(
+                queries, max_docs=docs_per_query, category=category,
+                candidates=docs_per_query * MMR_CANDIDATE_FACTOR
+            )
+            # Intercalar as consultas: o melhor documento de cada uma vem primeiro
+            context = [query_context[i] for i in range(docs_per_query)
+                       for query_context in contexts if i < len(query_context)]
             
-            for related_topic in related_topics:
-                try:
-                    additional_context = await self.rag_agent.get_relevant_context(related_topic)
-                    if additional_context:
-                        context.extend(additional_context)
-                except Exception as e:
-                    print(f"Erro ao buscar contexto adicional para '{related_topic}': {str(e)}")
-            
-            # Selecionar documentos com origens diferentes para ter maior diversidade
+            # Incluir apenas fontes locais (não URLs da internet)
             diverse_context = []
-            sources = set()
-            
-            # Primeiro passo: filtrar para incluir apenas fontes locais (não URLs da internet)
-            filtered_context = []
             for doc in context:
-                source = doc['source']
-                # Verificar se a fonte é uma URL da internet (começa com http:// ou https://)
-                import re
-                if not re.match(r'^https?://', source):
-                    # Esta é uma fonte local, então a incluímos
-                    filtered_context.append(doc)
+                if re.match(r'^https?://', doc['source']):
+                    print(f"Excluindo fonte externa: {doc['source']}")
                 else:
-                    print(f"Excluindo fonte externa: {source}")
+                    diverse_context.append(doc)
             
             # Se não encontramos fontes locais, mantemos todas as fontes para não ficar sem contexto
-            if not filtered_context and context:
+            if not diverse_context and context:
                 print("Nenhuma fonte local encontrada, usando todas as fontes disponíveis")
-                filtered_context = context
-            
-            # Agora coletamos fontes únicas do contexto filtrado
-            for doc in filtered_context:
-                source = doc['source']
-                # Extrair identificador único da fonte (nome do arquivo/caminho)
-                if source not in sources:
-                    sources.add(source)
-                    diverse_context.append(doc)
-            
-            # Se ainda não temos pelo menos 3 documentos, adicionar mais do contexto filtrado
-            for doc in filtered_context:
-                if len(diverse_context) >= 5:  # limitar a 5 documentos para não sobrecarregar o prompt
-                    break
-                if doc not in diverse_context:
-                    diverse_context.append(doc)
+                diverse_context = context
         
             # Formatar o contexto
             context_text = ""
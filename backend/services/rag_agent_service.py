@@ -4,6 +4,7 @@ from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
 from backend.chains import get_rag_chain
+from backend.chains.mmr import MMR_CANDIDATE_FACTOR
 from sqlalchemy.orm import Session
 from backend.models.logging import APILog
 
@@ -85,12 +86,13 @@ class RagAgentService:
             
             raise
     
-    def get_context_for_faq(self, topic: str, max_docs: int = 5) -> List[Dict[str, str]]:
+    def get_context_for_faq(self, topic: str, max_docs: int = 5, category: Optional[str] = None) -> List[Dict[str, str]]:
         """Obtém contexto relevante para um tópico de FAQ.
         
         Args:
             topic: O tópico ou pergunta para buscar contexto
             max_docs: Número máximo de documentos a retornar
+            category: Restringe a busca a uma categoria (Python, FastAPI, Streamlit)
             
         Returns:
             Lista de documentos relevantes com conteúdo e fonte
@@ -98,17 +100,20 @@ class RagAgentService:
         logger.info(f"Getting context for FAQ: {topic}")
         
         try:
-            return self.rag_chain.get_relevant_context(topic, max_docs)
+            # Documentos diversos (MMR) entre os candidatos mais relevantes, para
+            # a resposta cobrir mais de um aspecto do tópico
+            return self.rag_chain.get_relevant_context(topic, max_docs, category, max_docs * MMR_CANDIDATE_FACTOR)
         except Exception as e:
             logger.error(f"Error getting FAQ context: {e}")
             return []
     
-    def generate_quiz_context(self, topic: str, max_docs: int = 3) -> List[Dict[str, str]]:
+    def generate_quiz_context(self, topic: str, max_docs: int = 3, category: Optional[str] = None) -> List[Dict[str, str]]:
         """Obtém contexto relevante para geração de quiz.
         
         Args:
             topic: O tópico para o quiz
             max_docs: Número máximo de documentos a retornar
+            category: Restringe a busca a uma categoria (Python, FastAPI, Streamlit)
             
         Returns:
             Lista de documentos relevantes com conteúdo e fonte
@@ -116,7 +121,7 @@ class RagAgentService:
         logger.info(f"Getting context for quiz: {topic}")
         
         try:
-            return self.rag_chain.get_relevant_context(topic, max_docs)
+            return self.rag_chain.get_relevant_context(topic, max_docs, category, max_docs * MMR_CANDIDATE_FACTOR)
         except Exception as e:
             logger.error(f"Error getting quiz context: {e}")
             return [] 
\ No newline at end of file
@@ -0,0 +1,96 @@
+import os
+import sys
+import random
+from typing import List
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from backend.chains import embeddings as embeddings_module
+from backend.chains.scripts import build_rag
+from backend.chains.vector_index import load_vectorstore, resolve_index_dir
+
+# Texts sent to the fake embedder, in call order, and the size of each call
+EMBEDDED: List[str] = []
+CALLS: List[int] = []
+
+class RecordingEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic fake embedder that records every text it embeds."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        EMBEDDED.extend(texts)
+        CALLS.append(len(texts))
+        return super().embed_documents(texts)
+
+class WhitespaceEncoding:
+    """Stand-in for a tiktoken encoding (one token per word), so tests need no encoding files."""
+
+    def encode_ordinary(self, text: str) -> List[str]:
+        return text.split()
+
+    def encode_ordinary_batch(self, texts: List[str], **kwargs) -> List[List[str]]:
+        return [text.split() for text in texts]
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return text.split()
+
+    def decode(self, tokens: List[str]) -> str:
+        return " ".join(tokens)
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    """Count tokens without downloading tiktoken's encoding files."""
+    monkeypatch.setattr(embeddings_module, "get_encoding", lambda model: WhitespaceEncoding())
+    monkeypatch.setattr(build_rag, "get_encoding", lambda model: WhitespaceEncoding())
+
+@pytest.fixture
+def embedded(monkeypatch) -> List[str]:
+    """Make the build use the fake embedder; returns the list of embedded texts."""
+    EMBEDDED.clear()
+    CALLS.clear()
+    monkeypatch.setattr(build_rag, "get_embeddings", lambda: RecordingEmbeddings(size=16))
+    return EMBEDDED
+
+def random_text(seed: int, words: int = 120) -> str:
+    """Text of random words, different for every seed."""
+    rng = random.Random(seed)
+    return " ".join("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+                    for _ in range(words))
+
+def write_corpus_file(root: str, name: str, body: str, domain: str = "docs.python.org") -> str:
+    """Write a scraped page in the corpus format (Title/URL/Summary header) and return its path."""
+    directory = os.path.join(root, domain)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"Title: {name}\nURL: https://{domain}/3/{name}\nSummary: {name}\n---\n\n{body}")
+    return path
+
+# Pages of the shared test index, per corpus domain
+DOMAIN_PAGES = {"docs.python.org": 4, "fastapi.tiangolo.com": 4, "docs.streamlit.io": 4}
+
+@pytest.fixture(scope="session")
+def index_root(tmp_path_factory) -> str:
+    """Index root with a small flat index over three domains, built once with the fake embedder."""
+    root = tmp_path_factory.mktemp("rag")
+    corpus, index_root = str(root / "corpus"), str(root / "index")
+    seed = 0
+    for domain, pages in DOMAIN_PAGES.items():
+        for page in range(pages):
+            write_corpus_file(corpus, f"page{page}.txt", random_text(seed), domain)
+            seed += 1
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(embeddings_module, "get_encoding", lambda model: WhitespaceEncoding())
+        patch.setattr(build_rag, "get_encoding", lambda model: WhitespaceEncoding())
+        patch.setattr(build_rag, "get_embeddings", lambda: RecordingEmbeddings(size=16))
+        build_rag.build_index(build_rag.build_settings("test-model", 300, 30), corpus, index_root, workers=1)
+    return index_root
+
+@pytest.fixture
+def vectorstore(index_root):
+    """The shared test index, loaded lazily from its SQLite docstore."""
+    return load_vectorstore(resolve_index_dir(index_root), RecordingEmbeddings(size=16))
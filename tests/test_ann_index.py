@@ -0,0 +1,127 @@
+import faiss
+import numpy as np
+import pytest
+
+from conftest import RecordingEmbeddings, random_text, write_corpus_file
+from backend.chains.scripts import build_rag
+from backend.chains.scripts.ann_index import (
+    build_ann_index, evaluate_compression, make_queries, DEFAULT_RERANK_FACTOR
+)
+from backend.chains.vector_index import RerankingIndex, load_vectorstore, resolve_index_dir
+
+def corpus_vectors(n: int = 2000, d: int = 32, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, d)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def recall(index, vectors: np.ndarray, k: int = 5) -> float:
+    queries = make_queries(vectors, 100)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+# Random vectors have no clusters, the worst case for IVF's default nprobe
+@pytest.mark.parametrize("index_type, index_class, min_recall", [
+    ("flat", faiss.IndexFlatL2, 1.0),
+    ("ivf_flat", faiss.IndexIVFFlat, 0.6),
+    ("hnsw", faiss.IndexHNSWFlat, 0.9),
+    ("ivf_pq", faiss.IndexIVFPQ, 0.5),
+])
+def test_builds_each_index_type(index_type, index_class, min_recall):
+    vectors = corpus_vectors()
+
+    index, params = build_ann_index(vectors, index_type)
+    index.add(vectors)
+
+    assert isinstance(index, index_class)
+    assert params["index_type"] == index_type
+    assert recall(index, vectors) >= min_recall
+
+def test_ivf_parameters_follow_corpus_size():
+    index, params = build_ann_index(corpus_vectors(), "ivf_flat", {"nprobe": 4})
+
+    assert params["nlist"] == 51  # min(4 * sqrt(2000), 2000 // 39)
+    assert index.nlist == 51 and index.nprobe == 4
+
+def test_small_corpus_falls_back_to_flat():
+    index, params = build_ann_index(corpus_vectors(n=100), "ivf_pq")
+
+    assert isinstance(index, faiss.IndexFlatL2)
+    assert params["index_type"] == "flat"
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError):
+        build_ann_index(corpus_vectors(n=10), "annoy")
+
+def test_build_saves_and_applies_search_parameters(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    for i in range(4):
+        write_corpus_file(corpus, f"page{i}.txt", random_text(i))
+    settings = build_rag.build_settings("test-model", 300, 30, index_type="hnsw", index_options={"ef_search": 40})
+
+    build_rag.build_index(settings, corpus, index_root, workers=1)
+    vectorstore = load_vectorstore(resolve_index_dir(index_root), RecordingEmbeddings(size=16))
+
+    assert isinstance(vectorstore.index, faiss.IndexHNSWFlat)
+    assert vectorstore.index.hnsw.efSearch == 40
+    first_chunk = embedded[0]
+    assert vectorstore.similarity_search(first_chunk, k=1)[0].page_content == first_chunk
+
+@pytest.mark.parametrize("index_type, quantization, index_class", [
+    ("flat", "int8", faiss.IndexScalarQuantizer),
+    ("flat", "fp16", faiss.IndexScalarQuantizer),
+    ("ivf_flat", "int8", faiss.IndexIVFScalarQuantizer),
+    ("hnsw", "int8", faiss.IndexHNSWSQ),
+])
+def test_quantized_storage(index_type, quantization, index_class):
+    index, params = build_ann_index(corpus_vectors(), index_type, {"quantization": quantization})
+
+    assert isinstance(index, index_class)
+    assert params["rerank_factor"] == DEFAULT_RERANK_FACTOR
+
+def test_pq_is_not_quantized_again():
+    with pytest.raises(ValueError):
+        build_ann_index(corpus_vectors(), "ivf_pq", {"quantization": "int8"})
+
+def test_int8_saves_memory_and_reranking_restores_recall():
+    vectors = corpus_vectors()
+    index, params = build_ann_index(vectors, "flat", {"quantization": "int8"})
+    index.add(vectors)
+
+    result = evaluate_compression(index, vectors, params["rerank_factor"], num_queries=100)
+
+    assert result["memory_saving"] >= 0.7
+    assert result["recall@5_reranked"] >= result["recall@5"]
+    assert result["recall@5_reranked"] >= 0.99
+
+def test_reranking_returns_exact_distances():
+    vectors = corpus_vectors()
+    index, _ = build_ann_index(vectors, "flat", {"quantization": "int8"})
+    index.add(vectors)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    queries = make_queries(vectors, 20)
+
+    distances, positions = RerankingIndex(index, vectors, 4).search(queries, 5)
+    exact_distances, exact_positions = exact.search(queries, 5)
+
+    np.testing.assert_array_equal(positions, exact_positions)
+    np.testing.assert_allclose(distances, exact_distances, rtol=1e-4, atol=1e-5)
+
+def test_quantized_build_reranks_on_load(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    for i in range(4):
+        write_corpus_file(corpus, f"page{i}.txt", random_text(i))
+    settings = build_rag.build_settings("test-model", 300, 30, index_options={"quantization": "int8"})
+
+    build_rag.build_index(settings, corpus, index_root, workers=1)
+    index_dir = resolve_index_dir(index_root)
+    reranked = load_vectorstore(index_dir, RecordingEmbeddings(size=16))
+    compressed = load_vectorstore(index_dir, RecordingEmbeddings(size=16), rerank=False)
+
+    assert isinstance(reranked.index, RerankingIndex)
+    assert isinstance(compressed.index, faiss.IndexScalarQuantizer)
+    first_chunk = embedded[0]
+    assert reranked.similarity_search(first_chunk, k=1)[0].page_content == first_chunk
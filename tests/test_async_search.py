@@ -0,0 +1,77 @@
+import time
+import asyncio
+from typing import List
+
+from conftest import RecordingEmbeddings
+from backend.chains import lexical
+from backend.chains.vector_index import load_vectorstore, resolve_index_dir
+from backend.scripts.agents.chat_rag_agent import RagAgentTools
+
+class AsyncOnlyEmbeddings(RecordingEmbeddings):
+    """Fake embedder whose async calls take `delay` seconds and whose sync calls fail."""
+
+    delay: float = 0.1
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise AssertionError("the async path must not call the sync embedder")
+
+    def embed_query(self, text: str) -> List[float]:
+        raise AssertionError("the async path must not call the sync embedder")
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.delay)
+        return RecordingEmbeddings.embed_documents(self, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+def async_store(index_root: str, delay: float = 0.1):
+    return load_vectorstore(resolve_index_dir(index_root), AsyncOnlyEmbeddings(size=16, delay=delay))
+
+def ids(documents):
+    return [document.id for document in documents]
+
+def test_async_searches_match_sync_ones(index_root, vectorstore):
+    store = async_store(index_root)
+    queries = ["list comprehensions", "st.cache_data", "path parameters"]
+
+    async def search():
+        return (await store.ahybrid_search(queries[0], k=4),
+                await store.abatch_search(queries, k=3, dedup=False))
+
+    single, batch = asyncio.run(search())
+
+    assert ids(single) == ids(vectorstore.hybrid_search(queries[0], k=4))
+    assert [ids(documents) for documents in batch] == [ids(vectorstore.hybrid_search(query, k=3)) for query in queries]
+
+def test_concurrent_searches_overlap(index_root):
+    store = async_store(index_root, delay=0.3)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(store.ahybrid_search("list comprehensions", k=3) for _ in range(4)))
+        return time.perf_counter() - start
+
+    # Four searches waiting on the embedding API at once, not one after the other
+    assert asyncio.run(run()) < 0.9
+
+def test_slow_embedding_falls_back_to_bm25(index_root, vectorstore, monkeypatch):
+    monkeypatch.setattr(lexical, "HYBRID_DENSE_TIMEOUT", 0.05)
+    store = async_store(index_root, delay=1.0)
+    query = " ".join(vectorstore.docstore.mget([vectorstore.index_to_docstore_id[0]])[0].page_content.split()[:5])
+
+    found = asyncio.run(store.ahybrid_search(query, k=3, mode="hybrid"))
+
+    assert found
+    assert ids(found) == ids(vectorstore.hybrid_search(query, k=3, mode="lexical"))
+
+def test_agent_tools_are_coroutines(index_root):
+    tools = RagAgentTools.__new__(RagAgentTools)
+    tools.vector_store = async_store(index_root)
+    tools.last_retrieved_docs = []
+
+    asyncio.run(tools.get_retrieval_tool().arun("list comprehensions"))
+    assert len(tools.last_retrieved_docs) == 5
+
+    asyncio.run(tools.get_search_tool().arun("list comprehensions"))
+    assert len(tools.last_retrieved_docs) == 3
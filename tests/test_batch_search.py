@@ -0,0 +1,52 @@
+from conftest import CALLS, EMBEDDED
+
+def chunk_texts(vectorstore, count: int):
+    """Texts of the first indexed chunks, used as queries that match them exactly."""
+    ids = [vectorstore.index_to_docstore_id[position] for position in range(count)]
+    return [document.page_content for document in vectorstore.docstore.mget(ids)]
+
+def ids(documents):
+    return [document.id for document in documents]
+
+def test_batch_matches_single_searches_without_dedup(vectorstore):
+    queries = chunk_texts(vectorstore, 3)
+
+    batch = vectorstore.batch_search(queries, k=4, dedup=False)
+
+    assert [ids(documents) for documents in batch] == [ids(vectorstore.hybrid_search(query, k=4)) for query in queries]
+    assert [documents[0].page_content for documents in batch] == queries
+
+def test_queries_are_embedded_with_one_request(vectorstore, embedded):
+    queries = chunk_texts(vectorstore, 3)
+
+    vectorstore.batch_search(queries, k=2)
+
+    assert EMBEDDED == queries
+    assert CALLS == [3]
+
+def test_dedup_gives_later_queries_their_next_chunks(vectorstore):
+    queries = chunk_texts(vectorstore, 1) * 3
+
+    batch = vectorstore.batch_search(queries, k=3)
+
+    found = [document_id for documents in batch for document_id in ids(documents)]
+    assert len(found) == 9 and len(set(found)) == 9
+    assert ids(batch[1]) == ids(vectorstore.hybrid_search(queries[0], k=6))[3:]
+
+def test_candidates_pick_k_of_the_best(vectorstore):
+    query = chunk_texts(vectorstore, 1)[0]
+
+    diverse = vectorstore.batch_search([query], k=3, candidates=10)[0]
+
+    assert len(diverse) == 3
+    assert diverse[0].page_content == query
+    assert set(ids(diverse)) <= set(ids(vectorstore.hybrid_search(query, k=10)))
+
+def test_filters_apply_to_every_query(vectorstore):
+    queries = chunk_texts(vectorstore, 2)
+
+    batch = vectorstore.batch_search(queries, k=3, filter={"category": "Streamlit"})
+
+    assert all(len(documents) == 3 for documents in batch)
+    assert all(document.metadata["url"].startswith("https://docs.streamlit.io/")
+               for documents in batch for document in documents)
@@ -0,0 +1,88 @@
+import os
+
+from conftest import random_text, write_corpus_file
+from backend.chains.scripts import build_rag
+from backend.chains.docstore import DOCSTORE_FILE, SQLiteDocstore
+from backend.chains.vector_index import current_version, resolve_index_dir
+
+SETTINGS = build_rag.build_settings("test-model", 300, 30)
+
+def build(corpus: str, index_root: str, full: bool = False):
+    return build_rag.build_index(SETTINGS, corpus, index_root, workers=1, full=full)
+
+def manifest_of(index_root: str) -> dict:
+    return build_rag.load_manifest(resolve_index_dir(index_root))
+
+def indexed_ids(index_root: str) -> set:
+    docstore = SQLiteDocstore(os.path.join(resolve_index_dir(index_root), DOCSTORE_FILE))
+    try:
+        return set(docstore.index_to_docstore_id().values())
+    finally:
+        docstore.close()
+
+def test_full_build_records_every_file(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    for i in range(3):
+        write_corpus_file(corpus, f"page{i}.txt", random_text(i))
+
+    report = build(corpus, index_root)
+
+    manifest = manifest_of(index_root)
+    assert report.mode == "full"
+    assert sorted(manifest["files"]) == [f"docs.python.org/page{i}.txt" for i in range(3)]
+    chunk_ids = [chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunks"]]
+    assert set(chunk_ids) == indexed_ids(index_root)
+    assert len(embedded) == len(chunk_ids)
+
+def test_unchanged_corpus_is_up_to_date(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    write_corpus_file(corpus, "page.txt", random_text(0))
+    build(corpus, index_root)
+    version = current_version(index_root)
+    embedded.clear()
+
+    report = build(corpus, index_root)
+
+    assert report.mode == "incremental"
+    assert current_version(index_root) == version
+    assert embedded == []
+
+def test_incremental_build_embeds_only_new_chunks(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    kept = write_corpus_file(corpus, "kept.txt", random_text(1))
+    changed = write_corpus_file(corpus, "changed.txt", random_text(2))
+    deleted = write_corpus_file(corpus, "deleted.txt", random_text(3))
+    build(corpus, index_root)
+    before = manifest_of(index_root)["files"]
+    embedded.clear()
+
+    # Keep the first half of changed.txt, replace the rest, delete a file and add one
+    old_body = random_text(2).split()
+    write_corpus_file(corpus, "changed.txt", " ".join(old_body[:60] + random_text(4).split()[:60]))
+    os.remove(deleted)
+    write_corpus_file(corpus, "added.txt", random_text(5))
+    report = build(corpus, index_root)
+
+    after = manifest_of(index_root)["files"]
+    assert report.mode == "incremental"
+    assert sorted(after) == ["docs.python.org/added.txt", "docs.python.org/changed.txt", "docs.python.org/kept.txt"]
+    assert after["docs.python.org/kept.txt"] == before["docs.python.org/kept.txt"]
+
+    old_changed = set(before["docs.python.org/changed.txt"]["chunks"])
+    new_changed = set(after["docs.python.org/changed.txt"]["chunks"])
+    assert old_changed & new_changed, "chunks of the unchanged half keep their ids"
+    expected = set().union(*(entry["chunks"] for entry in after.values()))
+    assert indexed_ids(index_root) == expected
+    assert not set(before["docs.python.org/deleted.txt"]["chunks"]) & indexed_ids(index_root)
+
+    new_chunks = (new_changed - old_changed) | set(after["docs.python.org/added.txt"]["chunks"])
+    assert len(embedded) == len(new_chunks)
+
+def test_changed_settings_force_a_full_build(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    write_corpus_file(corpus, "page.txt", random_text(0))
+    build(corpus, index_root)
+
+    report = build_rag.build_index(build_rag.build_settings("test-model", 200, 20), corpus, index_root, workers=1)
+
+    assert report.mode == "full"
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from conftest import RecordingEmbeddings
+from backend.chains import embeddings as embeddings_module
+from backend.chains.embeddings import CachedEmbeddings
+from backend.chains.scripts.build_report import BuildReport
+from backend.chains.scripts.embedding_batcher import EmbeddingBatcher
+
+@pytest.fixture
+def cache(tmp_path) -> CachedEmbeddings:
+    cache = CachedEmbeddings(RecordingEmbeddings(size=8), "model", str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache._conn.close()
+
+def embed_with_report(cache: CachedEmbeddings, texts, token_counts, report: BuildReport) -> None:
+    batcher = EmbeddingBatcher(cache, "model", max_batch_tokens=10)
+    before = cache.counters()
+    batcher.embed(texts, token_counts)
+    cache_stats = {key: value - before[key] for key, value in cache.counters().items()}
+    report.add_embedding_stats(batcher.stats, "text-embedding-3-small", cache_stats)
+
+def test_api_usage_counts_only_cache_misses(cache, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PRICE_PER_1M", "1000")
+    report = BuildReport()
+    embed_with_report(cache, ["a", "b", "c"], [4, 5, 6], report)
+    embed_with_report(cache, ["a", "b", "c", "d"], [4, 5, 6, 7], report)
+
+    embedding = report.embedding
+    assert embedding["texts"] == 7 and embedding["tokens"] == 37
+    assert embedding["cache"] == {"hits": 3, "misses": 4}
+    assert embedding["api"] == {"texts": 4, "tokens": 22, "requests": 3}
+    assert embedding["estimated_cost_usd"] == pytest.approx(22 / 1e6 * 1000)
+
+def test_query_misses_are_not_tokenized(cache, monkeypatch):
+    def no_tokenizer(model):
+        raise AssertionError("the query path must not load a tokenizer")
+    monkeypatch.setattr(embeddings_module, "get_encoding", no_tokenizer)
+
+    vector = cache.embed_query("how do I cache data?")
+
+    assert cache.embed_query("how do I cache data?") == pytest.approx(vector)
+    assert cache.counters() == {"hits": 1, "misses": 1, "requests": 1, "miss_tokens": 0}
+
+def test_stage_peak_rss_is_measured_per_stage():
+    report = BuildReport()
+    with report.stage("allocate"):
+        block = bytearray(200_000_000)
+        block[::4096] = b"x" * len(block[::4096])
+        time.sleep(0.2)
+    del block
+    with report.stage("idle"):
+        time.sleep(0.1)
+
+    allocate, idle = report.stages["allocate"]["peak_rss_mb"], report.stages["idle"]["peak_rss_mb"]
+    assert allocate - idle > 150
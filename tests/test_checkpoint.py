@@ -0,0 +1,49 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from conftest import RecordingEmbeddings
+from backend.chains.scripts import build_rag
+from backend.chains.scripts.checkpoint import BuildCheckpoint
+
+def test_load_returns_saved_batches(tmp_path):
+    checkpoint = BuildCheckpoint(str(tmp_path), "model")
+    checkpoint.save_batch(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    checkpoint.save_batch(["c"], [[5.0, 6.0]])
+
+    resumed = BuildCheckpoint(str(tmp_path), "model")
+    vectors = resumed.load()
+
+    assert sorted(vectors) == ["a", "b", "c"]
+    np.testing.assert_array_equal(vectors["c"], [5.0, 6.0])
+    assert resumed.next_shard == 2
+
+def test_torn_journal_line_is_ignored(tmp_path):
+    checkpoint = BuildCheckpoint(str(tmp_path), "model")
+    checkpoint.save_batch(["a"], [[1.0]])
+    with open(checkpoint.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"shard": 1, "file": "shard_0000')
+
+    assert list(BuildCheckpoint(str(tmp_path), "model").load()) == ["a"]
+
+def test_other_model_discards_checkpoint(tmp_path):
+    BuildCheckpoint(str(tmp_path / "checkpoint"), "old-model").save_batch(["a"], [[1.0]])
+
+    checkpoint = BuildCheckpoint(str(tmp_path / "checkpoint"), "new-model")
+
+    assert checkpoint.load() == {}
+    assert not (tmp_path / "checkpoint").exists()
+
+def test_embed_splits_resumes_from_checkpoint(tmp_path, embedded):
+    splits = [Document(page_content=f"chunk {i}", metadata={"chunk_id": f"id{i}"}) for i in range(6)]
+    checkpoint = BuildCheckpoint(str(tmp_path), "model")
+    full = build_rag.embed_splits(splits, RecordingEmbeddings(size=16), checkpoint)
+    assert len(embedded) == 6
+
+    # An interrupted run that had only completed the first three chunks
+    checkpoint.clear()
+    checkpoint.save_batch(["id0", "id1", "id2"], full[:3].tolist())
+    embedded.clear()
+    resumed = build_rag.embed_splits(splits, RecordingEmbeddings(size=16), BuildCheckpoint(str(tmp_path), "model"))
+
+    assert embedded == ["chunk 3", "chunk 4", "chunk 5"]
+    np.testing.assert_array_equal(resumed, full)
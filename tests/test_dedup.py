@@ -0,0 +1,64 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from conftest import random_text
+from backend.chains.scripts import build_rag
+from backend.chains.scripts.dedup import MinHasher, deduplicate_chunks, shingle_hashes
+
+def chunk(text: str, source: str, url: str = "") -> Document:
+    return Document(page_content=text, metadata={"source": source, "url": url, "token_count": 10})
+
+def jaccard(a: str, b: str) -> float:
+    first, second = set(shingle_hashes(a)), set(shingle_hashes(b))
+    return len(first & second) / len(first | second)
+
+def test_signature_agreement_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    base = random_text(0, 200).split()
+    edited = " ".join(base[:150] + random_text(1, 50).split())
+    original = " ".join(base)
+
+    estimate = np.mean(hasher.signature(shingle_hashes(original)) == hasher.signature(shingle_hashes(edited)))
+
+    assert abs(estimate - jaccard(original, edited)) < 0.1
+
+def test_near_duplicates_merge_into_first_chunk():
+    text = random_text(0)
+    near = text.replace(text.split()[-1], "changed")
+    splits = [
+        chunk(text, "a.txt", "https://h/a"),
+        chunk(random_text(1), "b.txt", "https://h/b"),
+        chunk(text, "c.txt", "https://h/c"),
+        chunk(near, "d.txt", "https://h/d"),
+    ]
+
+    kept, stats = deduplicate_chunks(splits, threshold=0.8)
+
+    assert [split.metadata["source"] for split in kept] == ["a.txt", "b.txt"]
+    assert kept[0].metadata["merged_sources"] == ["c.txt", "d.txt"]
+    assert kept[0].metadata["merged_urls"] == ["https://h/c", "https://h/d"]
+    assert "merged_sources" not in kept[1].metadata
+    assert stats == {"chunks_in": 4, "chunks_out": 2, "chunks_removed": 2, "tokens_saved": 20, "clusters": 1}
+
+def test_distinct_chunks_are_kept():
+    splits = [chunk(random_text(i), f"{i}.txt") for i in range(20)]
+
+    kept, stats = deduplicate_chunks(splits)
+
+    assert kept == splits
+    assert stats["chunks_removed"] == 0
+
+def test_empty_input():
+    assert deduplicate_chunks([]) == ([], {"chunks_in": 0, "chunks_out": 0, "chunks_removed": 0,
+                                           "tokens_saved": 0, "clusters": 0})
+
+def test_tokens_saved_are_counted_in_chars_mode():
+    text = random_text(0)
+    documents = [Document(page_content=text, metadata={"source": f"{name}.txt"}) for name in "ab"]
+    splits = build_rag.split_documents(documents, chunk_size=300, chunk_overlap=0, chunk_unit="chars")
+
+    kept, stats = deduplicate_chunks(splits)
+
+    assert all(split.metadata["token_count"] > 0 for split in splits)
+    assert stats["tokens_saved"] == sum(split.metadata["token_count"] for split in splits[len(kept):])
+    assert stats["tokens_saved"] > 0
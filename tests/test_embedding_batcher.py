@@ -0,0 +1,86 @@
+from typing import List
+
+import httpx
+import openai
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from backend.chains.scripts import embedding_batcher
+from backend.chains.scripts.embedding_batcher import EmbeddingBatcher, pack_batches
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embedder answering 429 to its first `failures` requests; records the batches it embeds."""
+
+    def __init__(self, failures: int = 0, retry_after: str = None):
+        self.failures = failures
+        self.headers = {"retry-after": retry_after} if retry_after else {}
+        self.batches: List[List[str]] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(len(text))]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.failures:
+            self.failures -= 1
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            response = httpx.Response(429, headers=self.headers, request=request)
+            raise openai.RateLimitError("Rate limit reached", response=response, body=None)
+        self.batches.append(texts)
+        return self.embed_documents(texts)
+
+@pytest.fixture
+def sleeps(monkeypatch) -> List[float]:
+    """Record backoff delays instead of sleeping."""
+    delays: List[float] = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(embedding_batcher.asyncio, "sleep", sleep)
+    return delays
+
+def test_pack_batches_respects_token_and_size_limits():
+    assert pack_batches([3, 3, 3, 5], max_tokens=6, max_size=10) == [[0, 1], [2], [3]]
+    assert pack_batches([1, 1, 1, 1, 1], max_tokens=100, max_size=2) == [[0, 1], [2, 3], [4]]
+    # An item over the budget gets a batch of its own
+    assert pack_batches([2, 10, 2], max_tokens=6, max_size=10) == [[0], [1], [2]]
+
+def test_batcher_returns_vectors_in_input_order():
+    texts = [f"text {'x' * i}" for i in range(20)]
+    embeddings = RateLimitedEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, "test-model", max_batch_tokens=10, max_batch_size=3, concurrency=4)
+
+    vectors = batcher.embed(texts, token_counts=[4] * len(texts))
+
+    assert vectors == embeddings.embed_documents(texts)
+    assert all(len(batch) <= 2 for batch in embeddings.batches)
+    assert batcher.stats["batches"] == 10 and batcher.stats["tokens"] == 80
+
+def test_batcher_retries_rate_limits(sleeps):
+    embeddings = RateLimitedEmbeddings(failures=2)
+    batcher = EmbeddingBatcher(embeddings, "test-model")
+
+    assert batcher.embed(["a", "bb"], token_counts=[1, 1]) == [[1.0], [2.0]]
+
+    assert batcher.stats["requests"] == 3 and batcher.stats["rate_limited"] == 2
+    # Exponential backoff, plus up to 10% jitter
+    assert embedding_batcher.BASE_BACKOFF <= sleeps[0] <= embedding_batcher.BASE_BACKOFF * 1.1
+    assert 2 * embedding_batcher.BASE_BACKOFF <= sleeps[1] <= 2 * embedding_batcher.BASE_BACKOFF * 1.1
+
+def test_batcher_honours_retry_after(sleeps):
+    batcher = EmbeddingBatcher(RateLimitedEmbeddings(failures=1, retry_after="7"), "test-model")
+
+    batcher.embed(["a"], token_counts=[1])
+
+    assert 7 <= sleeps[0] <= 7.7
+
+def test_batcher_gives_up_after_max_retries(sleeps):
+    embeddings = RateLimitedEmbeddings(failures=embedding_batcher.MAX_RETRIES + 1)
+    batcher = EmbeddingBatcher(embeddings, "test-model")
+
+    with pytest.raises(openai.RateLimitError):
+        batcher.embed(["a"], token_counts=[1])
+    assert len(sleeps) == embedding_batcher.MAX_RETRIES
@@ -0,0 +1,100 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from conftest import RecordingEmbeddings
+from backend.chains import embeddings as embeddings_module
+from backend.chains.embeddings import CachedEmbeddings, QueryEmbeddingCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Make the caches' clocks tick one second per reading."""
+    ticks = itertools.count(1000)
+    fake = lambda: float(next(ticks))
+    monkeypatch.setattr(embeddings_module, "time", SimpleNamespace(time=fake, monotonic=fake))
+
+def test_cache_persists_across_instances(tmp_path, embedded):
+    path = str(tmp_path / "cache.sqlite")
+    first = CachedEmbeddings(RecordingEmbeddings(size=8), "test-model", path)
+    vectors = first.embed_documents(["a", "b", "a"])
+
+    second = CachedEmbeddings(RecordingEmbeddings(size=8), "test-model", path)
+    # Vectors are stored as float32
+    np.testing.assert_allclose(second.embed_documents(["b", "a"]), [vectors[1], vectors[0]], rtol=1e-6)
+    np.testing.assert_allclose(second.embed_query("a"), vectors[0], rtol=1e-6)
+
+    # Duplicates within a call are embedded once, and nothing after the first instance
+    assert embedded == ["a", "b"]
+    assert first.counters() == {"hits": 0, "misses": 2, "requests": 1, "miss_tokens": 0}
+    assert second.counters()["hits"] == 3
+
+def test_cache_is_keyed_by_model(tmp_path, embedded):
+    path = str(tmp_path / "cache.sqlite")
+    CachedEmbeddings(RecordingEmbeddings(size=8), "model-a", path).embed_documents(["a"])
+    CachedEmbeddings(RecordingEmbeddings(size=8), "model-b", path).embed_documents(["a"])
+
+    assert embedded == ["a", "a"]
+
+def test_cache_counts_tokens_sent(tmp_path, embedded):
+    cache = CachedEmbeddings(RecordingEmbeddings(size=8), "test-model", str(tmp_path / "cache.sqlite"))
+    cache.embed_documents(["a", "b"], token_counts=[3, 5])
+    cache.embed_documents(["a", "c"], token_counts=[3, 7])
+
+    assert cache.counters() == {"hits": 1, "misses": 3, "requests": 2, "miss_tokens": 15}
+
+def test_cache_evicts_least_recently_used(tmp_path, embedded, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = CachedEmbeddings(RecordingEmbeddings(size=8), "test-model", path, max_entries=10)
+    for i in range(10):
+        cache.embed_documents([f"t{i}"])
+    cache.embed_query("t0")  # a hit makes t0 the most recently used
+
+    # Going over capacity evicts down to 90%: the two least recently used rows
+    cache.embed_documents(["t10"])
+    embedded.clear()
+    CachedEmbeddings(RecordingEmbeddings(size=8), "test-model", path).embed_documents([f"t{i}" for i in range(11)])
+
+    assert embedded == ["t1", "t2"]
+
+def test_query_cache_normalizes_queries(embedded):
+    cache = QueryEmbeddingCache(RecordingEmbeddings(size=8), "test-model")
+
+    first = cache.embed_query("How do I use FastAPI?")
+    second = cache.embed_query("  how do i   use fastapi? ")
+
+    assert first == second
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+def test_query_cache_expires_entries(embedded, clock):
+    cache = QueryEmbeddingCache(RecordingEmbeddings(size=8), "test-model", ttl=5)
+    cache.embed_queries(["a", "b"])
+    assert embedded == ["a", "b"]
+
+    cache.embed_query("a")  # two seconds after it was cached: still fresh
+    for _ in range(5):
+        cache.embed_query("c")
+    cache.embed_queries(["a", "b"])  # and later, expired
+
+    assert embedded == ["a", "b", "a", "b"]
+    assert cache.stats()["hits"] == 5
+
+def test_query_cache_evicts_least_recently_used(embedded):
+    cache = QueryEmbeddingCache(RecordingEmbeddings(size=8), "test-model", max_entries=2)
+    cache.embed_queries(["a", "b"])
+    cache.embed_query("a")  # b is now the least recently used
+
+    cache.embed_query("c")
+    embedded.clear()
+    cache.embed_queries(["a", "b", "c"])
+
+    assert embedded == ["b"]
+    assert cache.stats()["evictions"] == 2
+
+def test_query_cache_returns_copies(embedded):
+    cache = QueryEmbeddingCache(RecordingEmbeddings(size=8), "test-model")
+    vector = cache.embed_query("a")
+    vector[0] = 42.0
+
+    assert cache.embed_query("a")[0] != 42.0
@@ -0,0 +1,68 @@
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from backend.chains.docstore import SQLiteDocstore, write_docstore
+from backend.chains.filters import filter_keys, is_prefilter, matches_filter, normalize_filter, url_prefixes
+
+URLS = [
+    "https://docs.python.org/3/library/os.html",
+    "https://docs.python.org/3/tutorial/index.html",
+    "https://fastapi.tiangolo.com/tutorial/",
+    "https://docs.streamlit.io/develop/api-reference/caching",
+]
+
+def test_url_prefixes():
+    assert url_prefixes(URLS[0]) == [
+        "https://docs.python.org/", "https://docs.python.org/3/", "https://docs.python.org/3/library/"
+    ]
+    assert url_prefixes(URLS[2]) == ["https://fastapi.tiangolo.com/", "https://fastapi.tiangolo.com/tutorial/"]
+    assert url_prefixes("no-url") == []
+
+def test_filter_keys_use_the_source_path_without_url():
+    assert filter_keys({"source": "corpus/docs.streamlit.io/page.txt"}) == [
+        ("domain", "docs.streamlit.io"), ("category", "Streamlit")
+    ]
+    assert filter_keys({"source": "elsewhere/page.txt"}) == []
+
+def test_normalize_filter():
+    assert is_prefilter({"category": "fastapi", "url_prefix": "https://h/"})
+    assert not is_prefilter({"title": "x"})
+    assert not is_prefilter({})
+    assert normalize_filter({"category": "fastapi", "domain": ["a", "b"]}) == {
+        "category": ["FastAPI"], "domain": ["a", "b"]
+    }
+
+def test_matches_filter():
+    metadata = {"url": URLS[0]}
+    assert matches_filter(metadata, normalize_filter({"category": ["python", "fastapi"]}))
+    assert matches_filter(metadata, normalize_filter({"category": "python", "url_prefix": "https://docs.python.org/3/"}))
+    assert not matches_filter(metadata, normalize_filter({"category": "python", "url_prefix": "https://docs.python.org/2/"}))
+    assert not matches_filter(metadata, normalize_filter({"domain": "docs.streamlit.io"}))
+
+def write_test_docstore(path: str) -> SQLiteDocstore:
+    documents = {f"id{i}": Document(id=f"id{i}", page_content=f"text {i}", metadata={"url": url})
+                 for i, url in enumerate(URLS)}
+    write_docstore(path, InMemoryDocstore(documents), {i: f"id{i}" for i in range(len(URLS))})
+    return SQLiteDocstore(path)
+
+def test_docstore_id_sets(tmp_path):
+    docstore = write_test_docstore(str(tmp_path / "docstore.sqlite"))
+
+    assert docstore.has_filters
+    np.testing.assert_array_equal(docstore.filter_positions("category", ["Python"]), [0, 1])
+    np.testing.assert_array_equal(docstore.filter_positions("category", ["FastAPI", "Streamlit"]), [2, 3])
+    np.testing.assert_array_equal(docstore.filter_positions("url_prefix", ["https://docs.python.org/3/lib"]), [0])
+    np.testing.assert_array_equal(docstore.filter_positions("domain", ["example.com"]), [])
+    # Underscores and percent signs are matched literally
+    np.testing.assert_array_equal(docstore.filter_positions("url_prefix", ["https://docs_python.org/"]), [])
+
+def test_docstore_lookups(tmp_path):
+    docstore = write_test_docstore(str(tmp_path / "docstore.sqlite"))
+    mapping = docstore.index_to_docstore_id()
+
+    assert docstore.positions(["id2", "missing", "id0"]) == [2, None, 0]
+    assert mapping.mget([3, 7, 3]) == ["id3", None, "id3"]
+    assert mapping[1] == "id1"
+    assert dict(mapping) == {i: f"id{i}" for i in range(len(URLS))}
+    assert [document.page_content if document else None for document in docstore.mget(["id1", "x"])] == ["text 1", None]
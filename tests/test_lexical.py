@@ -0,0 +1,62 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from backend.chains.lexical import LexicalIndex, reciprocal_rank_fusion, tokenize, RRF_K
+
+TEXTS = [
+    "Use st.cache_data to cache the result of a function",
+    "os.access checks whether a path can be read or written",
+    "FastAPI path parameters are declared in the path",
+    "Caching in Streamlit: st.cache_resource keeps connections",
+]
+
+def test_tokenize_keeps_dotted_names():
+    assert tokenize("Use st.cache_data, 3 times!") == ["use", "st.cache_data", "st", "cache_data", "3", "times"]
+
+def test_search_ranks_by_bm25():
+    index = LexicalIndex.build(TEXTS)
+
+    scores, positions = index.search("path", k=4)
+
+    # Both matches contain "path"; the FastAPI chunk twice
+    assert positions.tolist() == [2, 1]
+    assert scores[0] > scores[1] > 0
+    # The exact name ranks first; chunk 3 only shares "st"
+    assert index.search("st.cache_data", k=4)[1].tolist() == [0, 3]
+    assert index.search("unknown words", k=4)[1].tolist() == []
+
+def test_search_respects_positions_and_k():
+    index = LexicalIndex.build(TEXTS)
+
+    assert index.search("path", k=4, positions=np.array([1, 3]))[1].tolist() == [1]
+    assert len(index.search("st", k=1)[1]) == 1
+
+def test_save_and_load(tmp_path):
+    index = LexicalIndex.build(TEXTS)
+    index.save(str(tmp_path))
+
+    loaded = LexicalIndex.load(str(tmp_path))
+
+    for query in ("path", "cache", "st.cache_resource connections"):
+        expected, found = index.search(query, k=3), loaded.search(query, k=3)
+        np.testing.assert_allclose(found[0], expected[0])
+        np.testing.assert_array_equal(found[1], expected[1])
+    assert LexicalIndex.load(str(tmp_path / "missing")) is None
+
+def test_reciprocal_rank_fusion():
+    a, b, c = (Document(id=name, page_content=name) for name in "abc")
+
+    fused = reciprocal_rank_fusion([[a, b], [b, c]])
+
+    assert [document.id for document, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / (RRF_K + 2) + 1 / (RRF_K + 1)
+    assert fused[1][1] == 1 / (RRF_K + 1)
+
+def test_fusion_matches_documents_without_ids_by_content():
+    first = Document(page_content="same", metadata={"url": "https://h/"})
+    second = Document(page_content="same", metadata={"url": "https://h/"})
+
+    fused = reciprocal_rank_fusion([[first], [second]], k=1)
+
+    assert len(fused) == 1
+    assert fused[0][1] == 1.0
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance as reference_mmr
+
+from backend.chains.mmr import diversify, maximal_marginal_relevance, query_relevance
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("lambda_mult", [0.0, 0.3, 0.5, 1.0])
+def test_matches_langchain(seed, lambda_mult):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((40, 12)).astype(np.float32)
+    query = rng.standard_normal(12).astype(np.float32)
+
+    picked = maximal_marginal_relevance(query_relevance(query, vectors), vectors, 8, lambda_mult)
+
+    assert picked == reference_mmr(query, list(vectors), lambda_mult, 8)
+
+def test_k_larger_than_candidates():
+    vectors = np.eye(3, dtype=np.float32)
+
+    assert sorted(maximal_marginal_relevance(np.ones(3), vectors, 10)) == [0, 1, 2]
+    assert maximal_marginal_relevance(np.ones(0), np.empty((0, 3)), 4) == []
+
+class VectorStore:
+    """Store answering document_vectors from a fixed id -> vector table."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def document_vectors(self, documents):
+        if any(document.id not in self.vectors for document in documents):
+            return None
+        return np.array([self.vectors[document.id] for document in documents], dtype=np.float32)
+
+def test_diversify_skips_near_copies():
+    results = [(Document(id=name, page_content=name), score) for name, score in [("a", 3.0), ("a2", 2.9), ("b", 1.0)]]
+    store = VectorStore({"a": [1, 0], "a2": [1, 0.01], "b": [0, 1]})
+
+    assert [document.id for document, _ in diversify(store, results, 2)] == ["a", "b"]
+    assert [document.id for document, _ in diversify(store, results, 2, lambda_mult=1.0)] == ["a", "a2"]
+
+def test_diversify_without_vectors_keeps_the_best():
+    results = [(Document(id=name, page_content=name), 1.0) for name in "abc"]
+
+    assert diversify(VectorStore({}), results, 2) == results[:2]
+
+def test_diversify_ranks_by_query_similarity():
+    # Fused scores rank "a" first, but "c" is the closest to the query vector
+    results = [(Document(id=name, page_content=name), score) for name, score in [("a", 3.0), ("b", 2.0), ("c", 1.0)]]
+    store = VectorStore({"a": [1, 0], "b": [0.6, 0.8], "c": [0, 1]})
+
+    picked = diversify(store, results, 2, lambda_mult=1.0, query_vector=[0.1, 1])
+
+    assert [document.id for document, _ in picked] == ["c", "b"]
+
+def test_diversify_breaks_ties_by_fused_order():
+    results = [(Document(id=name, page_content=name), score) for name, score in [("a", 3.0), ("b", 2.0), ("c", 1.0)]]
+    store = VectorStore({"a": [0, 1], "b": [0, 1], "c": [1, 0]})
+
+    picked = diversify(store, results, 1, lambda_mult=1.0, query_vector=[0, 1])
+
+    assert [document.id for document, _ in picked] == ["a"]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from conftest import RecordingEmbeddings
+from backend.chains.projection import Projection, ProjectedEmbeddings
+
+def corpus_vectors(seed: int = 0) -> np.ndarray:
+    """Unit vectors whose variance lies mostly in four directions."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((500, 4)) @ rng.standard_normal((4, 32)) + 0.01 * rng.standard_normal((500, 32))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def test_truncate_keeps_leading_dimensions():
+    vectors = corpus_vectors()
+    projection = Projection.fit(vectors, "truncate", 8)
+
+    reduced = projection.apply(vectors)
+
+    expected = vectors[:, :8] / np.linalg.norm(vectors[:, :8], axis=1, keepdims=True)
+    np.testing.assert_allclose(reduced, expected, rtol=1e-5)
+
+def test_pca_keeps_the_variance_and_neighbours():
+    vectors = corpus_vectors()
+    projection = Projection.fit(vectors, "pca", 4)
+
+    reduced = projection.apply(vectors)
+
+    assert reduced.shape == (500, 4)
+    np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1, rtol=1e-5)
+    assert projection.explained_variance > 0.99
+    full_neighbours = np.argsort(-(vectors @ vectors[0]))[:10]
+    reduced_neighbours = np.argsort(-(reduced @ reduced[0]))[:10]
+    assert len(set(full_neighbours) & set(reduced_neighbours)) >= 8
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        Projection.fit(corpus_vectors(), "pca", 32)
+    with pytest.raises(ValueError):
+        Projection("svd", 4)
+
+@pytest.mark.parametrize("method", ["truncate", "pca"])
+def test_save_and_load(tmp_path, method):
+    vectors = corpus_vectors()
+    projection = Projection.fit(vectors, method, 4)
+    projection.save(str(tmp_path))
+
+    loaded = Projection.load(str(tmp_path))
+
+    assert (loaded.method, loaded.dimensions) == (method, 4)
+    np.testing.assert_allclose(loaded.apply(vectors), projection.apply(vectors), rtol=1e-6)
+    assert Projection.load(str(tmp_path / "missing")) is None
+
+def test_projected_embeddings():
+    underlying = RecordingEmbeddings(size=32)
+    projection = Projection.fit(corpus_vectors(), "pca", 4)
+    embeddings = ProjectedEmbeddings(underlying, projection)
+
+    vectors = embeddings.embed_documents(["a", "b"])
+
+    assert np.array(vectors).shape == (2, 4)
+    np.testing.assert_allclose(embeddings.embed_query("a"), projection.apply([underlying.embed_query("a")])[0], rtol=1e-6)
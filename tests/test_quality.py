@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+
+from conftest import random_text
+from backend.chains.scripts.quality import prune_chunks
+
+def chunk(text: str, url: str = "https://docs.python.org/3/page.html") -> Document:
+    return Document(page_content=text, metadata={"url": url, "token_count": len(text.split())})
+
+def test_default_profile_drops_not_found_pages():
+    body = random_text(0, words=40)
+    chunks = [chunk(body), chunk("Page not found. " + body), chunk("Error 404: " + body)]
+
+    kept, stats = prune_chunks(chunks)
+
+    assert kept == chunks[:1]
+    assert stats["dropped"] == {"not_found": 2}
+    assert stats["tokens_dropped"] == chunks[1].metadata["token_count"] + chunks[2].metadata["token_count"]
+
+def test_default_profile_drops_short_chunks_and_excluded_urls():
+    body = random_text(1, words=40)
+    chunks = [chunk(body), chunk("too short"), chunk(body, "https://docs.python.org/3/genindex-A.html")]
+
+    kept, stats = prune_chunks(chunks)
+
+    assert kept == chunks[:1]
+    assert stats["dropped"] == {"too_short": 1, "excluded_url": 1}
+
+def test_none_profile_keeps_everything():
+    chunks = [chunk("Page not found"), chunk("404")]
+
+    kept, stats = prune_chunks(chunks, "none")
+
+    assert kept == chunks
+    assert stats["dropped"] == {}
@@ -0,0 +1,152 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import RecordingEmbeddings, random_text, write_corpus_file
+from backend.chains import registry as registry_module
+from backend.chains.embeddings import QueryEmbeddingCache
+from backend.chains.registry import IndexRegistry
+from backend.chains.scripts import build_rag
+from backend.chains.docstore import DOCSTORE_FILE
+from backend.chains.vector_index import current_version, new_version_dir, publish_version, resolve_index_dir
+
+SETTINGS = build_rag.build_settings("test-model", 300, 30)
+
+def build(corpus: str, index_root: str):
+    return build_rag.build_index(SETTINGS, corpus, index_root, workers=1)
+
+def new_registry() -> IndexRegistry:
+    registry = IndexRegistry()
+    registry._embeddings["test-model"] = RecordingEmbeddings(size=16)
+    return registry
+
+def test_warm_up_prefaults_the_loaded_version(tmp_path, embedded, monkeypatch):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    write_corpus_file(corpus, "page.txt", random_text(0))
+    build(corpus, index_root)
+    registry = new_registry()
+    registry.get_vectorstore(index_root, "test-model")
+    loaded_dir = resolve_index_dir(index_root)
+
+    # A new build moves CURRENT before the registry warms up
+    write_corpus_file(corpus, "added.txt", random_text(1))
+    build(corpus, index_root)
+    assert resolve_index_dir(index_root) != loaded_dir
+    prefaulted = []
+    monkeypatch.setattr(registry_module, "prefault_index", lambda index_dir: prefaulted.append(index_dir) or 0.0)
+
+    registry.warm_up()
+
+    assert prefaulted == [loaded_dir]
+    assert registry.is_ready()
+
+def test_vectorstore_is_loaded_once_and_shared(index_root, monkeypatch):
+    loads = []
+    original = registry_module.load_vectorstore
+
+    def counting_load(*args, **kwargs):
+        loads.append(args[0])
+        time.sleep(0.05)  # let the other threads reach the lock
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(registry_module, "load_vectorstore", counting_load)
+    registry = new_registry()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        handles = list(executor.map(lambda _: registry.get_vectorstore(index_root, "test-model"), range(4)))
+
+    assert loads == [resolve_index_dir(index_root)]
+    assert all(handle is handles[0] for handle in handles)
+    assert registry.get_vectorstore(index_root, "test-model") is handles[0]
+
+def test_embeddings_are_shared_behind_the_query_cache(monkeypatch):
+    created = []
+    monkeypatch.setattr(registry_module, "create_embeddings",
+                        lambda model: created.append(model) or RecordingEmbeddings(size=16))
+    registry = IndexRegistry()
+
+    embeddings = registry.get_embeddings("model-a")
+
+    assert isinstance(embeddings, QueryEmbeddingCache)
+    assert registry.get_embeddings("model-a") is embeddings
+    assert registry.get_embeddings("model-b") is not embeddings
+    assert created == ["model-a", "model-b"]
+
+def test_missing_index_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        new_registry().get_vectorstore(str(tmp_path / "missing"), "test-model")
+
+def test_reload_swaps_the_new_version_under_the_handle(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    write_corpus_file(corpus, "page.txt", random_text(0))
+    build(corpus, index_root)
+    registry = new_registry()
+    handle = registry.get_vectorstore(index_root, "test-model")
+    old_store = handle.current
+    assert registry.reload() == {}
+
+    write_corpus_file(corpus, "added.txt", random_text(1))
+    build(corpus, index_root)
+    new_version = current_version(index_root)
+    swapped = registry.reload()
+
+    assert swapped == {f"{os.path.abspath(index_root)}|test-model": new_version}
+    assert handle.version == new_version and handle.current is not old_store
+    assert handle.index.ntotal > old_store.index.ntotal
+    # A query that started on the old version can still finish on it
+    assert old_store.similarity_search(embedded[0], k=1)
+    assert registry.loaded_indexes()[f"{os.path.abspath(index_root)}|test-model"]["warm"]
+
+def test_broken_version_is_not_swapped_in(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    write_corpus_file(corpus, "page.txt", random_text(0))
+    build(corpus, index_root)
+    registry = new_registry()
+    handle = registry.get_vectorstore(index_root, "test-model")
+    served = handle.version
+
+    broken = new_version_dir(index_root)
+    with open(os.path.join(broken, "index.faiss"), "wb") as f:
+        f.write(b"not an index")
+    open(os.path.join(broken, DOCSTORE_FILE), "wb").close()
+    publish_version(index_root, broken)
+
+    with pytest.raises(RuntimeError):
+        registry.reload()
+    assert handle.version == served
+    assert handle.similarity_search(embedded[0], k=1)
+    # The watcher does not retry the rejected version
+    assert registry._rejected[(os.path.abspath(index_root), "test-model")] == os.path.basename(broken)
+
+def test_ready_after_warm_up(index_root):
+    registry = new_registry()
+    registry.get_vectorstore(index_root, "test-model")
+    assert not registry.is_ready()
+
+    results = registry.warm_up()
+
+    key = f"{os.path.abspath(index_root)}|test-model"
+    assert registry.is_ready()
+    assert [canary["query"] for canary in results[key]] == registry_module.CANARY_QUERIES
+    assert all(canary["ok"] and canary["results"] == 4 for canary in results[key])
+    index = registry.loaded_indexes()[key]
+    assert index["warm"] and index["prefaulted_mb"] > 0
+    assert "canaries" not in index
+
+def test_not_ready_when_a_canary_finds_nothing(index_root, monkeypatch):
+    registry = new_registry()
+    handle = registry.get_vectorstore(index_root, "test-model")
+    monkeypatch.setattr(handle.current, "similarity_search_with_score_by_vector", lambda *args, **kwargs: [])
+
+    with pytest.raises(RuntimeError, match="Canary queries returned no results"):
+        registry.warm_up()
+    assert registry.warm_status["state"] == "failed"
+    assert not registry.is_ready()
+
+def test_not_ready_without_indexes():
+    registry = new_registry()
+    registry.warm_up()
+
+    assert not registry.is_ready()
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from conftest import DOMAIN_PAGES, RecordingEmbeddings, WhitespaceEncoding
+from backend.chains import embeddings as embeddings_module
+from backend.chains.filters import chunk_domain
+from backend.chains.registry import IndexRegistry
+from backend.chains.scripts import build_rag
+from backend.chains.sharding import ShardedVectorStore, route_query
+from backend.chains.vector_index import list_shards, load_vectorstore, resolve_index_dir, shard_root
+
+@pytest.fixture(scope="module")
+def sharded_root(index_root, tmp_path_factory) -> str:
+    """The corpus of the shared test index, built as one shard per domain."""
+    corpus = os.path.join(os.path.dirname(index_root), "corpus")
+    root = str(tmp_path_factory.mktemp("sharded"))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(embeddings_module, "get_encoding", lambda model: WhitespaceEncoding())
+        patch.setattr(build_rag, "get_encoding", lambda model: WhitespaceEncoding())
+        patch.setattr(build_rag, "get_embeddings", lambda: RecordingEmbeddings(size=16))
+        build_rag.build_sharded(build_rag.build_settings("test-model", 300, 30), corpus, root, workers=3)
+    return root
+
+@pytest.fixture
+def sharded(sharded_root) -> ShardedVectorStore:
+    registry = IndexRegistry()
+    registry._embeddings["test-model"] = RecordingEmbeddings(size=16)
+    return registry.get_vectorstore(sharded_root, "test-model")
+
+def test_build_writes_one_shard_per_domain(sharded_root):
+    assert list_shards(sharded_root) == sorted(DOMAIN_PAGES)
+    for domain in DOMAIN_PAGES:
+        shard = load_vectorstore(resolve_index_dir(shard_root(sharded_root, domain)), RecordingEmbeddings(size=16))
+        domains = {chunk_domain(document.metadata) for document in shard.docstore.mget(list(shard.index_to_docstore_id.values()))}
+        assert domains == {domain}
+
+def test_fan_out_matches_the_unsharded_index(sharded, vectorstore):
+    assert isinstance(sharded, ShardedVectorStore)
+    query = RecordingEmbeddings(size=16).embed_query("how do list comprehensions work")
+
+    found = sharded.similarity_search_with_score_by_vector(query, k=6)
+    expected = vectorstore.similarity_search_with_score_by_vector(query, k=6)
+
+    assert [(document.page_content, round(score, 4)) for document, score in found] == \
+           [(document.page_content, round(score, 4)) for document, score in expected]
+
+def test_queries_naming_a_framework_search_its_shard_only(sharded):
+    shards = list(sharded.shards)
+
+    assert route_query("Como usar st.cache_data no Streamlit?", shards) == ["docs.streamlit.io"]
+    assert route_query("Rotas com FastAPI e Pydantic", shards) == ["fastapi.tiangolo.com"]
+    assert route_query("How do list comprehensions work?", shards) == shards
+    results = sharded.similarity_search("Como usar st.cache_data no Streamlit?", k=5)
+    assert {chunk_domain(document.metadata) for document in results} == {"docs.streamlit.io"}
+
+def test_domain_filter_skips_other_shards(sharded):
+    results = sharded.similarity_search("list comprehensions", k=5, filter={"domain": "fastapi.tiangolo.com"})
+
+    assert len(results) == 5
+    assert {chunk_domain(document.metadata) for document in results} == {"fastapi.tiangolo.com"}
+
+def test_batch_search_over_shards(sharded):
+    queries = ["Como usar st.cache_data no Streamlit?", "Rotas com Streamlit"]
+
+    results = sharded.batch_search(queries, k=3, mode="dense")
+
+    assert [len(documents) for documents in results] == [3, 3]
+    assert {chunk_domain(document.metadata) for documents in results for document in documents} == {"docs.streamlit.io"}
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from conftest import RecordingEmbeddings, random_text, write_corpus_file
+from backend.chains import vector_index
+from backend.chains.docstore import DOCSTORE_FILE
+from backend.chains.scripts import build_rag
+from backend.chains.vector_index import (
+    VERSIONS_DIR, current_version, load_vectorstore, new_version_dir, prune_versions, publish_version, resolve_index_dir
+)
+
+SETTINGS = build_rag.build_settings("test-model", 300, 30)
+
+def build(corpus: str, index_root: str, settings=SETTINGS):
+    return build_rag.build_index(settings, corpus, index_root, workers=1)
+
+def test_pickled_docstore_is_refused(tmp_path, monkeypatch):
+    FAISS.from_texts(["a", "b"], RecordingEmbeddings(size=8)).save_local(str(tmp_path))
+
+    with pytest.raises(ValueError, match="Rebuild the index"):
+        load_vectorstore(str(tmp_path), RecordingEmbeddings(size=8))
+
+    monkeypatch.setattr(vector_index, "ALLOW_PICKLED_DOCSTORE", True)
+    assert load_vectorstore(str(tmp_path), RecordingEmbeddings(size=8)).index.ntotal == 2
+
+def test_index_without_sqlite_docstore_is_rebuilt(tmp_path, embedded):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    write_corpus_file(corpus, "page.txt", random_text(0))
+    build(corpus, index_root)
+    os.remove(os.path.join(resolve_index_dir(index_root), DOCSTORE_FILE))
+
+    report = build(corpus, index_root)
+
+    assert report.mode == "full"
+    assert os.path.exists(os.path.join(resolve_index_dir(index_root), DOCSTORE_FILE))
+
+def mapped_files() -> str:
+    with open("/proc/self/maps") as f:
+        return f.read()
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc/self/maps")
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+def test_mmap_loading_maps_the_index_file(tmp_path, embedded, index_type):
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    for i in range(4):
+        write_corpus_file(corpus, f"page{i}.txt", random_text(i))
+    build(corpus, index_root, build_rag.build_settings("test-model", 300, 30, index_type=index_type))
+    index_dir = resolve_index_dir(index_root)
+    index_path = os.path.join(index_dir, "index.faiss")
+
+    in_memory = load_vectorstore(index_dir, RecordingEmbeddings(size=16), mmap=False)
+    assert index_path not in mapped_files()
+    mapped = load_vectorstore(index_dir, RecordingEmbeddings(size=16), mmap=True)
+
+    assert index_path in mapped_files()
+    for query in embedded[:5]:
+        expected = in_memory.similarity_search_with_score(query, k=3)
+        found = mapped.similarity_search_with_score(query, k=3)
+        assert [(document.id, score) for document, score in found] == [(document.id, score) for document, score in expected]
+
+def test_builds_publish_versions_and_prune_old_ones(tmp_path, embedded, monkeypatch):
+    monkeypatch.setattr(build_rag, "INDEX_KEEP_VERSIONS", 2)
+    corpus, index_root = str(tmp_path / "corpus"), str(tmp_path / "index")
+    published = []
+    for i in range(3):
+        write_corpus_file(corpus, f"page{i}.txt", random_text(i))
+        build(corpus, index_root)
+        published.append(current_version(index_root))
+
+    assert len(set(published)) == 3
+    assert sorted(os.listdir(os.path.join(index_root, VERSIONS_DIR))) == sorted(published[1:])
+    assert resolve_index_dir(index_root) == os.path.join(index_root, VERSIONS_DIR, published[-1])
+
+def test_prune_keeps_the_current_version(tmp_path):
+    index_root = str(tmp_path)
+    versions = [os.path.basename(new_version_dir(index_root)) for _ in range(3)]
+    publish_version(index_root, os.path.join(index_root, VERSIONS_DIR, versions[0]))
+
+    deleted = prune_versions(index_root, keep=1)
+
+    assert deleted == [versions[1]]
+    assert sorted(os.listdir(os.path.join(index_root, VERSIONS_DIR))) == [versions[0], versions[2]]
+    assert current_version(index_root) == versions[0]
+
+def test_unversioned_root_is_served_as_is(tmp_path):
+    assert current_version(str(tmp_path)) is None
+    assert resolve_index_dir(str(tmp_path)) == str(tmp_path)